@@ -0,0 +1,63 @@
+"""Seed example diagrams
+
+Revision ID: 5a1e3c7b9d20
+Revises: d104f4ff3866
+Create Date: 2026-10-19 09:12:05.118204
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+from config import get_example_diagrams
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a1e3c7b9d20'
+down_revision: Union[str, None] = 'd104f4ff3866'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EXAMPLE_NAMESPACE = uuid.UUID('7f3c1c4e-5b7d-4a53-9a3b-6f1a2c0d9e11')
+
+bpmn_diagrams = sa.table(
+    'bpmn_diagrams',
+    sa.column('id', sa.Uuid()),
+    sa.column('name', sa.Text()),
+    sa.column('bpmn_xml', sa.Text()),
+    sa.column('version', sa.Integer()),
+    sa.column('updated_at', sa.DateTime(timezone=True)),
+)
+
+
+def upgrade() -> None:
+    # Seeding used to run on every boot; this revision now runs it exactly once.
+    # Databases that were already seeded (or hold real data) are left alone.
+    bind = op.get_bind()
+    if bind.execute(sa.select(bpmn_diagrams.c.id).limit(1)).first() is not None:
+        return
+    now = datetime.now(timezone.utc)
+    op.bulk_insert(
+        bpmn_diagrams,
+        [
+            {
+                'id': uuid.uuid5(EXAMPLE_NAMESPACE, example['name']),
+                'name': example['name'],
+                'bpmn_xml': example['xml'],
+                'version': 1,
+                'updated_at': now,
+            }
+            for example in get_example_diagrams()
+        ],
+    )
+
+
+def downgrade() -> None:
+    bpmn_diagrams_ids = [
+        uuid.uuid5(EXAMPLE_NAMESPACE, example['name'])
+        for example in get_example_diagrams()
+    ]
+    op.execute(bpmn_diagrams.delete().where(bpmn_diagrams.c.id.in_(bpmn_diagrams_ids)))
@@ -0,0 +1,37 @@
+"""Add collaboration event log
+
+Revision ID: 8c2f4e6a1b37
+Revises: 5a1e3c7b9d20
+Create Date: 2026-10-19 14:03:27.401562
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2f4e6a1b37'
+down_revision: Union[str, None] = '5a1e3c7b9d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('collaboration_events',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('diagram_id', sa.Uuid(), nullable=False),
+    sa.Column('occurred_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('type', sa.Text(), nullable=False),
+    sa.Column('user_id', sa.Text(), nullable=True),
+    sa.Column('user_name', sa.Text(), nullable=True),
+    sa.Column('data', sa.JSON(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_collaboration_events_diagram_time', 'collaboration_events', ['diagram_id', 'occurred_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_collaboration_events_diagram_time', table_name='collaboration_events')
+    op.drop_table('collaboration_events')
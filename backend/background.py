@@ -0,0 +1,36 @@
+"""Background work per diagram, where only the newest request matters."""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class LatestOnlyWorker:
+    """Runs ``job(key, *args)`` in the background, one run per key at a time.
+
+    Requests for a key that arrive while its job is running replace each
+    other, so once it finishes only the newest one runs next. Failures are
+    logged and do not stop later runs.
+    """
+
+    def __init__(self, job: Callable[..., Awaitable[Any]], name: str):
+        self._job = job
+        self._name = name
+        self._pending: Dict[str, Tuple[Any, ...]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def schedule(self, key: str, *args: Any) -> None:
+        self._pending[key] = args
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.get_running_loop().create_task(self._drain(key))
+
+    async def _drain(self, key: str) -> None:
+        try:
+            while key in self._pending:
+                args = self._pending.pop(key)
+                try:
+                    await self._job(key, *args)
+                except Exception:
+                    logging.exception(f"{self._name} failed for {key}")
+        finally:
+            del self._tasks[key]
@@ -0,0 +1,118 @@
+"""Measure backend import time and time-to-first-request.
+
+Run from the backend directory:
+
+    python benchmarks/cold_start.py --runs 5
+
+DATABASE_URL is taken from the environment; a temporary SQLite file is used
+when it is not set.
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault(
+        "DATABASE_URL", f"sqlite:///{Path(tempfile.gettempdir()) / 'bpmn_cold_start.db'}"
+    )
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(runs: int) -> list[float]:
+    """Wall time of ``import main`` in a fresh interpreter, in seconds."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", "import main"], cwd=BACKEND_DIR, env=_env(), check=True
+        )
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _wait_for(url: str, deadline: float) -> float | None:
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.005)
+    return None
+
+
+def measure_first_request(
+    runs: int, timeout: float, probe: str
+) -> list[tuple[float, float | None]]:
+    """Seconds from process spawn until ``probe`` and /healthz/ready answer 200."""
+    timings = []
+    for _ in range(runs):
+        port = _free_port()
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--port", str(port), "--log-level", "warning",
+            ],
+            cwd=BACKEND_DIR,
+            env=_env(),
+        )
+        try:
+            deadline = started + timeout
+            live = _wait_for(f"http://127.0.0.1:{port}{probe}", deadline)
+            ready = _wait_for(f"http://127.0.0.1:{port}/healthz/ready", deadline)
+        finally:
+            server.terminate()
+            server.wait()
+        if live is None:
+            raise RuntimeError(f"Server did not answer {probe} before the timeout")
+        timings.append((live - started, ready - started if ready else None))
+    return timings
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--probe", default="/healthz", help="Path used for the first request")
+    args = parser.parse_args()
+
+    imports = measure_import(args.runs)
+    print(f"import main:          median {_ms(statistics.median(imports))}, min {_ms(min(imports))}")
+
+    requests = measure_first_request(args.runs, args.timeout, args.probe)
+    live = [live for live, _ in requests]
+    print(f"first request:        median {_ms(statistics.median(live))}, min {_ms(min(live))}")
+    ready = [ready for _, ready in requests if ready is not None]
+    if ready:
+        print(f"ready (pool warmed):  median {_ms(statistics.median(ready))}, min {_ms(min(ready))}")
+    else:
+        print("ready (pool warmed):  not reached before timeout")
+
+
+if __name__ == "__main__":
+    main()
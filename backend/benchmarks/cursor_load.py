@@ -0,0 +1,134 @@
+"""Load test the cursor channel with many users moving continuously.
+
+Start a server, then run from the backend directory:
+
+    python benchmarks/cursor_load.py --url http://127.0.0.1:8000 --users 100
+
+Every simulated user sends ``cursor`` messages at ``--rate`` per second into
+one diagram for ``--duration`` seconds. The report compares how many moves
+were sent with how many batched ``cursors`` frames each client received.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import urllib.request
+
+import websockets
+
+
+def _create_diagram(url: str) -> str:
+    request = urllib.request.Request(
+        f"{url}/api/diagrams",
+        data=json.dumps({"name": "cursor load test"}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)["id"]
+
+
+class UserStats:
+    def __init__(self):
+        self.sent = 0
+        self.frames = 0
+        self.frame_bytes = 0
+        self.entries = 0
+        self.gaps: list[float] = []
+
+
+async def _user(
+    ws_url: str, index: int, rate: float, until: float, stats: UserStats
+) -> None:
+    async with websockets.connect(f"{ws_url}?user_name=load{index}") as ws:
+        await ws.recv()  # diagram_state
+        rng = random.Random(index)
+        x, y = rng.uniform(0, 1500), rng.uniform(0, 1000)
+
+        async def send_moves():
+            while time.perf_counter() < until:
+                nonlocal x, y
+                x += rng.uniform(-8, 8)
+                y += rng.uniform(-8, 8)
+                await ws.send(
+                    json.dumps(
+                        {
+                            "type": "cursor",
+                            "data": {
+                                "x": x,
+                                "y": y,
+                                "viewport": {"x": 0, "y": 0, "width": 1280, "height": 720},
+                            },
+                        }
+                    )
+                )
+                stats.sent += 1
+                await asyncio.sleep(1 / rate)
+
+        sender = asyncio.create_task(send_moves())
+        last_frame = None
+        try:
+            while True:
+                remaining = until + 0.5 - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                message = json.loads(raw)
+                if message.get("type") != "cursors":
+                    continue
+                now = time.perf_counter()
+                if last_frame is not None:
+                    stats.gaps.append(now - last_frame)
+                last_frame = now
+                stats.frames += 1
+                stats.frame_bytes += len(raw)
+                stats.entries += len(message["data"]["cursors"])
+        finally:
+            sender.cancel()
+
+
+async def run(url: str, users: int, rate: float, duration: float) -> None:
+    diagram_id = _create_diagram(url)
+    ws_url = f"{url.replace('http', 'ws', 1)}/ws/{diagram_id}"
+    until = time.perf_counter() + duration
+    stats = [UserStats() for _ in range(users)]
+    await asyncio.gather(
+        *(_user(ws_url, index, rate, until, stats[index]) for index in range(users))
+    )
+
+    sent = sum(s.sent for s in stats)
+    frames = [s.frames for s in stats]
+    gaps = sorted(gap for s in stats for gap in s.gaps)
+    frame_bytes = sum(s.frame_bytes for s in stats)
+    print(f"users:                {users}")
+    print(f"moves sent:           {sent} ({sent / duration:.0f}/s)")
+    print(f"frames per client:    median {statistics.median(frames):.0f} ({statistics.median(frames) / duration:.1f}/s)")
+    print(f"naive fan-out:        {sent * (users - 1)} messages")
+    print(f"batched fan-out:      {sum(frames)} frames")
+    if sum(frames):
+        print(f"mean frame size:      {frame_bytes / sum(frames):.0f} bytes")
+        print(f"cursors per frame:    {sum(s.entries for s in stats) / sum(frames):.1f}")
+    if gaps:
+        p50 = gaps[len(gaps) // 2]
+        p99 = gaps[min(len(gaps) - 1, int(len(gaps) * 0.99))]
+        print(f"frame interval:       p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=30.0, help="Moves per user per second")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.users, args.rate, args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compare the latency of the storage backends on the operations the app uses.
+
+Run from the backend directory:
+
+    python benchmarks/storage_latency.py --backends memory,sqlite,postgres
+
+``postgres`` uses ``DATABASE_URL`` (any SQLAlchemy URL works) and needs the
+schema in place (``alembic upgrade head``). Each backend gets its own scratch
+diagrams; the report lists p50/p99 per operation and the backend with the
+lowest median save latency, which is what collaborative editing waits on.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import load_example_xml  # noqa: E402
+from storage import (  # noqa: E402
+    MemoryStorage,
+    SQLAlchemyStorage,
+    SQLiteStorage,
+    StorageBackend,
+)
+
+XML = load_example_xml("multi_step_request_workflow.bpmn")
+
+
+def _timed(samples: List[float], operation: Callable[[], object]) -> None:
+    start = time.perf_counter()
+    operation()
+    samples.append(time.perf_counter() - start)
+
+
+def _percentiles(samples: List[float]) -> Tuple[float, float]:
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return statistics.median(ordered), p99
+
+
+def measure(
+    storage: StorageBackend, iterations: int = 200
+) -> Dict[str, Tuple[float, float]]:
+    """Time each operation ``iterations`` times; returns (p50, p99) in seconds."""
+    samples: Dict[str, List[float]] = {
+        "create": [],
+        "get": [],
+        "get_version": [],
+        "update": [],
+        "page": [],
+    }
+    ids = []
+    for i in range(iterations):
+        _timed(samples["create"], lambda: ids.append(storage.create(f"d{i}", XML).id))
+    for diagram_id in ids:
+        _timed(samples["get"], lambda: storage.get(diagram_id))
+        _timed(samples["get_version"], lambda: storage.get_version(diagram_id))
+        _timed(samples["update"], lambda: storage.update(diagram_id, lambda d: d.xml))
+    for _ in range(max(iterations // 10, 1)):
+        _timed(samples["page"], lambda: storage.page(None, 100))
+    return {op: _percentiles(values) for op, values in samples.items()}
+
+
+def _backend(name: str, scratch: str) -> StorageBackend:
+    if name == "memory":
+        return MemoryStorage()
+    if name == "sqlite":
+        return SQLiteStorage(os.path.join(scratch, f"{uuid.uuid4()}.sqlite3"))
+    if name == "postgres":
+        return SQLAlchemyStorage()
+    raise SystemExit(f"Unknown backend: {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="memory,sqlite")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for name in args.backends.split(","):
+            storage = _backend(name.strip(), scratch)
+            try:
+                results[name] = measure(storage, args.iterations)
+            finally:
+                storage.close()
+
+    for name, ops in results.items():
+        print(name)
+        for op, (p50, p99) in ops.items():
+            print(f"  {op:<12} p50 {p50 * 1e6:8.0f} us   p99 {p99 * 1e6:8.0f} us")
+    fastest = min(results, key=lambda name: results[name]["update"][0])
+    print(f"lowest save latency: {fastest}")
+
+
+if __name__ == "__main__":
+    main()
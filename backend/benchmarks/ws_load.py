@@ -0,0 +1,470 @@
+"""End-to-end WebSocket load test: rooms x editors x a mix of messages.
+
+Run from the backend directory:
+
+    python benchmarks/ws_load.py --rooms 10 --users 5 --duration 20
+
+Without ``--url`` a server is started for the run on the embedded SQLite
+storage backend in a temporary directory, so no database is needed, and its
+CPU time and resident memory are sampled from ``/proc`` (Linux only).
+
+Every simulated editor saves a diagram of ``--tasks`` tasks (about 400 bytes
+of XML each), locks and unlocks elements, and leaves and rejoins its room,
+each at its own average rate per second. Fan-out latency is the time from a
+send until another editor in the room receives the resulting broadcast;
+``ack`` is the sender's own save round trip and ``join`` the time from
+connecting until ``diagram_state`` arrives.
+
+``--save-baseline`` stores the results under ``--name`` in
+``--baseline-file``; ``--check`` compares a run against the stored baseline
+and exits with status 1 if a metric got worse by more than ``--tolerance``
+(default 50%). Tail latencies of short runs are noisy; record baselines with
+the same scenario and a ``--duration`` long enough for a few hundred samples.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+import websockets
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE_FILE = Path(__file__).resolve().parent / "ws_load_baselines.json"
+
+# Metrics compared against a baseline, and whether higher values are better
+CHECKS = {
+    "delivered_per_s": True,
+    "update_p50_ms": False,
+    "update_p99_ms": False,
+    "lock_p99_ms": False,
+    "ack_p99_ms": False,
+    "join_p99_ms": False,
+    "server_cpu_ms_per_message": False,
+    "server_rss_peak_mb": False,
+}
+
+_MARKER = re.compile(r'<bpmn2:process id="Process_1" name="([^"]*)"')
+
+
+def synthetic_bpmn(tasks: int, marker: str = "") -> str:
+    """A linear process of ``tasks`` tasks with DI, named ``marker``."""
+    task_ids = [f"Task_{i}" for i in range(1, tasks + 1)]
+    nodes = ["StartEvent_1", *task_ids, "EndEvent_1"]
+    semantic, shapes = [], []
+    for index, node in enumerate(nodes):
+        x = 180 + index * 150
+        if node.startswith("Task_"):
+            semantic.append(f'    <bpmn2:task id="{node}" name="Step {node[5:]}"/>')
+            bounds = f'x="{x}" y="80" width="100" height="80"'
+        else:
+            kind = "startEvent" if node.startswith("Start") else "endEvent"
+            semantic.append(f'    <bpmn2:{kind} id="{node}"/>')
+            bounds = f'x="{x + 32}" y="102" width="36" height="36"'
+        shapes.append(
+            f'      <bpmndi:BPMNShape id="{node}_di" bpmnElement="{node}">\n'
+            f"        <dc:Bounds {bounds}/>\n"
+            f"      </bpmndi:BPMNShape>"
+        )
+    for index, (source, target) in enumerate(zip(nodes, nodes[1:]), start=1):
+        semantic.append(
+            f'    <bpmn2:sequenceFlow id="Flow_{index}" '
+            f'sourceRef="{source}" targetRef="{target}"/>'
+        )
+        x = 180 + index * 150
+        shapes.append(
+            f'      <bpmndi:BPMNEdge id="Flow_{index}_di" bpmnElement="Flow_{index}">\n'
+            f'        <di:waypoint x="{x - 30}" y="120"/>\n'
+            f'        <di:waypoint x="{x}" y="120"/>\n'
+            f"      </bpmndi:BPMNEdge>"
+        )
+    body = "\n".join(semantic)
+    di = "\n".join(shapes)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<bpmn2:definitions xmlns:bpmn2="http://www.omg.org/spec/BPMN/20100524/MODEL" '
+        'xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" '
+        'xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" '
+        'xmlns:di="http://www.omg.org/spec/DD/20100524/DI" '
+        'id="load-test" targetNamespace="http://bpmn.io/schema/bpmn">\n'
+        f'  <bpmn2:process id="Process_1" name="{marker}" isExecutable="false">\n'
+        f"{body}\n"
+        "  </bpmn2:process>\n"
+        '  <bpmndi:BPMNDiagram id="BPMNDiagram_1">\n'
+        '    <bpmndi:BPMNPlane id="BPMNPlane_1" bpmnElement="Process_1">\n'
+        f"{di}\n"
+        "    </bpmndi:BPMNPlane>\n"
+        "  </bpmndi:BPMNDiagram>\n"
+        "</bpmn2:definitions>"
+    )
+
+
+@dataclass
+class Scenario:
+    rooms: int = 4
+    users: int = 5
+    duration: float = 10.0
+    tasks: int = 20
+    update_rate: float = 0.5
+    lock_rate: float = 2.0
+    churn_rate: float = 0.05
+
+
+@dataclass
+class Recorder:
+    """Send times by key and the latencies measured against them."""
+
+    sent: Dict[Tuple, float] = field(default_factory=dict)
+    latencies: Dict[str, List[float]] = field(
+        default_factory=lambda: {"update": [], "lock": [], "ack": [], "join": []}
+    )
+    messages_sent: int = 0
+    messages_received: int = 0
+    bytes_received: int = 0
+    errors: int = 0
+
+    def observe(self, kind: str, key: Tuple) -> None:
+        started = self.sent.get(key)
+        if started is not None:
+            self.latencies[kind].append(time.perf_counter() - started)
+
+
+def percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class _Editor:
+    """One simulated user: sends the message mix and records what arrives."""
+
+    def __init__(
+        self,
+        ws_url: str,
+        room: int,
+        index: int,
+        scenario: Scenario,
+        recorder: Recorder,
+        until: float,
+    ):
+        self.ws_url = ws_url
+        self.room = room
+        self.name = f"load-{room}-{index}"
+        self.scenario = scenario
+        self.recorder = recorder
+        self.until = until
+        self.rng = random.Random(f"{room}-{index}")
+        self.version: Optional[int] = None
+        self.seq = 0
+        self.unacknowledged: Deque[str] = deque()
+
+    async def run(self) -> None:
+        while time.perf_counter() < self.until:
+            try:
+                await self._session()
+            except (OSError, websockets.exceptions.WebSocketException):
+                self.recorder.errors += 1
+                await asyncio.sleep(0.1)
+
+    async def _session(self) -> None:
+        join_key = ("join", self.name, self.seq)
+        self.recorder.sent[join_key] = time.perf_counter()
+        async with websockets.connect(
+            f"{self.ws_url}?user_name={self.name}", max_size=None
+        ) as ws:
+            state = json.loads(await ws.recv())
+            self.recorder.observe("join", join_key)
+            self.version = state["data"]["version"]
+            self.unacknowledged.clear()
+            receiver = asyncio.create_task(self._receive(ws))
+            try:
+                await self._send_mix(ws)
+            finally:
+                receiver.cancel()
+
+    async def _send_mix(self, ws) -> None:
+        s = self.scenario
+        rates = {"update": s.update_rate, "lock": s.lock_rate, "churn": s.churn_rate}
+        total = sum(rates.values())
+        while True:
+            await asyncio.sleep(self.rng.expovariate(total) if total else 1)
+            if time.perf_counter() >= self.until:
+                return
+            action = self.rng.choices(list(rates), weights=list(rates.values()))[0]
+            if action == "churn":
+                return  # leave; run() joins again
+            self.seq += 1
+            if action == "update":
+                marker = f"{self.name}:{self.seq}"
+                self.recorder.sent[("update", marker)] = time.perf_counter()
+                self.unacknowledged.append(marker)
+                message = {
+                    "type": "diagram_update",
+                    "data": {
+                        "xml": synthetic_bpmn(s.tasks, marker),
+                        "base_version": self.version,
+                    },
+                }
+            else:
+                element_id = f"Task_{self.rng.randint(1, s.tasks)}"
+                key = ("lock", self.name, element_id)
+                self.recorder.sent[key] = time.perf_counter()
+                message = {"type": "element_lock", "data": {"element_id": element_id}}
+            await ws.send(json.dumps(message))
+            self.recorder.messages_sent += 1
+
+    async def _receive(self, ws) -> None:
+        async for raw in ws:
+            self.recorder.messages_received += 1
+            self.recorder.bytes_received += len(raw)
+            message = json.loads(raw)
+            kind, data = message.get("type"), message.get("data") or {}
+            if kind == "diagram_update":
+                self.version = data["version"]
+                match = _MARKER.search(data["xml"])
+                marker = match.group(1) if match else None
+                if marker in self.unacknowledged:
+                    # A save merged with edits it lacked comes back instead of an ack
+                    self.unacknowledged.remove(marker)
+                    self.recorder.observe("ack", ("update", marker))
+                elif marker:
+                    self.recorder.observe("update", ("update", marker))
+            elif kind == "diagram_ack" and self.unacknowledged:
+                self.version = data["version"]
+                self.recorder.observe("ack", ("update", self.unacknowledged.popleft()))
+            elif kind == "element_locked":
+                key = ("lock", data.get("user_name"), data.get("element_id"))
+                self.recorder.observe("lock", key)
+
+
+class _ServerProbe:
+    """Samples CPU time and resident memory of a server process from /proc."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.rss_peak = 0
+        self.cpu_start = self._cpu_seconds()
+        self.cpu_end = self.cpu_start
+
+    def _cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat") as stat:
+                fields = stat.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def sample(self) -> None:
+        try:
+            with open(f"/proc/{self.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        self.rss_peak = max(self.rss_peak, int(line.split()[1]) * 1024)
+        except OSError:
+            return
+        self.cpu_end = self._cpu_seconds()
+
+    async def watch(self, until: float) -> None:
+        while time.perf_counter() < until:
+            self.sample()
+            await asyncio.sleep(0.25)
+        self.sample()
+
+
+def _create_diagram(url: str, xml: str) -> str:
+    request = urllib.request.Request(
+        f"{url}/api/diagrams",
+        data=json.dumps({"name": "ws load test", "initial_xml": xml}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)["id"]
+
+
+async def run(url: str, scenario: Scenario, server_pid: Optional[int] = None) -> dict:
+    """Drive the scenario against ``url`` and return the measured results."""
+    xml = synthetic_bpmn(scenario.tasks)
+    ws_base = url.replace("http", "ws", 1)
+    room_ids = [_create_diagram(url, xml) for _ in range(scenario.rooms)]
+    recorder = Recorder()
+    started = time.perf_counter()
+    until = started + scenario.duration
+    probe = _ServerProbe(server_pid) if server_pid else None
+
+    editors = [
+        _Editor(f"{ws_base}/ws/{room_id}", room, index, scenario, recorder, until)
+        for room, room_id in enumerate(room_ids)
+        for index in range(scenario.users)
+    ]
+    tasks = [editor.run() for editor in editors]
+    if probe:
+        tasks.append(probe.watch(until + 0.5))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    results = {
+        "scenario": asdict(scenario),
+        "xml_bytes": len(xml.encode()),
+        "connections": len(editors),
+        "sent_per_s": round(recorder.messages_sent / elapsed, 1),
+        "delivered_per_s": round(recorder.messages_received / elapsed, 1),
+        "delivered_mb_per_s": round(recorder.bytes_received / elapsed / 1e6, 2),
+        "errors": recorder.errors,
+    }
+    for kind, samples in recorder.latencies.items():
+        results[f"{kind}_samples"] = len(samples)
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            value = percentile(samples, fraction)
+            results[f"{kind}_{name}_ms"] = round(value * 1000, 2) if value else None
+    if probe and probe.cpu_start is not None and probe.cpu_end is not None:
+        cpu_ms = (probe.cpu_end - probe.cpu_start) * 1000
+        handled = max(recorder.messages_sent + recorder.messages_received, 1)
+        results["server_cpu_percent"] = round(cpu_ms / 10 / elapsed, 1)
+        results["server_cpu_ms_per_message"] = round(cpu_ms / handled, 3)
+        results["server_rss_peak_mb"] = round(probe.rss_peak / 1e6, 1)
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/healthz/ready", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("Server did not become ready before the timeout")
+
+
+@contextmanager
+def local_server(
+    timeout: float = 30.0, env: Optional[Dict[str, str]] = None
+) -> Iterator[Tuple[str, int]]:
+    """A server on a scratch SQLite database; yields its URL and PID.
+
+    ``env`` overrides the server's environment.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        port = _free_port()
+        env = {
+            **os.environ,
+            "STORAGE_BACKEND": "sqlite",
+            "SQLITE_PATH": os.path.join(scratch, "load.sqlite3"),
+            "EVENT_LOG_SPILL_DIR": os.path.join(scratch, "event_spill"),
+            "DRAIN_HANDOFF_DIR": os.path.join(scratch, "handoff"),
+            "WS_CAPTURE_ROOMS": "",
+            **(env or {}),
+        }
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--port", str(port), "--log-level", "warning",
+            ],
+            cwd=BACKEND_DIR,
+            env=env,
+        )
+        try:
+            url = f"http://127.0.0.1:{port}"
+            _wait_ready(url, timeout)
+            yield url, server.pid
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+
+def run_local(scenario: Scenario, timeout: float = 30.0) -> dict:
+    """Start a server on a scratch SQLite database and run the scenario."""
+    with local_server(timeout) as (url, pid):
+        return asyncio.run(run(url, scenario, pid))
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Metrics that got worse than ``baseline`` by more than ``tolerance``."""
+    regressions = []
+    for metric, higher_is_better in CHECKS.items():
+        current, expected = results.get(metric), baseline.get(metric)
+        if current is None or not expected:
+            continue
+        change = (current - expected) / expected
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(
+                f"{metric}: {current} vs baseline {expected} ({change:+.0%})"
+            )
+    return regressions
+
+
+def _load_baselines(path: Path) -> dict:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Test a running server instead of starting one")
+    defaults = Scenario()
+    for name, value in asdict(defaults).items():
+        flag = f"--{name.replace('_', '-')}"
+        parser.add_argument(flag, type=type(value), default=value)
+    parser.add_argument("--name", default="default", help="Baseline name")
+    parser.add_argument("--baseline-file", type=Path, default=DEFAULT_BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    scenario = Scenario(**{name: getattr(args, name) for name in asdict(defaults)})
+    if args.url:
+        results = asyncio.run(run(args.url, scenario))
+    else:
+        results = run_local(scenario)
+    for metric, value in results.items():
+        if metric != "scenario":
+            print(f"{metric:<28} {value}")
+
+    baselines = _load_baselines(args.baseline_file)
+    if args.save_baseline:
+        baselines[args.name] = results
+        args.baseline_file.write_text(json.dumps(baselines, indent=2) + "\n")
+        print(f"baseline {args.name!r} saved to {args.baseline_file}")
+    if args.check:
+        baseline = baselines.get(args.name)
+        if baseline is None:
+            raise SystemExit(f"No baseline named {args.name!r} in {args.baseline_file}")
+        if baseline.get("scenario") != results["scenario"]:
+            raise SystemExit("The baseline was recorded with a different scenario")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"within {args.tolerance:.0%} of baseline {args.name!r}")
+
+
+if __name__ == "__main__":
+    main()
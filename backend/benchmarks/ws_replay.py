@@ -0,0 +1,203 @@
+"""Replay a captured WebSocket session against a server.
+
+Run from the backend directory:
+
+    python benchmarks/ws_replay.py captures/<diagram>-<time>.wscap.gz --speed 4
+
+Captures are written by the opt-in recorder (``WS_CAPTURE_ROOMS`` or
+``POST /admin/rooms/{id}/capture``). The replay creates a new diagram with
+the XML the room had when the capture started. It then opens one connection
+per captured connection, under the same user name, and sends every message
+at its captured offset divided by ``--speed``. ``--speed 0`` sends as fast
+as the server accepts. Saves are rebased onto the new diagram's versions, so
+merges happen where they happened in the capture.
+
+Without ``--url`` a server is started on a scratch SQLite database, as in
+``ws_load.py``. The report lists how far sends fell behind the captured
+schedule, save round trips and how many messages the server delivered.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Tuple
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.ws_load import local_server, percentile  # noqa: E402
+from capture import read_capture  # noqa: E402
+
+
+@dataclass
+class ReplayStats:
+    sent: int = 0
+    received: int = 0
+    errors: int = 0
+    lag: List[float] = field(default_factory=list)
+    saves: List[float] = field(default_factory=list)
+
+
+def load_capture(path: str) -> Tuple[dict, Dict[int, List[dict]]]:
+    """The capture header and each connection's records, in order."""
+    header = None
+    timelines: Dict[int, List[dict]] = defaultdict(list)
+    for record in read_capture(path):
+        if record["kind"] == "header":
+            header = record
+        elif record["kind"] in ("open", "msg", "close"):
+            timelines[record["conn"]].append(record)
+    if header is None:
+        raise ValueError(f"{path} is not a capture file")
+    return header, dict(timelines)
+
+
+def _create_diagram(url: str, xml: str) -> dict:
+    request = urllib.request.Request(
+        f"{url}/api/diagrams",
+        data=json.dumps({"name": "replay", "initial_xml": xml}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+async def _wait_until(start: float, offset: float, speed: float) -> float:
+    """Sleep until ``offset`` captured seconds have passed; returns lateness."""
+    if not speed:
+        return 0.0
+    target = start + offset / speed
+    delay = target - time.perf_counter()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    return max(time.perf_counter() - target, 0.0)
+
+
+class _Connection:
+    """Plays one captured connection's messages on its schedule."""
+
+    def __init__(
+        self,
+        ws_url: str,
+        records: List[dict],
+        version_shift: int,
+        stats: ReplayStats,
+    ):
+        self.ws_url = ws_url
+        self.records = records
+        self.user_name = records[0].get("user_name") or "replay"
+        self.version_shift = version_shift
+        self.stats = stats
+        self.saves: Deque[float] = deque()
+
+    async def run(self, start: float, speed: float) -> None:
+        await _wait_until(start, self.records[0]["t"], speed)
+        query = urllib.parse.urlencode({"user_name": self.user_name})
+        try:
+            async with websockets.connect(
+                f"{self.ws_url}?{query}", max_size=None
+            ) as ws:
+                await ws.recv()  # diagram_state
+                receiver = asyncio.create_task(self._receive(ws))
+                try:
+                    await self._send(ws, start, speed)
+                    # Let the answers to the last messages arrive
+                    await asyncio.sleep(0.2)
+                finally:
+                    receiver.cancel()
+        except (OSError, websockets.exceptions.WebSocketException):
+            self.stats.errors += 1
+
+    async def _send(self, ws, start: float, speed: float) -> None:
+        for record in self.records[1:]:
+            lag = await _wait_until(start, record["t"], speed)
+            if record["kind"] == "close":
+                return
+            if record["kind"] != "msg":
+                continue
+            message = record["message"]
+            data = message.get("data")
+            if isinstance(data, dict) and isinstance(data.get("base_version"), int):
+                rebased = max(data["base_version"] + self.version_shift, 1)
+                message = {**message, "data": {**data, "base_version": rebased}}
+            if message.get("type") == "diagram_update":
+                self.saves.append(time.perf_counter())
+            await ws.send(json.dumps(message))
+            self.stats.sent += 1
+            self.stats.lag.append(lag)
+
+    async def _receive(self, ws) -> None:
+        async for raw in ws:
+            self.stats.received += 1
+            message = json.loads(raw)
+            kind = message.get("type")
+            own_merge = (
+                kind == "diagram_update" and message.get("user") == self.user_name
+            )
+            if (kind == "diagram_ack" or own_merge) and self.saves:
+                self.stats.saves.append(time.perf_counter() - self.saves.popleft())
+
+
+async def replay(url: str, path: str, speed: float = 1.0) -> dict:
+    """Replay a capture against ``url`` and return what was measured."""
+    header, timelines = load_capture(path)
+    diagram = _create_diagram(url, header["xml"])
+    ws_url = f"{url.replace('http', 'ws', 1)}/ws/{diagram['id']}"
+    stats = ReplayStats()
+    connections = [
+        _Connection(ws_url, records, diagram["version"] - header["version"], stats)
+        for _, records in sorted(timelines.items())
+    ]
+    captured = max(
+        (records[-1]["t"] for records in timelines.values()), default=0.0
+    )
+    start = time.perf_counter()
+    await asyncio.gather(*(c.run(start, speed) for c in connections))
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "connections": len(connections),
+        "captured_seconds": captured,
+        "replay_seconds": round(elapsed, 3),
+        "sent": stats.sent,
+        "received": stats.received,
+        "errors": stats.errors,
+    }
+    for name, samples in (("lag", stats.lag), ("save", stats.saves)):
+        for label, fraction in (("p50", 0.5), ("p99", 0.99)):
+            value = percentile(samples, fraction)
+            results[f"{name}_{label}_ms"] = (
+                round(value * 1000, 2) if value is not None else None
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="A .wscap.gz file")
+    parser.add_argument("--url", help="Replay against a running server")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="1 is real time; 0 is no delays"
+    )
+    args = parser.parse_args()
+
+    if args.url:
+        results = asyncio.run(replay(args.url, args.capture, args.speed))
+    else:
+        with local_server() as (url, _):
+            results = asyncio.run(replay(url, args.capture, args.speed))
+    for metric, value in results.items():
+        print(f"{metric:<20} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""In-memory cache of encoded diagram XML bodies and HTTP caching helpers."""
+
+import gzip
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+def supported_encodings() -> tuple:
+    """Content encodings this server can produce, most preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data: bytes, encoding: str, level: int = 6) -> bytes:
+    """Compress a body with the given content encoding."""
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def choose_encoding(
+    accept_encoding: str, available: Optional[Iterable[str]] = None
+) -> Optional[str]:
+    """Pick the best available encoding from an Accept-Encoding header."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.lower()] = quality
+
+    for encoding in supported_encodings() if available is None else available:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag using weak comparison."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == target
+        for candidate in if_none_match.split(",")
+    )
+
+
+class CachedXml:
+    """A diagram XML body at a given version with lazily compressed variants."""
+
+    __slots__ = ("version", "raw", "etag", "_encoded")
+
+    def __init__(self, version: int, xml: str):
+        self.version = version
+        self.raw = xml.encode("utf-8")
+        # Weak ETag: every content encoding of a version is equivalent
+        self.etag = f'W/"{version}"'
+        self._encoded: Dict[str, bytes] = {}
+
+    def body(self, encoding: Optional[str] = None) -> bytes:
+        """Return the body in the requested encoding, compressing at most once."""
+        if encoding is None:
+            return self.raw
+        if encoding not in self._encoded:
+            self._encoded[encoding] = compress(self.raw, encoding)
+        return self._encoded[encoding]
+
+
+class DiagramCache:
+    """LRU cache of the latest known XML for each diagram, keyed by version."""
+
+    def __init__(self, max_entries: int = 256):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedXml]" = OrderedDict()
+
+    def get(self, diagram_id: str, version: int) -> Optional[CachedXml]:
+        """Get the cached body for a diagram if it is at the given version."""
+        entry = self._entries.get(diagram_id)
+        if entry is None or entry.version != version:
+            return None
+        self._entries.move_to_end(diagram_id)
+        return entry
+
+    def put(self, diagram_id: str, version: int, xml: str) -> CachedXml:
+        """Store the XML for a diagram version, replacing older versions."""
+        entry = self._entries.get(diagram_id)
+        if entry is not None and entry.version > version:
+            return entry
+        entry = CachedXml(version, xml)
+        self._entries[diagram_id] = entry
+        self._entries.move_to_end(diagram_id)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, diagram_id: str) -> None:
+        """Drop a diagram from the cache."""
+        self._entries.pop(diagram_id, None)
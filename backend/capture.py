@@ -0,0 +1,251 @@
+"""Opt-in capture of inbound WebSocket traffic, for replaying incidents."""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set
+
+from fastapi import WebSocket
+
+from cache import CachedXml
+from config import (
+    WS_CAPTURE_DIR,
+    WS_CAPTURE_FLUSH_MS,
+    WS_CAPTURE_MAX_BYTES,
+    WS_CAPTURE_ROOMS,
+)
+
+CAPTURE_FORMAT = 1
+
+
+def xml_hash(xml: str) -> str:
+    return hashlib.sha1(xml.encode("utf-8")).hexdigest()
+
+
+def _encode(record: dict) -> str:
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+
+
+class _Capture:
+    """One capture file: buffered records and the XML bodies already written."""
+
+    def __init__(self, path: str, diagram_id: str, version: int, xml: str):
+        self.path = path
+        self.started = time.monotonic()
+        self.lines: List[str] = []
+        self.hashes: Set[str] = set()
+        self.connections: Dict[WebSocket, int] = {}
+        self.opened = 0
+        self.messages = 0
+        self.size = 0
+        self.full = False
+        self._file: Optional[gzip.GzipFile] = None
+        # Write in flight in a worker thread, if any
+        self.pending: Optional[asyncio.Future] = None
+        self.add(
+            {
+                "kind": "header",
+                "format": CAPTURE_FORMAT,
+                "diagram_id": diagram_id,
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "version": version,
+                "xml": self.blob(xml),
+            }
+        )
+
+    def elapsed(self) -> float:
+        return round(time.monotonic() - self.started, 6)
+
+    def add(self, record: dict) -> None:
+        line = _encode(record)
+        self.lines.append(line)
+        self.size += len(line) + 1
+
+    def blob(self, xml: str) -> str:
+        """Reference to ``xml``; the body itself is written only the first time."""
+        digest = xml_hash(xml)
+        if digest not in self.hashes:
+            self.hashes.add(digest)
+            self.add({"kind": "blob", "hash": digest, "xml": xml})
+        return digest
+
+    def write(self, lines: List[str]) -> None:
+        """Append lines to the file; runs in a worker thread."""
+        if self._file is None:
+            self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._file.write("\n".join(lines) + "\n")
+
+    def finish(self, lines: List[str]) -> None:
+        if lines:
+            self.write(lines)
+        if self._file is not None:
+            self._file.close()
+
+
+class SessionRecorder:
+    """Records what editors send to a room, with timestamps, for replay.
+
+    Captures are off unless a room is listed in ``rooms`` (``*`` for every
+    room) or started at runtime. Each capture is a gzip-compressed JSON lines
+    file: a header with the diagram as it was when the capture started,
+    then ``open``, ``msg`` and ``close`` records per connection, timed in
+    seconds since the start. Diagram XML is stored once per distinct body
+    as a ``blob`` record and referenced by its SHA-1 as ``{"$xml": hash}``,
+    so repeated saves of a large diagram cost a few bytes each.
+
+    Recording only appends to a buffer; a background task compresses and
+    writes it every ``flush_interval`` seconds in a worker thread. A capture
+    stops itself after ``max_bytes`` of uncompressed records.
+    """
+
+    def __init__(
+        self, directory: str, rooms: str, max_bytes: int, flush_interval: float
+    ):
+        self.directory = directory
+        self._all_rooms = rooms.strip() == "*"
+        self._rooms = {room.strip() for room in rooms.split(",") if room.strip()}
+        self._max_bytes = max_bytes
+        self._flush_interval = flush_interval
+        self._captures: Dict[str, _Capture] = {}
+        self._writer: Optional[asyncio.Task] = None
+
+    def capturing(self, diagram_id: str) -> bool:
+        return diagram_id in self._captures
+
+    def start(self, diagram_id: str, version: int, xml: str) -> str:
+        """Start capturing a room; returns the capture file path."""
+        capture = self._captures.get(diagram_id)
+        if capture is None:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+            path = os.path.join(self.directory, f"{diagram_id}-{stamp}.wscap.gz")
+            capture = self._captures[diagram_id] = _Capture(
+                path, diagram_id, version, xml
+            )
+            logging.info(f"Capturing WebSocket traffic of {diagram_id} to {path}")
+            self._ensure_writer()
+        return capture.path
+
+    async def stop(self, diagram_id: str) -> Optional[dict]:
+        """Stop capturing a room and write out the rest of its file."""
+        capture = self._captures.pop(diagram_id, None)
+        if capture is None:
+            return None
+        if capture.pending is not None:
+            await capture.pending
+        lines, capture.lines = capture.lines, []
+        await asyncio.get_running_loop().run_in_executor(None, capture.finish, lines)
+        logging.info(f"Stopped capturing {diagram_id}: {capture.messages} messages")
+        return {"path": capture.path, "messages": capture.messages}
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        for diagram_id in list(self._captures):
+            await self.stop(diagram_id)
+
+    def opened(
+        self, diagram_id: str, cached: CachedXml, websocket: WebSocket, user_name: str
+    ) -> None:
+        """An editor joined ``diagram_id``, whose body was ``cached`` at the time."""
+        if diagram_id not in self._captures and (
+            self._all_rooms or diagram_id in self._rooms
+        ):
+            self.start(diagram_id, cached.version, cached.raw.decode("utf-8"))
+        capture = self._captures.get(diagram_id)
+        if capture is not None:
+            self._connection(capture, websocket, user_name)
+
+    def message(
+        self, diagram_id: str, websocket: WebSocket, user_name: str, message: dict
+    ) -> None:
+        capture = self._captures.get(diagram_id)
+        if capture is None or capture.full:
+            return
+        conn = self._connection(capture, websocket, user_name)
+        data = message.get("data")
+        if isinstance(data, dict) and isinstance(data.get("xml"), str):
+            xml = {"$xml": capture.blob(data["xml"])}
+            message = {**message, "data": {**data, "xml": xml}}
+        capture.add(
+            {"kind": "msg", "t": capture.elapsed(), "conn": conn, "message": message}
+        )
+        capture.messages += 1
+        if capture.size > self._max_bytes:
+            capture.full = True
+            capture.add({"kind": "truncated", "t": capture.elapsed()})
+            logging.warning(f"Capture of {diagram_id} reached its size limit")
+
+    def closed(self, diagram_id: str, websocket: WebSocket) -> None:
+        capture = self._captures.get(diagram_id)
+        if capture is None or websocket not in capture.connections:
+            return
+        conn = capture.connections.pop(websocket)
+        if not capture.full:
+            capture.add({"kind": "close", "t": capture.elapsed(), "conn": conn})
+
+    def _connection(
+        self, capture: _Capture, websocket: WebSocket, user_name: str
+    ) -> int:
+        conn = capture.connections.get(websocket)
+        if conn is None:
+            # Numbered in order of appearance, including sockets that were
+            # already open when the capture started
+            conn = capture.connections[websocket] = capture.opened
+            capture.opened += 1
+            capture.add(
+                {
+                    "kind": "open",
+                    "t": capture.elapsed(),
+                    "conn": conn,
+                    "user_name": user_name,
+                }
+            )
+        return conn
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._captures:
+            await asyncio.sleep(self._flush_interval)
+            for capture in list(self._captures.values()):
+                if capture.lines:
+                    lines, capture.lines = capture.lines, []
+                    capture.pending = loop.run_in_executor(None, capture.write, lines)
+                    # stop() waits for this write even if the writer is cancelled
+                    await asyncio.shield(capture.pending)
+                    capture.pending = None
+
+
+def read_capture(path: str) -> Iterator[dict]:
+    """Records of a capture file, with ``{"$xml": hash}`` references resolved."""
+    blobs: Dict[str, str] = {}
+    with gzip.open(path, "rt", encoding="utf-8") as capture:
+        for line in capture:
+            record = json.loads(line)
+            kind = record["kind"]
+            if kind == "blob":
+                blobs[record["hash"]] = record["xml"]
+                continue
+            if kind == "header":
+                record["xml"] = blobs[record["xml"]]
+            elif kind == "msg":
+                data = record["message"].get("data")
+                if isinstance(data, dict) and isinstance(data.get("xml"), dict):
+                    data["xml"] = blobs[data["xml"]["$xml"]]
+            yield record
+
+
+# Global recorder; captures nothing unless configured or started by an admin
+session_recorder = SessionRecorder(
+    WS_CAPTURE_DIR, WS_CAPTURE_ROOMS, WS_CAPTURE_MAX_BYTES, WS_CAPTURE_FLUSH_MS / 1000
+)
@@ -0,0 +1,161 @@
+"""Chunked transfer of diagram XML over WebSockets, as sequenced binary frames."""
+
+import struct
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Every binary frame starts with the transfer id and the chunk's sequence
+# number, both unsigned 32-bit big-endian, followed by up to a chunk of XML
+HEADER = struct.Struct(">II")
+
+
+class ChunkError(ValueError):
+    """A chunked upload that cannot be accepted; the upload is discarded."""
+
+    def __init__(self, transfer: Optional[int], message: str):
+        super().__init__(message)
+        self.transfer = transfer
+
+    def message(self) -> Dict[str, Any]:
+        return {
+            "type": "xml_upload_error",
+            "data": {"transfer": self.transfer, "error": str(self)},
+        }
+
+
+def encode_chunk(transfer: int, sequence: int, payload: bytes) -> bytes:
+    return HEADER.pack(transfer, sequence) + payload
+
+
+def decode_chunk(frame: bytes) -> Tuple[int, int, memoryview]:
+    if len(frame) < HEADER.size:
+        raise ChunkError(None, "Binary frame is shorter than a chunk header")
+    transfer, sequence = HEADER.unpack_from(frame)
+    return transfer, sequence, memoryview(frame)[HEADER.size :]
+
+
+def iter_chunks(transfer: int, body: bytes, chunk_size: int) -> Iterator[bytes]:
+    """Frames of ``body``, slicing it without copying more than one chunk."""
+    view = memoryview(body)
+    for sequence, offset in enumerate(range(0, len(body), chunk_size)):
+        yield encode_chunk(transfer, sequence, view[offset : offset + chunk_size])
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return -(-size // chunk_size)
+
+
+class ChunkedUpload:
+    """One XML body arriving in order, into a buffer no larger than announced."""
+
+    def __init__(self, transfer: int, size: int, base_version: Optional[int]):
+        self.transfer = transfer
+        self.size = size
+        self.base_version = base_version
+        self.next_sequence = 0
+        self._buffer = bytearray()
+
+    @property
+    def received(self) -> int:
+        return len(self._buffer)
+
+    def add(self, sequence: int, payload: memoryview) -> bool:
+        """Append a chunk; returns True once the whole body has arrived."""
+        if sequence != self.next_sequence:
+            raise ChunkError(
+                self.transfer, f"Expected chunk {self.next_sequence}, got {sequence}"
+            )
+        if self.received + len(payload) > self.size:
+            raise ChunkError(self.transfer, "More data than the announced size")
+        self._buffer += payload
+        self.next_sequence += 1
+        return self.received == self.size
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "type": "xml_upload_progress",
+            "data": {
+                "transfer": self.transfer,
+                "received": self.received,
+                "size": self.size,
+            },
+        }
+
+    def text(self) -> str:
+        """The complete body as text; the buffer is released."""
+        buffer, self._buffer = self._buffer, bytearray()
+        try:
+            return buffer.decode("utf-8")
+        except UnicodeDecodeError:
+            raise ChunkError(self.transfer, "Upload is not valid UTF-8")
+
+
+class ChunkReceiver:
+    """Reassembles one editor's chunked uploads, one at a time.
+
+    ``start`` announces an upload with its transfer id, total size in bytes
+    and the base version of the edit; binary frames then carry its chunks
+    in sequence. A connection holds at most one partial upload, capped at
+    ``max_size`` bytes, and each chunk at ``max_chunk`` bytes, so a client
+    cannot make the server buffer more than that. After an error, the rest
+    of that transfer's chunks are ignored until it is started again.
+    """
+
+    def __init__(self, max_size: int, max_chunk: int):
+        self.max_size = max_size
+        self.max_chunk = max_chunk
+        self.upload: Optional[ChunkedUpload] = None
+        self._failed: Optional[int] = None
+
+    def start(self, data: Dict[str, Any]) -> ChunkedUpload:
+        """Begin an upload, replacing one left unfinished."""
+        transfer, size = data.get("transfer"), data.get("size")
+        base_version = data.get("base_version")
+        self.upload = None
+        if not isinstance(transfer, int) or not 0 <= transfer < 2**32:
+            raise ChunkError(None, "Upload needs an integer transfer id")
+        if not isinstance(size, int) or size <= 0:
+            self._failed = transfer
+            raise ChunkError(transfer, "Upload needs a positive size")
+        if size > self.max_size:
+            self._failed = transfer
+            raise ChunkError(
+                transfer, f"Upload of {size} bytes exceeds {self.max_size} bytes"
+            )
+        if not isinstance(base_version, int):
+            base_version = None
+        if transfer == self._failed:
+            # The client retries under the same id; its chunks count again.
+            # Leftover chunks of a different failed transfer stay ignored.
+            self._failed = None
+        self.upload = ChunkedUpload(transfer, size, base_version)
+        return self.upload
+
+    def abort(self, transfer: Any) -> None:
+        if self.upload is not None and self.upload.transfer == transfer:
+            self.upload = None
+
+    def receive(self, frame: bytes) -> Tuple[Optional[ChunkedUpload], bool]:
+        """Add a binary frame to its upload.
+
+        Returns the upload and whether it is complete, or ``(None, False)``
+        for a chunk of a transfer that already failed.
+        """
+        transfer, sequence, payload = decode_chunk(frame)
+        if transfer == self._failed:
+            return None, False
+        upload = self.upload
+        try:
+            if upload is None or upload.transfer != transfer:
+                raise ChunkError(transfer, "Chunk of an upload that was not started")
+            if len(payload) > self.max_chunk:
+                raise ChunkError(
+                    transfer, f"Chunk of {len(payload)} bytes exceeds {self.max_chunk}"
+                )
+            complete = upload.add(sequence, payload)
+        except ChunkError:
+            self._failed = transfer
+            self.upload = None
+            raise
+        if complete:
+            self.upload = None
+        return upload, complete
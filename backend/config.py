@@ -1,6 +1,7 @@
 """Configuration settings for the application."""
 
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 
@@ -12,6 +13,18 @@ APP_VERSION = "1.0.0"
 PORT = int(os.getenv("PORT", 8000))
 HOST = os.getenv("HOST", "0.0.0.0")
 
+# Multi-worker mode: with more than one worker, `python main.py` starts a front
+# router that shards diagrams across worker processes (see workers.py)
+WORKERS = int(os.getenv("WORKERS", os.getenv("WEB_CONCURRENCY", 1)))
+WORKER_HASH_REPLICAS = int(os.getenv("WORKER_HASH_REPLICAS", 100))
+# Rooms that move to another worker are released over this many seconds
+WORKER_REBALANCE_JITTER = float(os.getenv("WORKER_REBALANCE_JITTER", 5.0))
+# Shared secret for router -> worker control requests; set by the router
+WORKER_CONTROL_TOKEN = os.getenv("WORKER_CONTROL_TOKEN", "")
+# Enables the /admin endpoints, /metrics and /debug/traces for operators, sent
+# as the X-Admin-Token header
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 # CORS settings
 CORS_ORIGINS: List[str] = os.getenv(
     "CORS_ORIGINS", "http://localhost:3000,http://localhost:8000,http://0.0.0.0:8000"
@@ -25,184 +38,128 @@ IS_PRODUCTION = ENVIRONMENT == "production"
 BASE_DIR = Path(__file__).parent.parent
 STATIC_DIR = BASE_DIR / "app/static/"
 STATIC_ASSETS_DIR = STATIC_DIR / "static"
+# Larger build files are streamed from disk instead of held in memory
+STATIC_MAX_INMEMORY_BYTES = int(os.getenv("STATIC_MAX_INMEMORY_BYTES", 10 * 1024 * 1024))
+
+# Connections opened in the background on startup before /healthz/ready passes
+DB_WARMUP_CONNECTIONS = int(os.getenv("DB_WARMUP_CONNECTIONS", 2))
+
+# Connection pool for DATABASE_URL (and DATABASE_REPLICA_URL if set). Pre-ping
+# tests connections on checkout; recycling replaces them before servers or
+# proxies drop idle connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Presence joins/leaves are coalesced into one frame per room per interval
+PRESENCE_DEBOUNCE_MS = int(os.getenv("PRESENCE_DEBOUNCE_MS", 250))
+
+# Cursor moves are batched into one frame per room per tick; cursors that have
+# not moved for CURSOR_STALE_MS are dropped
+CURSOR_TICK_MS = int(os.getenv("CURSOR_TICK_MS", 50))
+CURSOR_STALE_MS = int(os.getenv("CURSOR_STALE_MS", 5000))
+
+# Read-only (mode=view) connections get at most one snapshot per interval
+SPECTATOR_INTERVAL_MS = int(os.getenv("SPECTATOR_INTERVAL_MS", 1000))
+
+# Chunked XML transfer over WebSockets (binary frames, see chunked.py):
+# size of the chunks the server sends, the largest chunk it accepts and the
+# largest diagram a client may upload in chunks
+XML_CHUNK_SIZE = int(os.getenv("XML_CHUNK_SIZE", 256 * 1024))
+XML_CHUNK_MAX_BYTES = int(os.getenv("XML_CHUNK_MAX_BYTES", 1024 * 1024))
+XML_UPLOAD_MAX_BYTES = int(os.getenv("XML_UPLOAD_MAX_BYTES", 64 * 1024 * 1024))
+
+# Where diagrams are stored: "postgres" (any SQLAlchemy DATABASE_URL),
+# "sqlite" (an embedded file at SQLITE_PATH) or "memory"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "bpmn.sqlite3")
+
+# Number of diagrams whose encoded XML is kept in memory
+DIAGRAM_CACHE_SIZE = int(os.getenv("DIAGRAM_CACHE_SIZE", 256))
+# Recent revisions kept per diagram as bases for merging concurrent edits
+MERGE_HISTORY_SIZE = int(os.getenv("MERGE_HISTORY_SIZE", 50))
+
+# Diagram list thumbnails, rendered in a process pool (0 uses threads)
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", 2))
+THUMBNAIL_CACHE_SIZE = int(os.getenv("THUMBNAIL_CACHE_SIZE", 1024))
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", 320))
+THUMBNAIL_HEIGHT = int(os.getenv("THUMBNAIL_HEIGHT", 180))
 
-# Example diagrams data
-EXAMPLE_DIAGRAMS = [
-    {
-        "name": "Simple Approval Process",
-        "xml": """<?xml version="1.0" encoding="UTF-8"?>
-<bpmn2:definitions xmlns:bpmn2="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" xmlns:di="http://www.omg.org/spec/DD/20100524/DI" id="sample-diagram" targetNamespace="http://bpmn.io/schema/bpmn">
-  <bpmn2:process id="Process_1" isExecutable="false">
-    <bpmn2:startEvent id="StartEvent_1"/>
-    <bpmn2:task id="Task_1" name="Review Application"/>
-    <bpmn2:task id="Task_2" name="Approve Application"/>
-    <bpmn2:endEvent id="EndEvent_1"/>
-    <bpmn2:sequenceFlow id="Flow_1" sourceRef="StartEvent_1" targetRef="Task_1"/>
-    <bpmn2:sequenceFlow id="Flow_2" sourceRef="Task_1" targetRef="Task_2"/>
-    <bpmn2:sequenceFlow id="Flow_3" sourceRef="Task_2" targetRef="EndEvent_1"/>
-  </bpmn2:process>
-  <bpmndi:BPMNDiagram id="BPMNDiagram_1">
-    <bpmndi:BPMNPlane id="BPMNPlane_1" bpmnElement="Process_1">
-      <bpmndi:BPMNShape id="_BPMNShape_StartEvent_2" bpmnElement="StartEvent_1">
-        <dc:Bounds x="179" y="99" width="36" height="36"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_Task_2" bpmnElement="Task_1">
-        <dc:Bounds x="270" y="77" width="100" height="80"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_Task_3" bpmnElement="Task_2">
-        <dc:Bounds x="430" y="77" width="100" height="80"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_EndEvent_2" bpmnElement="EndEvent_1">
-        <dc:Bounds x="592" y="99" width="36" height="36"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_1" bpmnElement="Flow_1">
-        <di:waypoint x="215" y="117"/>
-        <di:waypoint x="270" y="117"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_2" bpmnElement="Flow_2">
-        <di:waypoint x="370" y="117"/>
-        <di:waypoint x="430" y="117"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_3" bpmnElement="Flow_3">
-        <di:waypoint x="530" y="117"/>
-        <di:waypoint x="592" y="117"/>
-      </bpmndi:BPMNEdge>
-    </bpmndi:BPMNPlane>
-  </bpmndi:BPMNDiagram>
-</bpmn2:definitions>""",
-    },
-    {
-        "name": "Order Processing with Gateway",
-        "xml": """<?xml version="1.0" encoding="UTF-8"?>
-<bpmn2:definitions xmlns:bpmn2="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" xmlns:di="http://www.omg.org/spec/DD/20100524/DI" id="sample-diagram-2" targetNamespace="http://bpmn.io/schema/bpmn">
-  <bpmn2:process id="Process_2" isExecutable="false">
-    <bpmn2:startEvent id="StartEvent_2"/>
-    <bpmn2:exclusiveGateway id="Gateway_1"/>
-    <bpmn2:task id="Task_3" name="Process Order"/>
-    <bpmn2:task id="Task_4" name="Reject Order"/>
-    <bpmn2:endEvent id="EndEvent_2"/>
-    <bpmn2:sequenceFlow id="Flow_4" sourceRef="StartEvent_2" targetRef="Gateway_1"/>
-    <bpmn2:sequenceFlow id="Flow_5" name="Yes" sourceRef="Gateway_1" targetRef="Task_3"/>
-    <bpmn2:sequenceFlow id="Flow_6" name="No" sourceRef="Gateway_1" targetRef="Task_4"/>
-    <bpmn2:sequenceFlow id="Flow_7" sourceRef="Task_3" targetRef="EndEvent_2"/>
-    <bpmn2:sequenceFlow id="Flow_8" sourceRef="Task_4" targetRef="EndEvent_2"/>
-  </bpmn2:process>
-  <bpmndi:BPMNDiagram id="BPMNDiagram_2">
-    <bpmndi:BPMNPlane id="BPMNPlane_2" bpmnElement="Process_2">
-      <bpmndi:BPMNShape id="_BPMNShape_StartEvent_3" bpmnElement="StartEvent_2">
-        <dc:Bounds x="179" y="99" width="36" height="36"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_Gateway_1" bpmnElement="Gateway_1" isMarkerVisible="true">
-        <dc:Bounds x="270" y="92" width="50" height="50"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_Task_4" bpmnElement="Task_3">
-        <dc:Bounds x="380" y="77" width="100" height="80"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_Task_5" bpmnElement="Task_4">
-        <dc:Bounds x="380" y="200" width="100" height="80"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_EndEvent_3" bpmnElement="EndEvent_2">
-        <dc:Bounds x="542" y="99" width="36" height="36"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_4" bpmnElement="Flow_4">
-        <di:waypoint x="215" y="117"/>
-        <di:waypoint x="270" y="117"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_5" bpmnElement="Flow_5">
-        <di:waypoint x="320" y="117"/>
-        <di:waypoint x="380" y="117"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_6" bpmnElement="Flow_6">
-        <di:waypoint x="295" y="142"/>
-        <di:waypoint x="295" y="240"/>
-        <di:waypoint x="380" y="240"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_7" bpmnElement="Flow_7">
-        <di:waypoint x="480" y="117"/>
-        <di:waypoint x="542" y="117"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_8" bpmnElement="Flow_8">
-        <di:waypoint x="430" y="240"/>
-        <di:waypoint x="560" y="240"/>
-        <di:waypoint x="560" y="135"/>
-      </bpmndi:BPMNEdge>
-    </bpmndi:BPMNPlane>
-  </bpmndi:BPMNDiagram>
-</bpmn2:definitions>""",
-    },
-    {
-        "name": "Multi-Step Request Workflow",
-        "xml": """<?xml version="1.0" encoding="UTF-8"?>
-<bpmn2:definitions xmlns:bpmn2="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" xmlns:di="http://www.omg.org/spec/DD/20100524/DI" id="sample-diagram-3" targetNamespace="http://bpmn.io/schema/bpmn">
-  <bpmn2:process id="Process_3" isExecutable="false">
-    <bpmn2:startEvent id="StartEvent_3"/>
-    <bpmn2:task id="Task_5" name="Submit Request"/>
-    <bpmn2:task id="Task_6" name="Review Request"/>
-    <bpmn2:task id="Task_7" name="Approve Request"/>
-    <bpmn2:task id="Task_8" name="Notify User"/>
-    <bpmn2:endEvent id="EndEvent_3"/>
-    <bpmn2:sequenceFlow id="Flow_9" sourceRef="StartEvent_3" targetRef="Task_5"/>
-    <bpmn2:sequenceFlow id="Flow_10" sourceRef="Task_5" targetRef="Task_6"/>
-    <bpmn2:sequenceFlow id="Flow_11" sourceRef="Task_6" targetRef="Task_7"/>
-    <bpmn2:sequenceFlow id="Flow_12" sourceRef="Task_7" targetRef="Task_8"/>
-    <bpmn2:sequenceFlow id="Flow_13" sourceRef="Task_8" targetRef="EndEvent_3"/>
-  </bpmn2:process>
-  <bpmndi:BPMNDiagram id="BPMNDiagram_3">
-    <bpmndi:BPMNPlane id="BPMNPlane_3" bpmnElement="Process_3">
-      <bpmndi:BPMNShape id="_BPMNShape_StartEvent_4" bpmnElement="StartEvent_3">
-        <dc:Bounds x="179" y="99" width="36" height="36"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_Task_6" bpmnElement="Task_5">
-        <dc:Bounds x="270" y="77" width="100" height="80"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_Task_7" bpmnElement="Task_6">
-        <dc:Bounds x="420" y="77" width="100" height="80"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_Task_8" bpmnElement="Task_7">
-        <dc:Bounds x="570" y="77" width="100" height="80"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_Task_9" bpmnElement="Task_8">
-        <dc:Bounds x="720" y="77" width="100" height="80"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNShape id="_BPMNShape_EndEvent_4" bpmnElement="EndEvent_3">
-        <dc:Bounds x="872" y="99" width="36" height="36"/>
-      </bpmndi:BPMNShape>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_9" bpmnElement="Flow_9">
-        <di:waypoint x="215" y="117"/>
-        <di:waypoint x="270" y="117"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_10" bpmnElement="Flow_10">
-        <di:waypoint x="370" y="117"/>
-        <di:waypoint x="420" y="117"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_11" bpmnElement="Flow_11">
-        <di:waypoint x="520" y="117"/>
-        <di:waypoint x="570" y="117"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_12" bpmnElement="Flow_12">
-        <di:waypoint x="670" y="117"/>
-        <di:waypoint x="720" y="117"/>
-      </bpmndi:BPMNEdge>
-      <bpmndi:BPMNEdge id="BPMNEdge_Flow_13" bpmnElement="Flow_13">
-        <di:waypoint x="820" y="117"/>
-        <di:waypoint x="872" y="117"/>
-      </bpmndi:BPMNEdge>
-    </bpmndi:BPMNPlane>
-  </bpmndi:BPMNDiagram>
-</bpmn2:definitions>""",
-    },
+# Collaboration event log: events are written in batches of up to
+# EVENT_LOG_BATCH_SIZE at least every EVENT_LOG_FLUSH_MS. Beyond
+# EVENT_LOG_QUEUE_SIZE queued events the oldest are spilled to files in
+# EVENT_LOG_SPILL_DIR, up to EVENT_LOG_SPILL_MAX_BYTES per process
+EVENT_LOG_BATCH_SIZE = int(os.getenv("EVENT_LOG_BATCH_SIZE", 500))
+EVENT_LOG_FLUSH_MS = int(os.getenv("EVENT_LOG_FLUSH_MS", 1000))
+EVENT_LOG_QUEUE_SIZE = int(os.getenv("EVENT_LOG_QUEUE_SIZE", 10000))
+EVENT_LOG_SPILL_DIR = os.getenv(
+    "EVENT_LOG_SPILL_DIR", str(Path(__file__).parent / "event_spill")
+)
+EVENT_LOG_SPILL_MAX_BYTES = int(
+    os.getenv("EVENT_LOG_SPILL_MAX_BYTES", 64 * 1024 * 1024)
+)
+
+# Opt-in capture of inbound WebSocket traffic for replay (see
+# benchmarks/ws_replay.py): a comma separated list of diagram IDs, or * for
+# every room. Captures can also be started at runtime with ADMIN_TOKEN
+WS_CAPTURE_ROOMS = os.getenv("WS_CAPTURE_ROOMS", "")
+WS_CAPTURE_DIR = os.getenv("WS_CAPTURE_DIR", str(Path(__file__).parent / "captures"))
+WS_CAPTURE_MAX_BYTES = int(os.getenv("WS_CAPTURE_MAX_BYTES", 256 * 1024 * 1024))
+WS_CAPTURE_FLUSH_MS = int(os.getenv("WS_CAPTURE_FLUSH_MS", 500))
+
+# Graceful drain before a restart (POST /admin/drain or DRAIN_SIGNAL, then
+# the signal's usual effect; empty disables the signal): sockets are closed
+# with reconnect hints jittered over DRAIN_RETRY_JITTER_MS, and locks and
+# sessions are handed to the next process through files in
+# DRAIN_HANDOFF_DIR, honoured for DRAIN_HANDOFF_TTL_S seconds
+DRAIN_SIGNAL = os.getenv("DRAIN_SIGNAL", "SIGTERM")
+DRAIN_HANDOFF_DIR = os.getenv(
+    "DRAIN_HANDOFF_DIR", str(Path(__file__).parent / "handoff")
+)
+DRAIN_RETRY_JITTER_MS = int(os.getenv("DRAIN_RETRY_JITTER_MS", 5000))
+DRAIN_HANDOFF_TTL_S = int(os.getenv("DRAIN_HANDOFF_TTL_S", 60))
+
+# Share of WebSocket messages traced span by span (0 disables tracing), and
+# how many recent traces GET /debug/traces keeps
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 100))
+
+# Diagrams whose latest lint result is kept to re-check incrementally
+LINT_CACHE_SIZE = int(os.getenv("LINT_CACHE_SIZE", 256))
+
+# Bulk import/export settings. An import is refused with 413 once one diagram
+# (an NDJSON line or zip entry) exceeds IMPORT_MAX_RECORD_BYTES, or once a
+# zip body or the BPMN files it expands to exceed IMPORT_MAX_BYTES
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 200))
+IMPORT_MAX_RECORD_BYTES = int(os.getenv("IMPORT_MAX_RECORD_BYTES", 16 * 1024 * 1024))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 512 * 1024 * 1024))
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 100))
+# Example diagrams, read from ./examples only when they are needed
+EXAMPLES_DIR = Path(__file__).parent / "examples"
+EXAMPLE_DIAGRAM_FILES = [
+    ("Simple Approval Process", "simple_approval_process.bpmn"),
+    ("Order Processing with Gateway", "order_processing_with_gateway.bpmn"),
+    ("Multi-Step Request Workflow", "multi_step_request_workflow.bpmn"),
 ]
+DEFAULT_DIAGRAM_FILE = "default.bpmn"
+
+
+@lru_cache(maxsize=None)
+def load_example_xml(file_name: str) -> str:
+    """Read a bundled BPMN file from the examples directory."""
+    return (EXAMPLES_DIR / file_name).read_text(encoding="utf-8").rstrip("\n")
+
+
+def get_example_diagrams() -> List[dict]:
+    """Get the example diagrams used to seed a new database."""
+    return [
+        {"name": name, "xml": load_example_xml(file_name)}
+        for name, file_name in EXAMPLE_DIAGRAM_FILES
+    ]
+
 
-DEFAULT_DIAGRAM_XML = """<?xml version="1.0" encoding="UTF-8"?>
-<bpmn2:definitions xmlns:bpmn2="http://www.omg.org/spec/BPMN/20100524/MODEL" xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI" xmlns:dc="http://www.omg.org/spec/DD/20100524/DC" xmlns:di="http://www.omg.org/spec/DD/20100524/DI" id="new-diagram" targetNamespace="http://bpmn.io/schema/bpmn">
-  <bpmn2:process id="Process_1" isExecutable="false">
-    <bpmn2:startEvent id="StartEvent_1"/>
-  </bpmn2:process>
-  <bpmndi:BPMNDiagram id="BPMNDiagram_1">
-    <bpmndi:BPMNPlane id="BPMNPlane_1" bpmnElement="Process_1">
-      <bpmndi:BPMNShape id="_BPMNShape_StartEvent_2" bpmnElement="StartEvent_1">
-        <dc:Bounds x="179" y="99" width="36" height="36"/>
-      </bpmndi:BPMNShape>
-    </bpmndi:BPMNPlane>
-  </bpmndi:BPMNDiagram>
-</bpmn2:definitions>"""
+def get_default_diagram_xml() -> str:
+    """Get the XML for a newly created blank diagram."""
+    return load_example_xml(DEFAULT_DIAGRAM_FILE)
@@ -0,0 +1,166 @@
+"""Ephemeral cursor and viewport relay, batched per room at a fixed tick."""
+
+import asyncio
+import json
+import logging
+import math
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+BroadcastText = Callable[[str, str], Awaitable[None]]
+
+# Diagram coordinates are clamped so a bad client cannot blow up frame sizes
+_COORD_LIMIT = 1_000_000
+_VIEWPORT_KEYS = ("x", "y", "width", "height")
+
+
+def _quantize(value: Any) -> Optional[int]:
+    """Round a coordinate to a whole diagram unit, or None if it is not a number."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if not math.isfinite(value):
+        return None
+    return max(-_COORD_LIMIT, min(_COORD_LIMIT, round(value)))
+
+
+def parse_cursor(data: Any) -> Optional[List[int]]:
+    """Turn a ``cursor`` message payload into ``[x, y]`` or ``[x, y, vx, vy, vw, vh]``.
+
+    Returns None when the payload does not carry a usable position.
+    """
+    if not isinstance(data, dict):
+        return None
+    x, y = _quantize(data.get("x")), _quantize(data.get("y"))
+    if x is None or y is None:
+        return None
+    position = [x, y]
+    viewport = data.get("viewport")
+    if isinstance(viewport, dict):
+        box = [_quantize(viewport.get(key)) for key in _VIEWPORT_KEYS]
+        if None not in box:
+            position.extend(box)
+    return position
+
+
+class CursorRoom:
+    """Latest cursor of every user in a room and what changed since the last tick."""
+
+    def __init__(self):
+        self.next_slot = 1
+        # user_id -> (slot, user_name)
+        self.users: Dict[str, tuple] = {}
+        # slot -> latest quantized position
+        self.positions: Dict[int, List[int]] = {}
+        self.last_seen: Dict[int, float] = {}
+        self.dirty: set = set()
+        self.gone: set = set()
+        self.seq = 0
+        self.ticker: Optional[asyncio.Task] = None
+
+    def take_frame(self, now: float, stale_after: float) -> Optional[str]:
+        """Drop stale cursors and encode the changes since the last tick.
+
+        Entries are ``[slot, user_name, x, y, ...viewport]`` so a whole frame is
+        a handful of small integer arrays. Returns None when nothing changed.
+        """
+        for slot, seen in list(self.last_seen.items()):
+            if now - seen > stale_after:
+                self._drop(slot)
+
+        if not self.dirty and not self.gone:
+            return None
+        names = {slot: name for slot, name in self.users.values()}
+        cursors = [
+            [slot, names.get(slot, ""), *self.positions[slot]]
+            for slot in sorted(self.dirty)
+            if slot in self.positions
+        ]
+        self.seq += 1
+        frame = {
+            "type": "cursors",
+            "data": {"seq": self.seq, "cursors": cursors, "gone": sorted(self.gone)},
+        }
+        self.dirty.clear()
+        self.gone.clear()
+        return json.dumps(frame, separators=(",", ":"))
+
+    def _drop(self, slot: int) -> None:
+        if self.positions.pop(slot, None) is not None:
+            self.gone.add(slot)
+        self.last_seen.pop(slot, None)
+        self.dirty.discard(slot)
+
+
+class CursorRelay:
+    """Keeps the latest cursor per user and fans changes out once per tick.
+
+    Cursor messages are never persisted: a move only overwrites the user's
+    entry, and each room with activity broadcasts at most one pre-encoded
+    ``cursors`` frame per tick, however many moves arrived in between.
+    """
+
+    def __init__(self, tick: float, stale_after: float, broadcast: BroadcastText):
+        self.tick = tick
+        self.stale_after = stale_after
+        self._broadcast = broadcast
+        self._rooms: Dict[str, CursorRoom] = {}
+
+    def attach(self, diagram_id: str, user_id: str, user_name: str) -> int:
+        """Register a session and return the slot its cursor is published under."""
+        room = self._rooms.setdefault(diagram_id, CursorRoom())
+        slot = room.next_slot
+        room.next_slot += 1
+        room.users[user_id] = (slot, user_name)
+        return slot
+
+    def detach(self, diagram_id: str, user_id: str) -> None:
+        room = self._rooms.get(diagram_id)
+        if room is None:
+            return
+        entry = room.users.pop(user_id, None)
+        if entry is not None:
+            room._drop(entry[0])
+        if room.gone:
+            # Let the others know the cursor went away on the next tick
+            self._ensure_ticker(diagram_id, room)
+        elif not room.users and room.ticker is None:
+            del self._rooms[diagram_id]
+
+    def move(self, diagram_id: str, user_id: str, data: Any) -> bool:
+        """Record a user's latest cursor. Returns False for unusable payloads."""
+        room = self._rooms.get(diagram_id)
+        entry = room.users.get(user_id) if room is not None else None
+        position = parse_cursor(data)
+        if entry is None or position is None:
+            return False
+        slot = entry[0]
+        room.last_seen[slot] = asyncio.get_running_loop().time()
+        if room.positions.get(slot) != position:
+            room.positions[slot] = position
+            room.dirty.add(slot)
+        self._ensure_ticker(diagram_id, room)
+        return True
+
+    def _ensure_ticker(self, diagram_id: str, room: CursorRoom) -> None:
+        if room.ticker is None:
+            room.ticker = asyncio.get_running_loop().create_task(
+                self._run(diagram_id, room)
+            )
+
+    async def _run(self, diagram_id: str, room: CursorRoom) -> None:
+        """Tick while the room has live cursors, then stop until the next move."""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await asyncio.sleep(self.tick)
+                frame = room.take_frame(loop.time(), self.stale_after)
+                if frame is not None:
+                    try:
+                        await self._broadcast(diagram_id, frame)
+                    except Exception:
+                        logging.exception(f"Failed to broadcast cursors for {diagram_id}")
+                if not room.positions and not room.gone:
+                    break
+        finally:
+            room.ticker = None
+            if not room.users and self._rooms.get(diagram_id) is room:
+                del self._rooms[diagram_id]
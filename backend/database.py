@@ -1,26 +1,232 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+import logging
 import os
+import threading
+import time
+from typing import Callable, Dict, Optional
 from dotenv import load_dotenv
 
+from config import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+)
+
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional read replica for read-only queries; see storage.SQLAlchemyStorage
+SQLALCHEMY_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL or "",
-    connect_args={"sslmode": "require"}
-    if SQLALCHEMY_DATABASE_URL and "localhost" not in SQLALCHEMY_DATABASE_URL
-    else {},
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Sessions are bound to the engine lazily, the first time one is needed
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
+_engine_lock = threading.Lock()
+_pool_ready = threading.Event()
+
+_LOCAL_HOSTS = {None, "", "localhost", "127.0.0.1", "::1"}
+
+
+class DatabaseNotConfigured(RuntimeError):
+    """DATABASE_URL is not set, so there is no database to connect to."""
+
+
+def _connect_args(url: str) -> dict:
+    """Require SSL for remote Postgres servers unless the URL says otherwise."""
+    if not url.startswith("postgres"):
+        return {}
+    parsed = make_url(url)
+    if parsed.host in _LOCAL_HOSTS or "sslmode" in parsed.query:
+        return {}
+    return {"sslmode": "require"}
+
+
+class MeteredQueuePool(QueuePool):
+    """A QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+def create_pooled_engine(url: str) -> Engine:
+    """Create an engine with the configured pool settings."""
+    parsed = make_url(url)
+    options = {
+        "connect_args": _connect_args(url),
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    sqlite_memory = parsed.get_backend_name() == "sqlite" and (
+        parsed.database in (None, "", ":memory:")
+    )
+    # In-memory SQLite keeps one connection per thread; there is nothing to size
+    if not sqlite_memory:
+        options.update(
+            poolclass=MeteredQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return create_engine(url, **options)
+
+
+def get_engine() -> Engine:
+    """Get the engine sessions are bound to, creating it on first use."""
+    if SessionLocal.kw.get("bind") is None:
+        with _engine_lock:
+            if SessionLocal.kw.get("bind") is None:
+                if not SQLALCHEMY_DATABASE_URL:
+                    raise DatabaseNotConfigured("DATABASE_URL is not set")
+                SessionLocal.configure(
+                    bind=create_pooled_engine(SQLALCHEMY_DATABASE_URL)
+                )
+    return SessionLocal.kw["bind"]
+
+
+def get_replica_engine() -> Optional[Engine]:
+    """The read replica engine, or None when no replica is configured."""
+    if ReplicaSessionLocal.kw.get("bind") is None and SQLALCHEMY_REPLICA_URL:
+        with _engine_lock:
+            if ReplicaSessionLocal.kw.get("bind") is None:
+                ReplicaSessionLocal.configure(
+                    bind=create_pooled_engine(SQLALCHEMY_REPLICA_URL)
+                )
+    return ReplicaSessionLocal.kw.get("bind")
+
+
+def new_session() -> Session:
+    """Open a session, creating the engine if needed."""
+    get_engine()
+    return SessionLocal()
+
+
+def new_replica_session() -> Optional[Session]:
+    """Open a session on the read replica, or None without one."""
+    if get_replica_engine() is None:
+        return None
+    return ReplicaSessionLocal()
+
+
+def pool_metrics() -> Dict[str, dict]:
+    """Occupancy and checkout waits of the primary and replica pools."""
+    # Only engines that already exist: a scrape must not open the replica
+    engines = {
+        "primary": SessionLocal.kw.get("bind"),
+        "replica": ReplicaSessionLocal.kw.get("bind"),
+    }
+    metrics = {}
+    for name, engine in engines.items():
+        if engine is None:
+            continue
+        pool = engine.pool
+        stats = {}
+        if isinstance(pool, QueuePool):
+            stats.update(
+                checked_out=pool.checkedout(),
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                # Negative while the pool has not yet opened pool_size connections
+                overflow=max(pool.overflow(), 0),
+            )
+        if isinstance(pool, MeteredQueuePool):
+            stats.update(
+                checkouts=pool.checkouts,
+                timeouts=pool.timeouts,
+                wait_seconds_total=round(pool.wait_seconds_total, 6),
+                wait_seconds_max=round(pool.wait_seconds_max, 6),
+            )
+        metrics[name] = stats
+    return metrics
+
+
+def open_pool_connections(connections: int) -> None:
+    """Open and check pooled connections, leaving them idle in the pool."""
+    engine = get_engine()
+    opened = []
+    try:
+        for _ in range(max(connections, 1)):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        # Returning them together leaves them idle in the pool
+        for conn in opened:
+            conn.close()
+
+
+def warm_up_pool(
+    connections: int,
+    warm_up: Callable[[int], None] = open_pool_connections,
+    retry_delay: float = 2.0,
+) -> None:
+    """Run ``warm_up`` until it succeeds, then mark the pool ready.
+
+    Meant to run in a background thread so startup is not blocked on the
+    database handshake. Without a configured database there is nothing to
+    retry, and the pool stays unready.
+    """
+    while True:
+        try:
+            warm_up(connections)
+            _pool_ready.set()
+            logging.info(f"Database pool warmed with {max(connections, 1)} connections")
+            return
+        except DatabaseNotConfigured as exc:
+            logging.error(f"Database warmup skipped: {exc}")
+            return
+        except Exception as exc:
+            logging.warning(f"Database warmup failed, retrying: {exc}")
+            time.sleep(retry_delay)
+
+
+def start_pool_warmup(
+    connections: int, warm_up: Callable[[int], None] = open_pool_connections
+) -> threading.Thread:
+    """Warm the connection pool in a daemon thread."""
+    thread = threading.Thread(
+        target=warm_up_pool,
+        args=(connections, warm_up),
+        name="db-warmup",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def is_pool_ready() -> bool:
+    """Whether the connection pool has been warmed up."""
+    return _pool_ready.is_set()
+
 
 def get_db():
-    db = SessionLocal()
+    db = new_session()
     try:
         yield db
     finally:
@@ -0,0 +1,308 @@
+"""Graceful drain before a restart, handing room state to the next process."""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import random
+import secrets
+import signal
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from capture import session_recorder
+from events import event_log
+from presence import Broadcast
+from services import diagram_service
+from spectators import SpectatorHub
+
+# "Service Restart": reconnect, possibly to another process
+RESTART_CLOSE_CODE = 1012
+
+# Tells this process's handoff files from its successor's. PIDs do not: in a
+# container the server is PID 1 before and after a restart.
+INSTANCE_ID = uuid.uuid4().hex
+
+
+def _encode(hint: dict) -> str:
+    return json.dumps(hint, separators=(",", ":"))
+
+
+class DrainCoordinator:
+    """Empties this process for a restart without dropping collaboration state.
+
+    ``drain`` turns new sockets away, writes out the event log and captures,
+    and snapshots every room's element locks and editor sessions to
+    ``handoff-<instance>.json`` in ``handoff_dir``. It then closes every socket with
+    code 1012 and a JSON reason: the diagram ``version`` the room was at, a
+    ``retry_ms`` hint jittered over ``retry_jitter_ms`` so a room does not
+    reconnect all at once, and for editors a one-time ``resume`` token.
+
+    The next process loads fresh handoff files at startup, and again when a
+    token it does not know arrives, since it may have started before the old
+    one drained; such rescans happen at most once per ``rescan_interval``. Handed-off locks are held for their users meanwhile. An
+    editor reconnecting with its token keeps its user id and so its locks;
+    locks whose user has not come back within ``handoff_ttl`` are released.
+    """
+
+    def __init__(
+        self,
+        handoff_dir: str,
+        retry_jitter_ms: int,
+        handoff_ttl: float,
+        spectators: SpectatorHub,
+        broadcast: Broadcast,
+        instance: str = INSTANCE_ID,
+        rescan_interval: float = 1.0,
+    ):
+        self.handoff_dir = handoff_dir
+        self.instance = instance
+        self._retry_jitter_ms = retry_jitter_ms
+        self._handoff_ttl = handoff_ttl
+        self._spectators = spectators
+        self._broadcast = broadcast
+        self._rescan_interval = rescan_interval
+        self._next_rescan = 0.0
+        self._drain: Optional[asyncio.Future] = None
+        # resume token -> (diagram_id, user_id, user_name, deadline)
+        self._sessions: Dict[str, Tuple[str, str, str, float]] = {}
+        # (diagram_id, element_id, user_id, deadline) held for returning users
+        self._held: List[Tuple[str, str, str, float]] = []
+        self._returned: Set[str] = set()
+        self._loaded: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    # Draining
+
+    @property
+    def draining(self) -> bool:
+        return self._drain is not None
+
+    def refusal(self) -> str:
+        """Close reason for sockets that arrive while draining."""
+        return _encode({"retry_ms": self._retry_ms()})
+
+    async def drain(self) -> dict:
+        """Hand off and close every room; later calls share the first drain."""
+        if self._drain is None:
+            self._drain = asyncio.ensure_future(self._run())
+        return await asyncio.shield(self._drain)
+
+    async def _run(self) -> dict:
+        rooms, closing = self._snapshot()
+        path = await asyncio.get_running_loop().run_in_executor(
+            None, self._write, rooms
+        )
+        # Events and captures first, in case the process is killed mid-close
+        await event_log.flush()
+        await session_recorder.close()
+        for websocket, reason in closing:
+            try:
+                await websocket.close(code=RESTART_CLOSE_CODE, reason=reason)
+            except Exception:
+                pass
+        result = {
+            "rooms": len(rooms),
+            "connections": len(closing),
+            "locks": sum(len(room["locks"]) for room in rooms.values()),
+            "handoff": path,
+        }
+        logging.info(f"Drained: {result}")
+        return result
+
+    def _retry_ms(self) -> int:
+        return random.randint(0, max(self._retry_jitter_ms, 0))
+
+    def _snapshot(self) -> Tuple[Dict[str, dict], List[tuple]]:
+        """Each room's state, and every socket with its close reason."""
+        rooms: Dict[str, dict] = {}
+        closing = []
+        for diagram_id in diagram_service.rooms():
+            cached = diagram_service.get_diagram_xml(diagram_id)
+            version = cached.version if cached else None
+            sessions = []
+            for websocket in list(diagram_service.get_connections(diagram_id)):
+                session = diagram_service.get_session(websocket)
+                if session is None:
+                    continue
+                token = secrets.token_urlsafe(12)
+                sessions.append(
+                    {
+                        "resume": token,
+                        "user_id": session.user_id,
+                        "user_name": session.user_name,
+                    }
+                )
+                hint = {"version": version, "retry_ms": self._retry_ms()}
+                closing.append((websocket, _encode({**hint, "resume": token})))
+            locks = diagram_service.get_element_locks(diagram_id)
+            rooms[diagram_id] = {
+                "version": version,
+                "sessions": sessions,
+                "locks": {
+                    element_id: {"user_id": lock.user_id, "user_name": lock.user_name}
+                    for element_id, lock in locks.items()
+                },
+            }
+        for diagram_id in self._spectators.rooms():
+            version = rooms.get(diagram_id, {}).get("version")
+            for websocket in list(self._spectators.connections(diagram_id)):
+                hint = {"version": version, "retry_ms": self._retry_ms()}
+                closing.append((websocket, _encode(hint)))
+        return rooms, closing
+
+    def _write(self, rooms: Dict[str, dict]) -> str:
+        os.makedirs(self.handoff_dir, exist_ok=True)
+        path = os.path.join(self.handoff_dir, f"handoff-{self.instance}.json")
+        snapshot = {
+            "instance": self.instance,
+            "written_at": time.time(),
+            "rooms": rooms,
+        }
+        with open(f"{path}.tmp", "w", encoding="utf-8") as handoff:
+            json.dump(snapshot, handoff)
+        os.replace(f"{path}.tmp", path)
+        return path
+
+    def install_signal_handler(self, name: str) -> None:
+        """Drain on signal ``name``, then let the signal do what it did before.
+
+        Under uvicorn that is a graceful shutdown, which would otherwise
+        close every socket before the handoff is written. Before 0.29 uvicorn
+        handles the signal on the event loop, where it cannot be chained; the
+        drained process then stops itself with the other shutdown signal,
+        which uvicorn handles the same way.
+        """
+        if not name:
+            return
+        sig = getattr(signal, name)
+        previous = signal.getsignal(sig)
+        loop = asyncio.get_running_loop()
+        on_loop = False
+
+        def forward(_: asyncio.Task) -> None:
+            loop.remove_signal_handler(sig)
+            if on_loop:
+                other = signal.SIGTERM if sig == signal.SIGINT else signal.SIGINT
+                signal.raise_signal(other)
+                return
+            signal.signal(sig, previous if previous is not None else signal.SIG_DFL)
+            signal.raise_signal(sig)
+
+        def on_signal() -> None:
+            # Forwarded once the drain (perhaps started by an admin) is done
+            loop.add_signal_handler(sig, lambda: None)
+            self._track(loop.create_task(self.drain())).add_done_callback(forward)
+
+        try:
+            on_loop = loop.remove_signal_handler(sig)
+            loop.add_signal_handler(sig, on_signal)
+        except (ValueError, RuntimeError, NotImplementedError):
+            # Signals can only be handled on the main thread's loop
+            logging.info(f"Not draining on {name}: no signal handling here")
+
+    # Taking over
+
+    async def restore(self) -> int:
+        """Load handoff files written by processes that drained; returns rooms."""
+        snapshots = await asyncio.get_running_loop().run_in_executor(
+            None, self._read_new
+        )
+        rooms = 0
+        for snapshot in snapshots:
+            deadline = snapshot["written_at"] + self._handoff_ttl
+            for diagram_id, room in snapshot["rooms"].items():
+                rooms += 1
+                await self._restore_room(diagram_id, room, deadline)
+            self._track(asyncio.create_task(self._expire_at(deadline)))
+        if snapshots:
+            logging.info(f"Restored {rooms} rooms from {len(snapshots)} handoffs")
+        return rooms
+
+    async def resume(self, diagram_id: str, token: Optional[str]) -> Optional[dict]:
+        """The handed-off identity a reconnecting editor's token stands for."""
+        if not token:
+            return None
+        if token not in self._sessions and time.monotonic() >= self._next_rescan:
+            # Unknown tokens are cheap to send; reading the directory is not
+            self._next_rescan = time.monotonic() + self._rescan_interval
+            await self.restore()
+        entry = self._sessions.pop(token, None)
+        if entry is None or entry[0] != diagram_id or entry[3] < time.time():
+            return None
+        self._returned.add(entry[1])
+        return {"user_id": entry[1], "user_name": entry[2]}
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _read_new(self) -> List[dict]:
+        """Fresh handoff files of other processes not loaded yet; stale ones go."""
+        snapshots = []
+        for path in glob.glob(os.path.join(self.handoff_dir, "handoff-*.json")):
+            try:
+                if time.time() - os.path.getmtime(path) > self._handoff_ttl:
+                    os.remove(path)
+                    continue
+                key = f"{path}:{os.path.getmtime(path)}"
+                if key in self._loaded:
+                    continue
+                with open(path, encoding="utf-8") as handoff:
+                    snapshot = json.load(handoff)
+            except (OSError, ValueError) as exc:
+                logging.warning(f"Skipping handoff file {path}: {exc}")
+                continue
+            self._loaded.add(key)
+            if snapshot.get("instance") != self.instance:
+                snapshots.append(snapshot)
+        return snapshots
+
+    async def _restore_room(self, diagram_id: str, room: dict, deadline: float) -> None:
+        for session in room["sessions"]:
+            self._sessions[session["resume"]] = (
+                diagram_id,
+                session["user_id"],
+                session["user_name"],
+                deadline,
+            )
+        current = diagram_service.get_element_locks(diagram_id)
+        for element_id, lock in room["locks"].items():
+            if element_id in current:
+                # Someone took it since the handoff was written
+                continue
+            diagram_service.lock_element(
+                diagram_id, element_id, lock["user_id"], lock["user_name"]
+            )
+            self._held.append((diagram_id, element_id, lock["user_id"], deadline))
+            await self._broadcast(
+                diagram_id,
+                {"type": "element_locked", "data": {"element_id": element_id, **lock}},
+            )
+
+    async def _expire_at(self, deadline: float) -> None:
+        """Release held locks whose users did not come back in time."""
+        await asyncio.sleep(max(deadline - time.time(), 0))
+        now = time.time()
+        expired = [held for held in self._held if held[3] <= now]
+        self._held = [held for held in self._held if held[3] > now]
+        for diagram_id, element_id, user_id, _ in expired:
+            if user_id in self._returned:
+                continue
+            if diagram_service.unlock_element(diagram_id, element_id, user_id):
+                await self._broadcast(
+                    diagram_id,
+                    {"type": "element_unlocked", "data": {"element_id": element_id}},
+                )
+        # Only users with locks still held need remembering
+        self._returned &= {held[2] for held in self._held}
+        self._sessions = {
+            token: entry for token, entry in self._sessions.items() if entry[3] > now
+        }
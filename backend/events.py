@@ -0,0 +1,338 @@
+"""Append-only collaboration event log, written in group-committed batches."""
+
+import asyncio
+import glob
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Deque, List, Optional
+
+from config import (
+    EVENT_LOG_BATCH_SIZE,
+    EVENT_LOG_FLUSH_MS,
+    EVENT_LOG_QUEUE_SIZE,
+    EVENT_LOG_SPILL_DIR,
+    EVENT_LOG_SPILL_MAX_BYTES,
+)
+from services import diagram_service
+from storage import Event, StorageBackend, as_utc
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class EventLog:
+    """Records who joined, left, locked and edited, without blocking the loop.
+
+    ``record`` only appends to an in-memory queue. A background task drains
+    it with one multi-row insert per batch (group commit), as soon as
+    ``batch_size`` events are waiting or ``flush_interval`` has passed.
+
+    The queue is bounded: when the database falls behind, the oldest batch
+    is appended to this process's JSON lines spill file in ``spill_dir``,
+    on a spill thread so the loop never waits for the disk. Once the queue
+    has drained, the spill thread's file is closed by renaming it, and
+    closed files are claimed by renaming them again, so with several
+    workers each one is replayed exactly once. Files still being written
+    are only claimed when their process has died. Other processes' files
+    are looked for every ``rescan_interval`` seconds rather than on every
+    flush. Events that would take this process past ``spill_max_bytes``
+    on disk are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        storage: StorageBackend,
+        batch_size: int,
+        flush_interval: float,
+        max_queue: int,
+        spill_dir: str,
+        spill_max_bytes: int,
+        rescan_interval: float = 60.0,
+    ):
+        self.storage = storage
+        self._batch_size = max(batch_size, 1)
+        self._flush_interval = flush_interval
+        self._max_queue = max(max_queue, self._batch_size)
+        self._spill_dir = spill_dir
+        self._spill_max_bytes = spill_max_bytes
+        self._rescan_interval = rescan_interval
+        self._queue: Deque[Event] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        # The writer and an explicit flush() must not replay the same file
+        self._replaying = threading.Lock()
+        # One thread appends in order; closing the file waits for its lock
+        self._spiller = ThreadPoolExecutor(1, thread_name_prefix="event-spill")
+        self._spilling: Optional[Future] = None
+        self._spill_lock = threading.Lock()
+        # Whether this process has spilled events that are not closed yet
+        self._backlog = False
+        self._next_scan = 0.0
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.dropped = 0
+
+    def record(
+        self,
+        diagram_id: str,
+        event_type: str,
+        user_id: Optional[str] = None,
+        user_name: Optional[str] = None,
+        **data: Any,
+    ) -> None:
+        """Queue an event; it is written within one flush interval."""
+        self._queue.append(
+            {
+                "diagram_id": diagram_id,
+                "occurred_at": datetime.now(timezone.utc),
+                "type": event_type,
+                "user_id": user_id,
+                "user_name": user_name,
+                "data": data,
+            }
+        )
+        if len(self._queue) > self._max_queue:
+            self._spill_later(self._take(self._batch_size))
+        self._ensure_writer()
+        if len(self._queue) >= self._batch_size:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+        }
+
+    def query(
+        self,
+        diagram_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        event_type: Optional[str] = None,
+        limit: int = 1000,
+    ) -> List[Event]:
+        """Events written so far for a diagram, in ``[start, end)``, oldest first."""
+        return self.storage.query_events(
+            diagram_id,
+            as_utc(start) if start else None,
+            as_utc(end) if end else None,
+            event_type,
+            limit,
+        )
+
+    async def flush(self) -> None:
+        """Write everything queued, then replay spill files if the queue is empty."""
+        loop = asyncio.get_running_loop()
+        await self._spilled()
+        while self._queue:
+            batch = self._take(self._batch_size)
+            try:
+                await loop.run_in_executor(None, self.storage.append_events, batch)
+            except Exception as exc:
+                logging.warning(f"Event log write failed, will retry: {exc}")
+                self._queue.extendleft(reversed(batch))
+                if len(self._queue) > self._max_queue:
+                    self._spill_later(self._take(len(self._queue) - self._max_queue))
+                await self._spilled()
+                return
+            self.written += len(batch)
+            self.batches += 1
+        await self._spilled()
+        try:
+            await loop.run_in_executor(None, self._replay_spill)
+        except Exception as exc:
+            self._backlog = True
+            logging.warning(f"Replaying spilled events failed, will retry: {exc}")
+
+    async def close(self) -> None:
+        """Stop the writer and flush; whatever cannot be written is spilled."""
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        await self.flush()
+        if self._queue:
+            self._spill_later(self._take(len(self._queue)))
+        await self._spilled()
+        self._wakeup = None
+
+    def _take(self, count: int) -> List[Event]:
+        return [self._queue.popleft() for _ in range(min(count, len(self._queue)))]
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            spilling = self._spilling is not None and not self._spilling.done()
+            if not self._queue and not self._backlog and not spilling:
+                # Idle; the next record() starts a new writer
+                return
+
+    # Spilling
+
+    def _spill_path(self) -> str:
+        return os.path.join(self._spill_dir, f"spilling-{os.getpid()}.jsonl")
+
+    def _closed_path(self) -> str:
+        return os.path.join(self._spill_dir, f"events-{os.getpid()}.jsonl")
+
+    def _spill_later(self, events: List[Event]) -> None:
+        if events:
+            self._spilling = self._spiller.submit(self._spill, events)
+
+    async def _spilled(self) -> None:
+        """Wait until everything handed to the spill thread is on disk."""
+        if self._spilling is not None:
+            await asyncio.wrap_future(self._spilling)
+
+    def _spill(self, events: List[Event]) -> None:
+        if not events:
+            return
+        with self._spill_lock:
+            try:
+                self._append_spill(events)
+            except OSError as exc:
+                self.dropped += len(events)
+                logging.error(f"Event log spill failed; dropped {len(events)}: {exc}")
+
+    def _append_spill(self, events: List[Event]) -> None:
+        os.makedirs(self._spill_dir, exist_ok=True)
+        path = self._spill_path()
+        size = sum(
+            os.path.getsize(spill)
+            for spill in (path, self._closed_path())
+            if os.path.exists(spill)
+        )
+        lines = []
+        for event in events:
+            line = json.dumps(
+                {**event, "occurred_at": event["occurred_at"].isoformat()}
+            )
+            if size + len(line) + 1 > self._spill_max_bytes:
+                self.dropped += 1
+                continue
+            size += len(line) + 1
+            lines.append(line + "\n")
+        with open(path, "a", encoding="utf-8") as spill:
+            spill.writelines(lines)
+        self.spilled += len(lines)
+        self._backlog = self._backlog or bool(lines)
+        if len(lines) < len(events):
+            dropped = len(events) - len(lines)
+            logging.error(f"Event log spill is full; dropped {dropped} events")
+
+    def _close_spill(self) -> None:
+        """Rename this process's spill file so it can be claimed."""
+        # Appends hold the same lock, so nothing is written after the rename
+        with self._spill_lock:
+            path = self._spill_path()
+            if os.path.exists(path) and not os.path.exists(self._closed_path()):
+                os.rename(path, self._closed_path())
+            self._backlog = os.path.exists(path)
+
+    def _claim_spill(self) -> Optional[str]:
+        """Rename a closed spill file nobody else is replaying to claim it."""
+        claimed = os.path.join(self._spill_dir, f"replaying-{os.getpid()}.jsonl")
+        if os.path.exists(claimed):
+            return claimed
+        candidates = glob.glob(os.path.join(self._spill_dir, "events-*.jsonl"))
+        for prefix in ("spilling-", "replaying-"):
+            # Files a crashed worker was writing or replaying
+            for path in glob.glob(os.path.join(self._spill_dir, f"{prefix}*.jsonl")):
+                pid = os.path.basename(path)[len(prefix) : -len(".jsonl")]
+                if pid.isdigit() and not _pid_alive(int(pid)):
+                    candidates.append(path)
+        for path in candidates:
+            try:
+                os.rename(path, claimed)
+                return claimed
+            except OSError:
+                continue
+        return None
+
+    def _replay_spill(self) -> None:
+        """Close this process's spill file, then write back every closed one."""
+        with self._replaying:
+            if not self._backlog and time.monotonic() < self._next_scan:
+                return
+            self._next_scan = time.monotonic() + self._rescan_interval
+            if not os.path.isdir(self._spill_dir):
+                return
+            self._close_spill()
+            path = self._claim_spill()
+            while path is not None:
+                self._replay_file(path)
+                path = self._claim_spill()
+
+    def _replay_file(self, path: str) -> None:
+        with open(path, "rb") as spill:
+            while True:
+                offset = spill.tell()
+                lines = list(itertools.islice(spill, self._batch_size))
+                if not lines:
+                    break
+                batch = [self._decode(line) for line in lines if line.strip()]
+                try:
+                    self.storage.append_events(batch)
+                except Exception:
+                    # Keep only what is not written yet for the next attempt
+                    spill.seek(offset)
+                    with open(f"{path}.tmp", "wb") as rest:
+                        shutil.copyfileobj(spill, rest)
+                    os.replace(f"{path}.tmp", path)
+                    raise
+                self.written += len(batch)
+                self.batches += 1
+        os.remove(path)
+        logging.info(f"Replayed spilled events from {path}")
+
+    @staticmethod
+    def _decode(line: bytes) -> Event:
+        event = json.loads(line)
+        event["occurred_at"] = datetime.fromisoformat(event["occurred_at"])
+        return event
+
+
+# Global event log, written through the diagram storage backend
+event_log = EventLog(
+    diagram_service.storage,
+    EVENT_LOG_BATCH_SIZE,
+    EVENT_LOG_FLUSH_MS / 1000,
+    EVENT_LOG_QUEUE_SIZE,
+    EVENT_LOG_SPILL_DIR,
+    EVENT_LOG_SPILL_MAX_BYTES,
+)
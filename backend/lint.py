@@ -0,0 +1,354 @@
+"""Incremental BPMN lint engine with pluggable rules."""
+
+import asyncio
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from background import LatestOnlyWorker
+
+_MODEL = "{http://www.omg.org/spec/BPMN/20100524/MODEL}"
+_BPMNDI = "{http://www.omg.org/spec/BPMN/20100524/DI}"
+
+_CONTAINERS = {"process", "subProcess", "transaction", "adHocSubProcess"}
+_NOT_FLOW_NODES = {
+    "sequenceFlow",
+    "messageFlow",
+    "association",
+    "textAnnotation",
+    "group",
+    "dataObject",
+    "dataObjectReference",
+    "dataStoreReference",
+    "laneSet",
+    "lane",
+    "participant",
+    "collaboration",
+}
+
+
+@dataclass
+class LintElement:
+    """A semantic BPMN element as seen by lint rules."""
+
+    id: str
+    kind: str
+    name: str
+    parent: Optional[str]
+    attrs: Dict[str, str]
+    incoming: List[str] = field(default_factory=list)
+    outgoing: List[str] = field(default_factory=list)
+    has_shape: bool = False
+
+    def signature(self) -> tuple:
+        return (self.kind, self.parent, tuple(sorted(self.attrs.items())), self.has_shape)
+
+    @property
+    def is_flow_node(self) -> bool:
+        return self.parent is not None and self.kind not in _NOT_FLOW_NODES
+
+
+class DiagramModel:
+    """Semantic elements of a diagram keyed by id, with sequence flows resolved."""
+
+    def __init__(self, xml: str):
+        self.elements: Dict[str, LintElement] = {}
+        root = ET.fromstring(xml)
+        self._collect(root, None)
+        for element in self.elements.values():
+            if element.kind == "sequenceFlow":
+                source = self.elements.get(element.attrs.get("sourceRef", ""))
+                target = self.elements.get(element.attrs.get("targetRef", ""))
+                if source is not None:
+                    source.outgoing.append(element.id)
+                if target is not None:
+                    target.incoming.append(element.id)
+        for shape in root.iter(f"{_BPMNDI}BPMNShape"):
+            element = self.elements.get(shape.get("bpmnElement", ""))
+            if element is not None:
+                element.has_shape = True
+        for edge in root.iter(f"{_BPMNDI}BPMNEdge"):
+            element = self.elements.get(edge.get("bpmnElement", ""))
+            if element is not None:
+                element.has_shape = True
+
+    def _collect(self, node, parent: Optional[str]) -> None:
+        for child in node:
+            if not isinstance(child.tag, str) or not child.tag.startswith(_MODEL):
+                continue
+            element_id = child.get("id")
+            if element_id:
+                kind = child.tag[len(_MODEL) :]
+                self.elements[element_id] = LintElement(
+                    id=element_id,
+                    kind=kind,
+                    name=child.get("name", ""),
+                    parent=parent,
+                    attrs={k: v for k, v in child.attrib.items() if k != "id"},
+                )
+                self._collect(child, element_id)
+            else:
+                self._collect(child, parent)
+
+    def children(self, element_id: str) -> Iterable[LintElement]:
+        return (e for e in self.elements.values() if e.parent == element_id)
+
+    def related(self, element_id: str) -> Set[str]:
+        """Ids whose lint result may change when this element changes."""
+        element = self.elements.get(element_id)
+        if element is None:
+            return set()
+        related = {element_id, *element.incoming, *element.outgoing}
+        if element.parent:
+            related.add(element.parent)
+        if element.kind == "sequenceFlow":
+            for role in ("sourceRef", "targetRef"):
+                if element.attrs.get(role):
+                    related.add(element.attrs[role])
+        return related
+
+
+@dataclass
+class Rule:
+    code: str
+    severity: str
+    check: Callable[[LintElement, DiagramModel], Optional[str]]
+    applies_to: Callable[[LintElement], bool]
+
+
+RULES: List[Rule] = []
+
+
+def lint_rule(
+    code: str,
+    severity: str = "error",
+    applies_to: Callable[[LintElement], bool] = lambda element: True,
+):
+    """Register a rule: a function of (element, model) returning a message or None.
+
+    ``applies_to`` selects the elements the rule is run against. Rules only
+    see the element and the model, so an element is re-checked exactly when
+    it or something it is related to (its flows, their ends, its container)
+    changed.
+    """
+
+    def register(check):
+        RULES.append(Rule(code, severity, check, applies_to))
+        return check
+
+    return register
+
+
+@lint_rule("dangling-flow", applies_to=lambda e: e.kind == "sequenceFlow")
+def _dangling_flow(element: LintElement, model: DiagramModel) -> Optional[str]:
+    missing = [
+        role
+        for role in ("sourceRef", "targetRef")
+        if element.attrs.get(role) not in model.elements
+    ]
+    if missing:
+        ends = " and ".join(role[: -len("Ref")] for role in missing)
+        return f"Sequence flow is not connected at its {ends}"
+    return None
+
+
+@lint_rule("gateway-no-outgoing", applies_to=lambda e: e.kind.endswith("Gateway"))
+def _gateway_no_outgoing(element: LintElement, model: DiagramModel) -> Optional[str]:
+    return None if element.outgoing else "Gateway has no outgoing sequence flow"
+
+
+@lint_rule("start-event-required", applies_to=lambda e: e.kind in _CONTAINERS)
+def _start_event_required(element: LintElement, model: DiagramModel) -> Optional[str]:
+    children = list(model.children(element.id))
+    if not any(child.is_flow_node for child in children):
+        return None
+    if any(child.kind == "startEvent" for child in children):
+        return None
+    return "Process has no start event"
+
+
+@lint_rule("start-event-incoming", applies_to=lambda e: e.kind == "startEvent")
+def _start_event_incoming(element: LintElement, model: DiagramModel) -> Optional[str]:
+    return "Start event has an incoming sequence flow" if element.incoming else None
+
+
+@lint_rule("end-event-outgoing", applies_to=lambda e: e.kind == "endEvent")
+def _end_event_outgoing(element: LintElement, model: DiagramModel) -> Optional[str]:
+    return "End event has an outgoing sequence flow" if element.outgoing else None
+
+
+@lint_rule(
+    "no-incoming",
+    severity="warning",
+    applies_to=lambda e: e.is_flow_node
+    and e.kind not in ("startEvent", "boundaryEvent"),
+)
+def _no_incoming(element: LintElement, model: DiagramModel) -> Optional[str]:
+    return None if element.incoming else "Element has no incoming sequence flow"
+
+
+@lint_rule(
+    "no-outgoing",
+    severity="warning",
+    applies_to=lambda e: e.is_flow_node
+    and e.kind != "endEvent"
+    and not e.kind.endswith("Gateway"),
+)
+def _no_outgoing(element: LintElement, model: DiagramModel) -> Optional[str]:
+    return None if element.outgoing else "Element has no outgoing sequence flow"
+
+
+@lint_rule(
+    "missing-di",
+    severity="warning",
+    applies_to=lambda e: e.is_flow_node or e.kind == "sequenceFlow",
+)
+def _missing_di(element: LintElement, model: DiagramModel) -> Optional[str]:
+    return None if element.has_shape else "Element is not drawn on the diagram"
+
+
+Issue = Dict[str, str]
+
+
+@dataclass
+class LintResult:
+    version: int
+    model: Optional[DiagramModel]
+    issues: Dict[str, List[Issue]]
+    checked: int = 0
+
+    def as_list(self) -> List[Issue]:
+        return [
+            issue
+            for element_id in sorted(self.issues)
+            for issue in self.issues[element_id]
+        ]
+
+    def message(self) -> Dict[str, Any]:
+        issues = self.as_list()
+        return {
+            "type": "validation_result",
+            "data": {
+                "version": self.version,
+                "issues": issues,
+                "errors": sum(1 for issue in issues if issue["severity"] == "error"),
+                "warnings": sum(1 for issue in issues if issue["severity"] == "warning"),
+            },
+        }
+
+
+def _check(element: LintElement, model: DiagramModel, rules: List[Rule]) -> List[Issue]:
+    issues = []
+    for rule in rules:
+        if rule.applies_to(element):
+            message = rule.check(element, model)
+            if message:
+                issues.append(
+                    {
+                        "rule": rule.code,
+                        "severity": rule.severity,
+                        "element_id": element.id,
+                        "message": message,
+                    }
+                )
+    return issues
+
+
+def lint(
+    xml: str,
+    version: int,
+    previous: Optional[LintResult] = None,
+    rules: Optional[List[Rule]] = None,
+) -> LintResult:
+    """Lint a diagram, re-checking only elements affected since ``previous``."""
+    rules = RULES if rules is None else rules
+    try:
+        model = DiagramModel(xml)
+    except ET.ParseError as exc:
+        issue = {
+            "rule": "xml-syntax",
+            "severity": "error",
+            "element_id": "",
+            "message": f"Invalid XML: {exc}",
+        }
+        return LintResult(version, None, {"": [issue]})
+
+    if previous is None or previous.model is None:
+        affected = set(model.elements)
+    else:
+        old = previous.model.elements
+        changed = {
+            element_id
+            for element_id in set(old) | set(model.elements)
+            if element_id not in old
+            or element_id not in model.elements
+            or old[element_id].signature() != model.elements[element_id].signature()
+        }
+        affected = set()
+        for element_id in changed:
+            affected |= model.related(element_id) | previous.model.related(element_id)
+
+    issues = {
+        element_id: element_issues
+        for element_id, element_issues in (previous.issues if previous else {}).items()
+        if element_id in model.elements and element_id not in affected
+    }
+    checked = 0
+    for element_id in affected:
+        element = model.elements.get(element_id)
+        if element is None:
+            continue
+        checked += 1
+        element_issues = _check(element, model, rules)
+        if element_issues:
+            issues[element_id] = element_issues
+    return LintResult(version, model, issues, checked)
+
+
+Broadcast = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class DiagramValidator:
+    """Lints saved versions off the event loop and pushes results to the room.
+
+    Results are cached per diagram and version, and each run starts from the
+    previous version's result so only the affected elements are re-checked.
+    """
+
+    def __init__(self, broadcast: Broadcast, cache_size: int = 256):
+        self._broadcast = broadcast
+        self._cache_size = cache_size
+        self._results: "OrderedDict[str, LintResult]" = OrderedDict()
+        self._background = LatestOnlyWorker(self._publish, "Validation")
+
+    def get(self, diagram_id: str, version: int) -> Optional[LintResult]:
+        result = self._results.get(diagram_id)
+        if result is None or result.version != version:
+            return None
+        self._results.move_to_end(diagram_id)
+        return result
+
+    async def validate(self, diagram_id: str, version: int, xml: str) -> LintResult:
+        """Lint a diagram version in a worker thread, reusing the cached result."""
+        result = self.get(diagram_id, version)
+        if result is not None:
+            return result
+        previous = self._results.get(diagram_id)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, lint, xml, version, previous)
+        current = self._results.get(diagram_id)
+        if current is None or current.version <= version:
+            self._results[diagram_id] = result
+            self._results.move_to_end(diagram_id)
+            while len(self._results) > self._cache_size:
+                self._results.popitem(last=False)
+        return result
+
+    def schedule(self, diagram_id: str, version: int, xml: str) -> None:
+        """Validate a saved version in the background and broadcast the result."""
+        self._background.schedule(diagram_id, version, xml)
+
+    async def _publish(self, diagram_id: str, version: int, xml: str) -> None:
+        result = await self.validate(diagram_id, version, xml)
+        await self._broadcast(diagram_id, result.message())
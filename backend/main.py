@@ -5,7 +5,6 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import uvicorn
 
 from config import (
@@ -13,19 +12,39 @@ from config import (
     APP_VERSION,
     CORS_ORIGINS,
     STATIC_DIR,
-    STATIC_ASSETS_DIR,
+    STATIC_MAX_INMEMORY_BYTES,
     PORT,
     HOST,
+    DB_WARMUP_CONNECTIONS,
+    DRAIN_SIGNAL,
+    WORKERS,
 )
-from routes import router
+from capture import session_recorder
+from database import start_pool_warmup
+from events import event_log
+from routes import drainer, router
 from services import diagram_service
+from static_assets import static_manifest
+from thumbnails import thumbnail_renderer
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Seed the database with examples if it's new/empty
-    diagram_service.seed_database()
+    # Connect to the database in the background; /healthz/ready reports when done.
+    # Example diagrams are seeded by migration or `python manage.py seed`.
+    start_pool_warmup(DB_WARMUP_CONNECTIONS, diagram_service.storage.warm_up)
+    # Read and precompress the frontend build once so requests never touch disk
+    static_manifest.load(STATIC_DIR, STATIC_MAX_INMEMORY_BYTES)
+    # Take over locks and sessions from a process that drained for a restart
+    await drainer.restore()
+    drainer.install_signal_handler(DRAIN_SIGNAL)
     yield
+    await drainer.close()
+    # Write out queued collaboration events (spilled to disk if that fails)
+    await event_log.close()
+    await session_recorder.close()
+    thumbnail_renderer.shutdown()
+    diagram_service.storage.close()
 
 
 # Create FastAPI app
@@ -56,15 +75,16 @@ async def custom_404_handler(request: Request, exc: HTTPException):
     )
 
 
-# Serve built frontend assets (the React build keeps JS/CSS under ./static)
-if STATIC_ASSETS_DIR.exists():
-    app.mount("/static", StaticFiles(directory=str(STATIC_ASSETS_DIR)), name="static")
-elif STATIC_DIR.exists():
-    # Fallback in case the build output is copied directly without the nested folder
-    app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+# Built frontend assets (including /static/*) are served from the in-memory
+# manifest by the catch-all route in routes.py
 
 # Include routes
 app.include_router(router)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host=HOST, port=PORT)
+    if WORKERS > 1:
+        from workers import run_sharded
+
+        run_sharded(WORKERS)
+    else:
+        uvicorn.run(app, host=HOST, port=PORT)
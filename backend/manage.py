@@ -0,0 +1,29 @@
+"""Command line tasks that should not run on every application boot."""
+
+import argparse
+import sys
+
+from services import diagram_service
+
+
+def seed(_args: argparse.Namespace) -> int:
+    """Insert the example diagrams into an empty database."""
+    if diagram_service.seed_database():
+        print("Seeded example diagrams.")
+    else:
+        print("Database already has diagrams; nothing to seed.")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="BPMN Collaborator management tasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("seed", help="Seed example diagrams if the database is empty").set_defaults(
+        func=seed
+    )
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""Element-level three-way merge of concurrent BPMN diagram edits."""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from xml.dom import Node, minidom
+
+# Attributes that point at other elements; entries left pointing at a removed
+# element are dropped so the merged diagram never has dangling references
+_REFERENCE_ATTRIBUTES = ("bpmnElement", "sourceRef", "targetRef", "attachedToRef")
+# Child elements whose text is a reference, e.g. <bpmn2:incoming>Flow_1</...>
+_REFERENCE_CHILDREN = ("incoming", "outgoing", "flowNodeRef")
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit(":", 1)[-1]
+
+
+def _spacing(node) -> str:
+    """The whitespace just before ``node``, to keep the source's layout."""
+    previous = node.previousSibling
+    if previous is not None and previous.nodeType == Node.TEXT_NODE:
+        if not previous.data.strip():
+            return previous.data
+    return ""
+
+
+def _canonical(node) -> tuple:
+    """Formatting-independent form of a node, used to compare content."""
+    if node.nodeType == Node.TEXT_NODE or node.nodeType == Node.CDATA_SECTION_NODE:
+        return ("#text", node.data.strip())
+    return (
+        node.tagName,
+        tuple(sorted(node.attributes.items())),
+        tuple(
+            _canonical(child)
+            for child in node.childNodes
+            if child.nodeType in (Node.ELEMENT_NODE, Node.CDATA_SECTION_NODE)
+            or (child.nodeType == Node.TEXT_NODE and child.data.strip())
+        ),
+    )
+
+
+class Entry:
+    """One element with an ``id``: its own attributes and content, minus id'd children.
+
+    Children that have an id are entries of their own, linked by ``parent``,
+    so adding a task to a process does not count as changing the process.
+    The whitespace around the element is kept for writing it back, but is
+    not part of its content.
+    """
+
+    __slots__ = (
+        "id",
+        "id_at",
+        "parent",
+        "tag",
+        "attrs",
+        "text",
+        "blobs",
+        "content",
+        "before",
+        "closing",
+    )
+
+    def __init__(self, element, parent: Optional[str]):
+        self.id = element.getAttribute("id")
+        self.parent = parent
+        self.tag = element.tagName
+        self.attrs = {
+            name: value for name, value in element.attributes.items() if name != "id"
+        }
+        self.id_at = list(element.attributes.keys()).index("id")
+        texts = []
+        self.blobs = []
+        for child in element.childNodes:
+            if child.nodeType == Node.ELEMENT_NODE:
+                if not child.getAttribute("id"):
+                    self.blobs.append(child)
+            elif child.nodeType in (Node.TEXT_NODE, Node.CDATA_SECTION_NODE):
+                if child.data.strip():
+                    texts.append(child.data.strip())
+        self.text = " ".join(texts)
+        self.content = (self.text, tuple(_canonical(blob) for blob in self.blobs))
+        self.before = _spacing(element)
+        last = element.lastChild
+        closing = last is not None and last.nodeType == Node.TEXT_NODE
+        self.closing = last.data if closing and not last.data.strip() else ""
+
+    def key(self) -> tuple:
+        return (self.tag, tuple(sorted(self.attrs.items())), self.content, self.parent)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Entry) and self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+
+class ElementMap:
+    """A diagram as a map of element id to entry, in document order."""
+
+    def __init__(self, xml: str):
+        document = minidom.parseString(xml.encode("utf-8"))
+        self.root = document.documentElement
+        if not self.root.getAttribute("id"):
+            # The root is always an entry, even without an id of its own
+            self.root.setAttribute("id", "__root__")
+        self.entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._collect(self.root, None)
+
+    def _collect(self, element, parent: Optional[str]) -> None:
+        entry = Entry(element, parent)
+        self.entries[entry.id] = entry
+        for child in element.childNodes:
+            if child.nodeType == Node.ELEMENT_NODE and child.getAttribute("id"):
+                self._collect(child, entry.id)
+
+
+def _merge_value(base, ours, theirs):
+    """Three-way merge of a single value; on conflict the incoming edit wins."""
+    if ours == theirs or base == ours:
+        return theirs
+    if base == theirs:
+        return ours
+    return theirs
+
+
+def _merge_entry(
+    base: Optional[Entry], ours: Optional[Entry], theirs: Optional[Entry]
+) -> Optional[Entry]:
+    if ours == theirs or base == ours:
+        return theirs
+    if base == theirs:
+        return ours
+    # Both sides changed the element. A deletion wins over a modification so
+    # that no edit can resurrect half of a removed element.
+    if ours is None or theirs is None:
+        return None
+    if base is None:
+        return theirs
+
+    merged = Entry.__new__(Entry)
+    merged.id = theirs.id
+    merged.id_at = theirs.id_at
+    merged.before = theirs.before
+    merged.closing = theirs.closing
+    merged.tag = _merge_value(base.tag, ours.tag, theirs.tag)
+    merged.parent = _merge_value(base.parent, ours.parent, theirs.parent)
+    merged.attrs = {}
+    for name in sorted(set(base.attrs) | set(ours.attrs) | set(theirs.attrs)):
+        value = _merge_value(
+            base.attrs.get(name), ours.attrs.get(name), theirs.attrs.get(name)
+        )
+        if value is not None:
+            merged.attrs[name] = value
+    source = ours if base.content == theirs.content else theirs
+    merged.text, merged.blobs, merged.content = source.text, source.blobs, source.content
+    return merged
+
+
+def _merged_order(ours: ElementMap, theirs: ElementMap) -> List[str]:
+    """Our document order, with ids only the incoming side has placed after
+    their nearest preceding sibling from the incoming document."""
+    order = list(ours.entries)
+    positions = {element_id: index for index, element_id in enumerate(order)}
+    previous = None
+    for element_id in theirs.entries:
+        if element_id not in positions:
+            index = positions[previous] + 1 if previous in positions else len(order)
+            order.insert(index, element_id)
+            positions = {eid: i for i, eid in enumerate(order)}
+        previous = element_id
+    return order
+
+
+def _prune_references(merged: Dict[str, Entry]) -> None:
+    """Drop entries whose parent or referenced element no longer exists."""
+    changed = True
+    while changed:
+        changed = False
+        for element_id, entry in list(merged.items()):
+            dangling = entry.parent is not None and entry.parent not in merged
+            dangling = dangling or any(
+                entry.attrs.get(name) and entry.attrs[name] not in merged
+                for name in _REFERENCE_ATTRIBUTES
+            )
+            if dangling:
+                del merged[element_id]
+                changed = True
+
+
+def _build(document, entry: Entry, children: Dict[str, List[Entry]], ids: set):
+    element = document.createElement(entry.tag)
+    attrs = list(entry.attrs.items())
+    attrs.insert(entry.id_at, ("id", entry.id))
+    for name, value in attrs:
+        element.setAttribute(name, value)
+    if entry.text:
+        element.appendChild(document.createTextNode(entry.text))
+
+    def append(node, spacing: str) -> None:
+        if spacing:
+            element.appendChild(document.createTextNode(spacing))
+        element.appendChild(node)
+
+    for blob in entry.blobs:
+        if _local_name(blob.tagName) in _REFERENCE_CHILDREN:
+            reference = "".join(
+                node.data for node in blob.childNodes if node.nodeType == Node.TEXT_NODE
+            ).strip()
+            if reference and reference not in ids:
+                continue
+        append(document.importNode(blob, True), _spacing(blob))
+    for child in children.get(entry.id, []):
+        append(_build(document, child, children, ids), child.before)
+    if entry.closing and element.hasChildNodes():
+        element.appendChild(document.createTextNode(entry.closing))
+    return element
+
+
+def merge_diagrams(base_xml: str, ours_xml: str, theirs_xml: str) -> str:
+    """Merge an incoming edit (``theirs``) made against ``base`` into ``ours``.
+
+    Elements changed on only one side keep that change. When both sides
+    changed the same element, attributes are merged one by one, and the
+    incoming edit wins on the attributes and content both sides touched.
+    The result is the same for the same three inputs, so every client that
+    receives it converges on one document.
+
+    The document is written back with the whitespace of the elements it was
+    built from rather than reformatted. When the merge comes out equal to
+    one side, that side's XML is returned unchanged.
+    """
+    base, ours, theirs = ElementMap(base_xml), ElementMap(ours_xml), ElementMap(theirs_xml)
+
+    merged: Dict[str, Entry] = {}
+    for element_id in _merged_order(ours, theirs):
+        entry = _merge_entry(
+            base.entries.get(element_id),
+            ours.entries.get(element_id),
+            theirs.entries.get(element_id),
+        )
+        if entry is not None:
+            merged[element_id] = entry
+
+    root_id = theirs.root.getAttribute("id")
+    if root_id not in merged:
+        return ours_xml
+    merged[root_id].parent = None
+    _prune_references(merged)
+    for side, xml in ((theirs, theirs_xml), (ours, ours_xml)):
+        if list(merged.items()) == list(side.entries.items()):
+            return xml
+
+    children: Dict[str, List[Entry]] = {}
+    for entry in merged.values():
+        if entry.parent is not None:
+            children.setdefault(entry.parent, []).append(entry)
+
+    document = minidom.Document()
+    root = _build(document, merged[root_id], children, set(merged))
+    if root_id == "__root__":
+        root.removeAttribute("id")
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + root.toxml()
+
+
+class RevisionHistory:
+    """The last few XML revisions of each diagram, used as merge bases."""
+
+    def __init__(self, max_revisions: int = 50):
+        self._max_revisions = max_revisions
+        self._revisions: Dict[str, "OrderedDict[int, str]"] = {}
+
+    def get(self, diagram_id: str, version: int) -> Optional[str]:
+        return self._revisions.get(diagram_id, {}).get(version)
+
+    def put(self, diagram_id: str, version: int, xml: str) -> None:
+        revisions = self._revisions.setdefault(diagram_id, OrderedDict())
+        revisions[version] = xml
+        while len(revisions) > self._max_revisions:
+            revisions.popitem(last=False)
+
+    def forget(self, diagram_id: str) -> None:
+        self._revisions.pop(diagram_id, None)
@@ -0,0 +1,301 @@
+"""In-process metrics in Prometheus text format, and sampled span tracing."""
+
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from config import TRACE_BUFFER_SIZE, TRACE_SAMPLE_RATE
+
+Labels = Tuple[str, ...]
+Collect = Callable[[], Dict[Labels, float]]
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Collect] = None,
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._collect = collect
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def remove(self, *labels: str) -> None:
+        """Drop a label set, e.g. once its room is closed."""
+        with self._lock:
+            self._values.pop(labels, None)
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        values = self._collect() if self._collect else dict(self._values)
+        return [("", labels, value) for labels, value in sorted(values.items())]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            names = self.label_names
+            if suffix == "_bucket":
+                names = names + ("le",)
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(names, labels)} "
+                f"{_format_value(value)}"
+            )
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (last is +Inf)..., sum]
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def remove(self, *labels: str) -> None:
+        with self._lock:
+            self._series.pop(labels, None)
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        samples = []
+        for labels, values in sorted(series.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = labels + (_format_value(bound),)
+                samples.append(("_bucket", le, cumulative))
+            samples.append(("_sum", labels, values[-1]))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    """Metrics in registration order, rendered on scrape."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels=(), collect=None) -> Counter:
+        return self.register(Counter(name, help, labels, collect))
+
+    def gauge(self, name: str, help: str, labels=(), collect=None) -> Gauge:
+        return self.register(Gauge(name, help, labels, collect))
+
+    def histogram(
+        self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class _Trace:
+    __slots__ = ("trace_id", "start", "spans", "done")
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self.spans: List[dict] = []
+        self.done = False
+
+
+class _Span:
+    __slots__ = ("tracer", "trace", "name", "attributes", "start", "parent", "token")
+
+    def __init__(self, tracer: "Tracer", trace: _Trace, name: str, attributes):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> "_Span":
+        self.parent = _current_span.get()
+        self.token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.start
+        _current_span.reset(self.token)
+        span = {
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.start) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            **self.attributes,
+        }
+        if exc_type is not None:
+            span["error"] = exc_type.__name__
+        self.trace.spans.append(span)
+        if self.parent is None:
+            self.tracer._finish(self.trace)
+
+
+class _NoSpan:
+    """Inside a trace that is not sampled: entering and leaving does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+class _Unsampled:
+    """Root of work that is not sampled, so nested spans are not sampled either."""
+
+    __slots__ = ("token",)
+
+    def __enter__(self) -> None:
+        self.token = _current_span.set(_NO_SPAN)
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self.token)
+
+
+_NO_SPAN = _NoSpan()
+_current_span: ContextVar[Any] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Head-sampled span tracing into a ring buffer of recent traces.
+
+    Whether a trace is kept is decided once, when its root span starts, so
+    the ``1 - sample_rate`` share of unsampled work pays for one random
+    number and setting a context variable. Nested spans join the trace of the span
+    they run in, including across ``await``; timers and tasks started from
+    a trace that outlive it are not recorded.
+    """
+
+    def __init__(self, sample_rate: float, buffer_size: int):
+        self.sample_rate = sample_rate
+        self._traces: Deque[dict] = deque(maxlen=max(buffer_size, 1))
+
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        if parent is _NO_SPAN or (parent is not None and parent.trace.done):
+            return _NO_SPAN
+        if parent is not None:
+            return _Span(self, parent.trace, name, attributes)
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return _Unsampled()
+        return _Span(self, _Trace(), name, attributes)
+
+    def _finish(self, trace: _Trace) -> None:
+        trace.done = True
+        # Children finish first; list spans in the order they started
+        spans = sorted(reversed(trace.spans), key=lambda span: span["start_ms"])
+        self._traces.append({"trace_id": trace.trace_id, "spans": spans})
+
+    def recent(self) -> List[dict]:
+        return list(self._traces)
+
+
+registry = Registry()
+tracer = Tracer(TRACE_SAMPLE_RATE, TRACE_BUFFER_SIZE)
+
+ws_message_seconds = registry.histogram(
+    "bpmn_ws_message_seconds",
+    "Time to handle one WebSocket message, by message type.",
+    ("type",),
+)
+broadcast_seconds = registry.histogram(
+    "bpmn_broadcast_seconds", "Time to fan one message out to a room."
+)
+broadcast_recipients = registry.histogram(
+    "bpmn_broadcast_recipients",
+    "Connections one broadcast was sent to.",
+    buckets=COUNT_BUCKETS,
+)
+storage_seconds = registry.histogram(
+    "bpmn_storage_seconds",
+    "Duration of storage calls (one session and commit each), by operation.",
+    ("operation",),
+)
+room_bytes_in = registry.counter(
+    "bpmn_room_received_bytes_total",
+    "WebSocket payload bytes received from clients, by room.",
+    ("diagram_id",),
+)
+room_bytes_out = registry.counter(
+    "bpmn_room_sent_bytes_total",
+    "WebSocket payload bytes sent to clients, by room.",
+    ("diagram_id",),
+)
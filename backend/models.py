@@ -1,7 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import Optional
-from sqlalchemy import Column, Integer, DateTime, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import JSON, BigInteger, Column, Integer, DateTime, Index, Text, Uuid
 from sqlalchemy.sql import func
 import uuid
 from database import Base
@@ -12,7 +11,8 @@ class BPMNDiagram(Base):
 
     __tablename__ = "bpmn_diagrams"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Native uuid on Postgres, CHAR(32) elsewhere
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     name = Column(Text, nullable=False)
     bpmn_xml = Column(Text, nullable=False)
     version = Column(Integer, nullable=False, default=1)
@@ -24,6 +24,25 @@ class BPMNDiagram(Base):
     )
 
 
+class CollaborationEvent(Base):
+    """SQLAlchemy model for the append-only collaboration event log."""
+
+    __tablename__ = "collaboration_events"
+
+    # SQLite only autoincrements INTEGER primary keys
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    diagram_id = Column(Uuid, nullable=False)
+    occurred_at = Column(DateTime(timezone=True), nullable=False)
+    type = Column(Text, nullable=False)
+    user_id = Column(Text, nullable=True)
+    user_name = Column(Text, nullable=True)
+    data = Column(JSON, nullable=True)
+
+    __table_args__ = (
+        Index("ix_collaboration_events_diagram_time", "diagram_id", "occurred_at"),
+    )
+
+
 class DiagramCreate(BaseModel):
     """Request model for creating a new diagram."""
 
@@ -37,6 +56,7 @@ class DiagramResponse(BaseModel):
     id: str
     name: str
     xml: str
+    version: int = 1
     created_at: str
     updated_at: str
 
@@ -56,6 +76,25 @@ class DiagramsListResponse(BaseModel):
     diagrams: list[DiagramListItem]
 
 
+class DiagramImportRecord(BaseModel):
+    """A single diagram record read from a bulk import stream."""
+
+    id: Optional[str] = Field(None, description="Diagram ID to preserve on import")
+    name: str = Field(..., min_length=1, max_length=200, description="Diagram name")
+    xml: str = Field(..., min_length=1, description="BPMN XML content")
+    version: Optional[int] = Field(None, ge=1, description="Diagram version")
+
+
+class ImportResult(BaseModel):
+    """Response model for a bulk import."""
+
+    imported: int
+    skipped: int
+    cursor: int
+    elapsed_seconds: float
+    diagrams_per_second: float
+
+
 class ElementLock(BaseModel):
     """Model for element lock information."""
 
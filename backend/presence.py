@@ -0,0 +1,105 @@
+"""Coalesced presence tracking for diagram rooms."""
+
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+Broadcast = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class RoomPresence:
+    """Roster of a single room and the last version published to clients."""
+
+    def __init__(self):
+        # user_name -> number of open sessions using that name
+        self.sessions: Counter = Counter()
+        self.published: frozenset = frozenset()
+        self.version = 0
+        self.last_flush = 0.0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def roster(self) -> List[str]:
+        """The roster as of the last published version."""
+        return sorted(self.published)
+
+    def take_update(self) -> Optional[Dict[str, Any]]:
+        """Diff the live roster against the published one and bump the version.
+
+        Returns None when joins and leaves cancelled out since the last flush.
+        """
+        current = frozenset(name for name, count in self.sessions.items() if count > 0)
+        joined = current - self.published
+        left = self.published - current
+        if not joined and not left:
+            return None
+        self.published = current
+        self.version += 1
+        return {
+            "type": "presence_update",
+            "data": {
+                "joined": sorted(joined),
+                "left": sorted(left),
+                "version": self.version,
+            },
+        }
+
+
+class PresenceCoalescer:
+    """Debounces joins and leaves into at most one presence frame per interval.
+
+    Clients get the published roster and its version in ``diagram_state`` and
+    apply each following ``presence_update`` diff in order.
+    """
+
+    def __init__(self, interval: float, broadcast: Broadcast):
+        self.interval = interval
+        self._broadcast = broadcast
+        self._rooms: Dict[str, RoomPresence] = {}
+
+    def snapshot(self, diagram_id: str) -> Dict[str, Any]:
+        """Published roster and version to embed in ``diagram_state``."""
+        room = self._rooms.get(diagram_id)
+        if room is None:
+            return {"users": [], "presence_version": 0}
+        return {"users": room.roster(), "presence_version": room.version}
+
+    def user_joined(self, diagram_id: str, user_name: str) -> None:
+        room = self._rooms.setdefault(diagram_id, RoomPresence())
+        room.sessions[user_name] += 1
+        self._schedule(diagram_id, room)
+
+    def user_left(self, diagram_id: str, user_name: str) -> None:
+        room = self._rooms.get(diagram_id)
+        if room is None or room.sessions[user_name] <= 0:
+            return
+        room.sessions[user_name] -= 1
+        if room.sessions[user_name] <= 0:
+            del room.sessions[user_name]
+        self._schedule(diagram_id, room)
+
+    def _schedule(self, diagram_id: str, room: RoomPresence) -> None:
+        if room.flush_handle is not None:
+            return
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, room.last_flush + self.interval - loop.time())
+        room.flush_handle = loop.call_later(
+            delay, lambda: asyncio.create_task(self._flush(diagram_id))
+        )
+
+    async def _flush(self, diagram_id: str) -> None:
+        room = self._rooms.get(diagram_id)
+        if room is None:
+            return
+        room.flush_handle = None
+        room.last_flush = asyncio.get_running_loop().time()
+        update = room.take_update()
+        if not room.sessions:
+            # Nobody is left to receive updates, so forget the room
+            del self._rooms[diagram_id]
+        if update is None:
+            return
+        try:
+            await self._broadcast(diagram_id, update)
+        except Exception:
+            logging.exception(f"Failed to broadcast presence for {diagram_id}")
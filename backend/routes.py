@@ -1,12 +1,80 @@
 """API routes for the application."""
 
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Request
-from fastapi.responses import FileResponse
-from typing import Dict, Any
-
-from models import DiagramCreate, DiagramResponse, DiagramsListResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from datetime import datetime
+from typing import Dict, Any, Optional
+import json
+import secrets
+import tempfile
+import time
+
+from models import (
+    DiagramCreate,
+    DiagramResponse,
+    DiagramsListResponse,
+    ImportResult,
+    UserSession,
+)
 from services import diagram_service
-from config import STATIC_DIR
+from database import is_pool_ready, pool_metrics
+from cache import choose_encoding, etag_matches
+from capture import session_recorder
+from chunked import ChunkError, ChunkReceiver, chunk_count, iter_chunks
+from config import (
+    ADMIN_TOKEN,
+    CURSOR_STALE_MS,
+    CURSOR_TICK_MS,
+    DRAIN_HANDOFF_DIR,
+    DRAIN_HANDOFF_TTL_S,
+    DRAIN_RETRY_JITTER_MS,
+    IMPORT_BATCH_SIZE,
+    IMPORT_MAX_BYTES,
+    IMPORT_MAX_RECORD_BYTES,
+    EXPORT_PAGE_SIZE,
+    LINT_CACHE_SIZE,
+    PRESENCE_DEBOUNCE_MS,
+    SPECTATOR_INTERVAL_MS,
+    WORKER_CONTROL_TOKEN,
+    XML_CHUNK_MAX_BYTES,
+    XML_CHUNK_SIZE,
+    XML_UPLOAD_MAX_BYTES,
+)
+from cursors import CursorRelay
+from drain import RESTART_CLOSE_CODE, DrainCoordinator
+from events import event_log
+from lint import DiagramValidator
+from metrics import (
+    broadcast_recipients,
+    broadcast_seconds,
+    registry,
+    room_bytes_in,
+    room_bytes_out,
+    tracer,
+    ws_message_seconds,
+)
+from presence import PresenceCoalescer
+from spectators import SpectatorHub
+from static_assets import static_manifest
+from storage import StorageError
+from thumbnails import thumbnail_renderer
+from transfer import (
+    NDJSON_MEDIA_TYPE,
+    ZIP_MEDIA_TYPE,
+    ImportBatcher,
+    ImportRecordError,
+    ImportTooLargeError,
+    export_ndjson,
+    export_zip,
+    iter_ndjson_records,
+    iter_zip_records,
+)
 
 import logging
 
@@ -15,15 +83,65 @@ logging.basicConfig(level=logging.INFO)
 
 router = APIRouter()
 
+# Message types with their own latency series; anything else is "other"
+_MESSAGE_TYPES = {
+    "cursor",
+    "diagram_update",
+    "element_lock",
+    "element_unlock",
+    "ping",
+    "xml_upload_start",
+}
+_UPLOAD_TYPES = {"xml_upload_start", "xml_upload_abort"}
+
 
 @router.get("/", response_model=Dict[str, str])
-async def root():
+async def root(request: Request):
     """Root endpoint - serves static file in production or API info in dev."""
-    if STATIC_DIR.exists() and (STATIC_DIR / "index.html").exists():
-        return FileResponse(str(STATIC_DIR / "index.html"))
+    if static_manifest.index:
+        return static_manifest.index.response(request)
     return {"message": "BPMN Collaborator API", "status": "running"}
 
 
+@router.get("/healthz")
+async def healthz():
+    """Liveness probe - the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@router.get("/healthz/ready")
+async def healthz_ready():
+    """Readiness probe - passes once the database pool has been warmed up."""
+    if drainer.draining:
+        # Load balancers stop sending new connections here
+        return JSONResponse(status_code=503, content={"status": "draining"})
+    if is_pool_ready():
+        return {"status": "ready"}
+    return JSONResponse(status_code=503, content={"status": "warming"})
+
+
+@router.get("/healthz/db")
+async def healthz_db():
+    """Connection pool occupancy, checkout waits, replica routing and event log."""
+    return {**diagram_service.storage.metrics(), "event_log": event_log.stats()}
+
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus scrape endpoint."""
+    _require_admin(request)
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@router.get("/debug/traces")
+async def debug_traces(request: Request):
+    """The most recent sampled traces, each a list of timed spans."""
+    _require_admin(request)
+    return {"sample_rate": tracer.sample_rate, "traces": tracer.recent()}
+
+
 @router.get("/api/diagrams", response_model=DiagramsListResponse)
 async def list_diagrams():
     """List all diagrams."""
@@ -31,6 +149,95 @@ async def list_diagrams():
     return DiagramsListResponse(diagrams=diagrams)
 
 
+@router.get("/api/diagrams/export")
+async def export_diagrams(format: str = "ndjson", after: Optional[str] = None):
+    """Stream every diagram as NDJSON or a zip of BPMN files.
+
+    Pass the last exported diagram ID as ``after`` to resume an interrupted export.
+    """
+    if after is not None and diagram_service.resolve_id(after) is None:
+        raise HTTPException(
+            status_code=400, detail="after must be the ID of an exported diagram"
+        )
+    diagrams = diagram_service.iter_diagrams(after=after, page_size=EXPORT_PAGE_SIZE)
+    if format == "zip":
+        return StreamingResponse(
+            export_zip(diagrams),
+            media_type=ZIP_MEDIA_TYPE,
+            headers={"Content-Disposition": 'attachment; filename="diagrams.zip"'},
+        )
+    if format == "ndjson":
+        return StreamingResponse(export_ndjson(diagrams), media_type=NDJSON_MEDIA_TYPE)
+    raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'zip'")
+
+
+@router.post("/api/diagrams/import", response_model=ImportResult)
+async def import_diagrams(
+    request: Request, cursor: int = 0, batch_size: int = IMPORT_BATCH_SIZE
+):
+    """Import diagrams from an NDJSON or zip request body in batched transactions.
+
+    On failure the response carries the cursor of the last committed record;
+    re-sending the same body with that cursor resumes the import. Bodies over
+    the configured size limits are refused with 413.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    batcher = ImportBatcher(cursor, batch_size)
+
+    try:
+        if content_type == ZIP_MEDIA_TYPE:
+            # Zip archives keep their directory at the end, so spool to disk first
+            with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+                async for chunk in request.stream():
+                    if spool.tell() + len(chunk) > IMPORT_MAX_BYTES:
+                        raise ImportTooLargeError(
+                            0, f"Zip archives are limited to {IMPORT_MAX_BYTES} bytes"
+                        )
+                    spool.write(chunk)
+                spool.seek(0)
+                await run_in_threadpool(_import_zip, spool, batcher)
+        else:
+            records = iter_ndjson_records(request.stream(), IMPORT_MAX_RECORD_BYTES)
+            async for record in records:
+                if batcher.add(record):
+                    batcher.commit(
+                        await run_in_threadpool(
+                            diagram_service.import_diagrams, batcher.batch
+                        )
+                    )
+            if batcher.batch:
+                batcher.commit(
+                    await run_in_threadpool(diagram_service.import_diagrams, batcher.batch)
+                )
+    except ImportTooLargeError as exc:
+        raise HTTPException(
+            status_code=413,
+            detail={"error": str(exc), "record": exc.index, "cursor": batcher.cursor},
+        )
+    except ImportRecordError as exc:
+        raise HTTPException(
+            status_code=422,
+            detail={"error": str(exc), "record": exc.index, "cursor": batcher.cursor},
+        )
+    except StorageError:
+        logging.exception("Bulk import failed")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "Database error", "cursor": batcher.cursor},
+        )
+
+    return ImportResult(**batcher.result())
+
+
+def _import_zip(spool, batcher: ImportBatcher) -> None:
+    """Import every BPMN entry of a spooled zip archive."""
+    for record in iter_zip_records(spool, IMPORT_MAX_RECORD_BYTES, IMPORT_MAX_BYTES):
+        if batcher.add(record):
+            batcher.commit(diagram_service.import_diagrams(batcher.batch))
+    if batcher.batch:
+        batcher.commit(diagram_service.import_diagrams(batcher.batch))
+
+
 @router.get("/api/diagrams/{diagram_id}", response_model=DiagramResponse)
 async def get_diagram(diagram_id: str):
     """Get a specific diagram by ID."""
@@ -40,231 +247,698 @@ async def get_diagram(diagram_id: str):
     return DiagramResponse(**diagram)
 
 
+@router.get("/api/diagrams/{diagram_id}/xml")
+async def get_diagram_xml(diagram_id: str, request: Request):
+    """Serve the raw diagram XML with a version ETag and cached compression."""
+    cached = diagram_service.get_diagram_xml(diagram_id)
+    if not cached:
+        raise HTTPException(status_code=404, detail="Diagram not found")
+
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(
+        cached.body(encoding), media_type="application/xml", headers=headers
+    )
+
+
+@router.get("/api/diagrams/{diagram_id}/thumbnail.svg")
+async def get_diagram_thumbnail(diagram_id: str, request: Request):
+    """Serve an SVG preview of the diagram, rendered once per version."""
+    cached = diagram_service.get_diagram_xml(diagram_id)
+    if not cached:
+        raise HTTPException(status_code=404, detail="Diagram not found")
+
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    # Revalidation only needs the version, so nothing is rendered for a 304
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+
+    thumbnail = thumbnail_renderer.get(diagram_id, cached.version)
+    if thumbnail is None:
+        thumbnail = await thumbnail_renderer.render(
+            diagram_id, cached.version, cached.raw.decode("utf-8")
+        )
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(
+        thumbnail.body(encoding), media_type="image/svg+xml", headers=headers
+    )
+
+
+@router.get("/api/diagrams/{diagram_id}/issues")
+async def get_diagram_issues(diagram_id: str, request: Request):
+    """Lint the current version of a diagram; results are cached per version."""
+    cached = diagram_service.get_diagram_xml(diagram_id)
+    if not cached:
+        raise HTTPException(status_code=404, detail="Diagram not found")
+
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+
+    result = await validator.validate(
+        diagram_id, cached.version, cached.raw.decode("utf-8")
+    )
+    return JSONResponse(result.message()["data"], headers=headers)
+
+
+@router.get("/api/diagrams/{diagram_id}/events")
+async def get_diagram_events(
+    diagram_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    type: Optional[str] = None,
+    limit: int = 1000,
+):
+    """Collaboration events of a diagram in ``[start, end)``, oldest first."""
+    diagram_id = diagram_service.resolve_id(diagram_id)
+    if diagram_id is None:
+        raise HTTPException(status_code=404, detail="Diagram not found")
+    events = await run_in_threadpool(
+        event_log.query,
+        diagram_id,
+        start,
+        end,
+        type,
+        max(1, min(limit, 10000)),
+    )
+    return {
+        "events": [
+            {**event, "occurred_at": event["occurred_at"].isoformat()}
+            for event in events
+        ]
+    }
+
+
 @router.post("/api/diagrams", response_model=DiagramResponse, status_code=201)
 async def create_diagram(diagram: DiagramCreate):
     """Create a new diagram."""
     new_diagram = diagram_service.create_diagram(
         name=diagram.name, initial_xml=diagram.initial_xml
     )
+    thumbnail_renderer.schedule(
+        new_diagram["id"], new_diagram["version"], new_diagram["xml"]
+    )
     return DiagramResponse(**new_diagram)
 
 
 @router.websocket("/ws/{diagram_id}")
 async def websocket_endpoint(websocket: WebSocket, diagram_id: str):
-    """WebSocket endpoint for real-time collaboration."""
+    """WebSocket endpoint for real-time collaboration.
+
+    Editors connecting with ``chunked=1`` receive the initial XML as binary
+    chunks after ``diagram_state``; any editor may upload a large diagram in
+    chunks (see chunked.py).
+    """
     await websocket.accept()
 
+    if drainer.draining:
+        await websocket.close(code=RESTART_CLOSE_CODE, reason=drainer.refusal())
+        return
+
+    if websocket.query_params.get("mode") == "view":
+        await _serve_spectator(websocket, diagram_id)
+        return
+
     # Get custom user name from query parameters if provided
     custom_user_name = websocket.query_params.get("user_name")
+    chunked = websocket.query_params.get("chunked") == "1"
 
-    # Verify diagram exists
-    diagram = diagram_service.get_diagram(diagram_id)
-    if not diagram:
+    # Verify diagram exists; its body comes from the XML cache when fresh
+    opened = diagram_service.open_diagram(diagram_id)
+    if not opened:
         await websocket.close(code=1008, reason="Diagram not found")
         return
+    canonical_id, cached = opened
+    diagram = {"id": canonical_id, "version": cached.version}
+
+    # Editors reconnecting after a drain elsewhere keep their identity and locks
+    resumed = await drainer.resume(diagram_id, websocket.query_params.get("resume"))
+    user_id = None
+    if resumed:
+        user_id = resumed["user_id"]
+        custom_user_name = custom_user_name or resumed["user_name"]
 
     # Create user session with optional custom name
     session = diagram_service.create_user_session(
-        diagram_id, websocket, custom_user_name
+        diagram_id, websocket, custom_user_name, user_id=user_id
     )
     diagram_service.add_connection(diagram_id, websocket)
+    # Others learn about the new user from the next coalesced presence_update
+    presence.user_joined(diagram_id, session.user_name)
+    event_log.record(diagram["id"], "join", session.user_id, session.user_name)
+    session_recorder.opened(diagram["id"], cached, websocket, session.user_name)
+    cursor_id = cursors.attach(diagram_id, session.user_id, session.user_name)
 
-    # Notify others of new user
-    await _broadcast_user_joined(diagram_id, session.user_name, websocket)
-    # Broadcast updated user list to all users
-    await _broadcast_user_list_to_all(diagram_id)
-
-    # Send current diagram state
+    # Send current diagram state, including the published roster
     locks = diagram_service.get_element_locks(diagram_id)
-    await websocket.send_json(
-        {
-            "type": "diagram_state",
-            "data": {
-                "xml": diagram["xml"],
-                "locks": {
-                    elem_id: {
-                        "user_id": lock.user_id,
-                        "user_name": lock.user_name,
-                    }
-                    for elem_id, lock in locks.items()
-                },
-                "my_user_name": session.user_name,  # Send the user's own name
-            },
+    state = {
+        "version": cached.version,
+        "locks": {
+            elem_id: {
+                "user_id": lock.user_id,
+                "user_name": lock.user_name,
+            }
+            for elem_id, lock in locks.items()
+        },
+        "my_user_name": session.user_name,  # Send the user's own name
+        "cursor_id": cursor_id,  # Slot of the user's own cursor in frames
+        **presence.snapshot(diagram_id),
+    }
+    if websocket.query_params.get("version") == str(cached.version):
+        # A reconnecting editor that already has this version skips the download
+        state["xml_unchanged"] = True
+        await _send(websocket, diagram_id, {"type": "diagram_state", "data": state})
+    elif chunked:
+        # The XML follows as transfer 0, straight from the cached bytes
+        size = len(cached.raw)
+        state["xml_transfer"] = {
+            "transfer": 0,
+            "size": size,
+            "chunks": chunk_count(size, XML_CHUNK_SIZE),
         }
-    )
-
-    # Send current users
-    await _send_user_list(diagram_id, websocket)
+        await _send(websocket, diagram_id, {"type": "diagram_state", "data": state})
+        await _send_chunks(websocket, diagram_id, 0, cached.raw)
+    else:
+        state = {"xml": cached.raw.decode("utf-8"), **state}
+        await _send(websocket, diagram_id, {"type": "diagram_state", "data": state})
 
+    uploads = ChunkReceiver(XML_UPLOAD_MAX_BYTES, XML_CHUNK_MAX_BYTES)
     try:
         while True:
-            data = await websocket.receive_json()
-            message_type = data.get("type")
-            logging.info(f"Received message of type: {message_type}")  # Debug print
-            if message_type == "diagram_update":
-                new_xml = data.get("data", {}).get("xml")
-                if new_xml:
-                    diagram_service.update_diagram(diagram_id, new_xml)
-                    locks = diagram_service.get_element_locks(diagram_id)
-                    await _broadcast_to_others(
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            frame = message.get("bytes")
+            if frame is not None:
+                room_bytes_in.inc(diagram_id, amount=len(frame))
+                label = "xml_chunk"
+                handled = _receive_chunk(websocket, diagram, session, uploads, frame)
+            else:
+                text = message["text"]
+                room_bytes_in.inc(diagram_id, amount=len(text.encode("utf-8")))
+                data = _parse_message(text)
+                if data is None:
+                    # Refused without dropping the connection
+                    await _send(
+                        websocket,
                         diagram_id,
                         {
-                            "type": "diagram_update",
-                            "data": {
-                                "xml": new_xml,
-                                "locks": {
-                                    elem_id: {
-                                        "user_id": lock.user_id,
-                                        "user_name": lock.user_name,
-                                    }
-                                    for elem_id, lock in locks.items()
-                                },
-                            },
-                            "user": session.user_name,
+                            "type": "error",
+                            "data": {"message": "Messages must be JSON objects"},
                         },
-                        websocket,
                     )
-
-            elif message_type == "element_lock":
-                element_id = data.get("data", {}).get("element_id")
-                # Skip root element and invalid IDs
-                if (
-                    element_id
-                    and element_id != "__implicitroot"
-                    and not element_id.startswith("__")
-                ):
-                    # Get previous element locked by this user (before locking new one)
-                    previous_locks = diagram_service.get_element_locks(diagram_id)
-                    previous_element_id = None
-                    for elem_id, lock in previous_locks.items():
-                        if lock.user_id == session.user_id and elem_id != element_id:
-                            previous_element_id = elem_id
-                            break
-
-                    # Lock the new element (this will automatically unlock previous element)
-                    diagram_service.lock_element(
-                        diagram_id, element_id, session.user_id, session.user_name
+                    continue
+                message_type = data.get("type")
+                if message_type not in _UPLOAD_TYPES:
+                    # Uploads are recorded once complete, as a diagram_update
+                    session_recorder.message(
+                        diagram["id"], websocket, session.user_name, data
                     )
+                # Client-chosen types must not create new metric series
+                label = message_type if message_type in _MESSAGE_TYPES else "other"
+                handled = _handle_message(
+                    websocket, diagram, session, uploads, message_type, data
+                )
+            started = time.perf_counter()
+            with tracer.span(f"ws.{label}", diagram_id=diagram_id):
+                await handled
+            ws_message_seconds.observe(time.perf_counter() - started, label)
 
-                    # Broadcast unlock for previous element if it existed
-                    if previous_element_id:
-                        await _broadcast_to_others(
-                            diagram_id,
-                            {
-                                "type": "element_unlocked",
-                                "data": {"element_id": previous_element_id},
-                            },
-                            websocket,
-                        )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Cleanup on disconnect, and when an error ends the handler
+        diagram_service.remove_connection(diagram_id, websocket)
+        if not drainer.draining:
+            # While draining, locks are handed off and the room is closing
+            await _broadcast_unlock_user_elements(
+                diagram_id, session.user_id, websocket
+            )
+        diagram_service.unlock_all_user_elements(diagram_id, session.user_id)
+        diagram_service.remove_user_session_by_websocket(websocket)
+        presence.user_left(diagram_id, session.user_name)
+        event_log.record(diagram["id"], "leave", session.user_id, session.user_name)
+        session_recorder.closed(diagram["id"], websocket)
+        cursors.detach(diagram_id, session.user_id)
+        if not diagram_service.get_connections(diagram_id):
+            # Keep per-room series to the rooms that are open
+            room_bytes_in.remove(diagram_id)
+            room_bytes_out.remove(diagram_id)
+
+
+def _parse_message(text: str) -> Optional[Dict[str, Any]]:
+    """A text frame as a message object, or None if it is not one."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def _handle_message(
+    websocket: WebSocket,
+    diagram: Dict[str, Any],
+    session: UserSession,
+    uploads: ChunkReceiver,
+    message_type: Optional[str],
+    data: Dict[str, Any],
+) -> None:
+    """Apply one message from an editor and tell the room about it."""
+    diagram_id = session.diagram_id
+    if message_type == "cursor":
+        # Only the latest position is kept
+        cursors.move(diagram_id, session.user_id, data.get("data"))
+
+    elif message_type == "diagram_update":
+        new_xml = data.get("data", {}).get("xml")
+        base_version = data.get("data", {}).get("base_version")
+        if not isinstance(base_version, int):
+            base_version = None
+        if new_xml:
+            await _apply_update(websocket, diagram, session, new_xml, base_version)
+
+    elif message_type == "xml_upload_start":
+        upload = data.get("data")
+        try:
+            uploads.start(upload if isinstance(upload, dict) else {})
+        except ChunkError as exc:
+            await _send(websocket, diagram_id, exc.message())
+
+    elif message_type == "xml_upload_abort":
+        uploads.abort(data.get("data", {}).get("transfer"))
+
+    elif message_type == "element_lock":
+        element_id = data.get("data", {}).get("element_id")
+        # Skip root element and invalid IDs
+        if (
+            element_id
+            and element_id != "__implicitroot"
+            and not element_id.startswith("__")
+        ):
+            # Get previous element locked by this user (before locking new one)
+            previous_locks = diagram_service.get_element_locks(diagram_id)
+            previous_element_id = None
+            for elem_id, lock in previous_locks.items():
+                if lock.user_id == session.user_id and elem_id != element_id:
+                    previous_element_id = elem_id
+                    break
+
+            # Lock the new element (this will automatically unlock previous element)
+            diagram_service.lock_element(
+                diagram_id, element_id, session.user_id, session.user_name
+            )
+            event_log.record(
+                diagram["id"],
+                "lock",
+                session.user_id,
+                session.user_name,
+                element_id=element_id,
+            )
 
-                    # Broadcast lock for new element
-                    await _broadcast_to_others(
-                        diagram_id,
-                        {
-                            "type": "element_locked",
-                            "data": {
-                                "element_id": element_id,
-                                "user_id": session.user_id,
-                                "user_name": session.user_name,
-                            },
-                        },
-                        websocket,
-                    )
+            # Broadcast unlock for previous element if it existed
+            if previous_element_id:
+                await _broadcast_to_others(
+                    diagram_id,
+                    {
+                        "type": "element_unlocked",
+                        "data": {"element_id": previous_element_id},
+                    },
+                    websocket,
+                )
+
+            # Broadcast lock for new element
+            await _broadcast_to_others(
+                diagram_id,
+                {
+                    "type": "element_locked",
+                    "data": {
+                        "element_id": element_id,
+                        "user_id": session.user_id,
+                        "user_name": session.user_name,
+                    },
+                },
+                websocket,
+            )
 
-            elif message_type == "element_unlock":
-                element_id = data.get("data", {}).get("element_id")
-                if element_id:
-                    if diagram_service.unlock_element(
-                        diagram_id, element_id, session.user_id
-                    ):
-                        await _broadcast_to_others(
-                            diagram_id,
-                            {
-                                "type": "element_unlocked",
-                                "data": {"element_id": element_id},
-                            },
-                            websocket,
-                        )
+    elif message_type == "element_unlock":
+        element_id = data.get("data", {}).get("element_id")
+        if element_id:
+            if diagram_service.unlock_element(diagram_id, element_id, session.user_id):
+                event_log.record(
+                    diagram["id"],
+                    "unlock",
+                    session.user_id,
+                    session.user_name,
+                    element_id=element_id,
+                )
+                await _broadcast_to_others(
+                    diagram_id,
+                    {
+                        "type": "element_unlocked",
+                        "data": {"element_id": element_id},
+                    },
+                    websocket,
+                )
+
+    elif message_type == "ping":
+        await _send(websocket, diagram_id, {"type": "pong"})
+
+
+async def _apply_update(
+    websocket: WebSocket,
+    diagram: Dict[str, Any],
+    session: UserSession,
+    new_xml: str,
+    base_version: Optional[int],
+) -> None:
+    """Store an editor's diagram, merging if needed, and send it to the room."""
+    diagram_id = session.diagram_id
+    # Storing, and merging a stale edit, must not hold up the event loop
+    result = await run_in_threadpool(
+        diagram_service.update_diagram, diagram_id, new_xml, base_version
+    )
+    if not result:
+        return
+    event_log.record(
+        diagram["id"],
+        "edit",
+        session.user_id,
+        session.user_name,
+        version=result["version"],
+        merged=result["merged"],
+    )
+    spectators.publish(diagram_id, result["version"], result["xml"], session.user_name)
+    thumbnail_renderer.schedule(diagram_id, result["version"], result["xml"])
+    validator.schedule(diagram_id, result["version"], result["xml"])
+    locks = diagram_service.get_element_locks(diagram_id)
+    message = {
+        "type": "diagram_update",
+        "data": {
+            "xml": result["xml"],
+            "version": result["version"],
+            "locks": {
+                elem_id: {
+                    "user_id": lock.user_id,
+                    "user_name": lock.user_name,
+                }
+                for elem_id, lock in locks.items()
+            },
+        },
+        "user": session.user_name,
+    }
+    await _broadcast_to_others(diagram_id, message, websocket)
+    if result["xml"] != new_xml:
+        # The sender's copy lacks the concurrent edits it was merged with.
+        # Otherwise an ack keeps its selection and undo history.
+        await _send(websocket, diagram_id, message)
+    else:
+        await _send(
+            websocket,
+            diagram_id,
+            {"type": "diagram_ack", "data": {"version": result["version"]}},
+        )
+
+
+async def _receive_chunk(
+    websocket: WebSocket,
+    diagram: Dict[str, Any],
+    session: UserSession,
+    uploads: ChunkReceiver,
+    frame: bytes,
+) -> None:
+    """Add a binary frame to the editor's upload; save the diagram once complete."""
+    diagram_id = session.diagram_id
+    try:
+        upload, complete = uploads.receive(frame)
+        if upload is None:
+            return
+        await _send(websocket, diagram_id, upload.progress())
+        if not complete:
+            return
+        new_xml = upload.text()
+    except ChunkError as exc:
+        await _send(websocket, diagram_id, exc.message())
+        return
+    # Captures replay it as the equivalent single message
+    session_recorder.message(
+        diagram["id"],
+        websocket,
+        session.user_name,
+        {
+            "type": "diagram_update",
+            "data": {"xml": new_xml, "base_version": upload.base_version},
+        },
+    )
+    await _apply_update(websocket, diagram, session, new_xml, upload.base_version)
 
-            elif message_type == "ping":
-                await websocket.send_json({"type": "pong"})
 
+@router.post("/internal/rooms/{diagram_id}/release")
+async def release_room(diagram_id: str, request: Request):
+    """Close a room's sockets so clients reconnect to the worker that now owns it.
+
+    Only available to the multi-worker router, which authenticates with the
+    per-launch WORKER_CONTROL_TOKEN.
+    """
+    token = request.headers.get("x-worker-token", "")
+    if not WORKER_CONTROL_TOKEN or not secrets.compare_digest(token, WORKER_CONTROL_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    connections = list(diagram_service.get_connections(diagram_id))
+    connections += list(spectators.connections(diagram_id))
+    for connection in connections:
+        try:
+            await connection.close(code=1012, reason="Room moved, reconnect")
+        except Exception:
+            pass
+    return {"released": len(connections)}
+
+
+def _require_admin(request: Request) -> None:
+    """Admin endpoints do not exist unless ADMIN_TOKEN is set and sent."""
+    token = request.headers.get("x-admin-token", "")
+    if not ADMIN_TOKEN or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.post("/admin/drain")
+async def drain(request: Request):
+    """Hand off locks and sessions and close every socket, before a restart."""
+    _require_admin(request)
+    return await drainer.drain()
+
+
+@router.post("/admin/rooms/{diagram_id}/capture")
+async def start_capture(diagram_id: str, request: Request):
+    """Start capturing what editors send to a room, for benchmarks/ws_replay.py."""
+    _require_admin(request)
+    diagram = diagram_service.get_diagram(diagram_id)
+    if not diagram:
+        raise HTTPException(status_code=404, detail="Diagram not found")
+    # Editors already connected are added with their next message
+    path = session_recorder.start(diagram["id"], diagram["version"], diagram["xml"])
+    return {"path": path}
+
+
+@router.delete("/admin/rooms/{diagram_id}/capture")
+async def stop_capture(diagram_id: str, request: Request):
+    """Stop capturing a room; returns the capture file and its message count."""
+    _require_admin(request)
+    result = await session_recorder.stop(diagram_service.resolve_id(diagram_id) or "")
+    if result is None:
+        raise HTTPException(status_code=404, detail="Room is not being captured")
+    return result
+
+
+async def _serve_spectator(websocket: WebSocket, diagram_id: str) -> None:
+    """Serve a read-only connection: no session, presence or locks, only snapshots."""
+    frame = spectators.join(diagram_id, websocket)
+    if frame is None:
+        # First spectator of this room; later ones reuse the encoded frame
+        cached = diagram_service.get_diagram_xml(diagram_id)
+        if cached is None:
+            await websocket.close(code=1008, reason="Diagram not found")
+            return
+        spectators.load(diagram_id, cached.version, cached.raw.decode("utf-8"))
+        frame = spectators.join(diagram_id, websocket)
+    try:
+        await websocket.send_text(frame)
+        while True:
+            data = await websocket.receive_json()
+            # Spectators cannot edit or lock; only keepalives are answered
+            if data.get("type") == "ping":
+                await websocket.send_json({"type": "pong"})
     except WebSocketDisconnect:
-        # Cleanup on disconnect
-        diagram_service.remove_connection(diagram_id, websocket)
-        await _broadcast_unlock_user_elements(diagram_id, session.user_id, websocket)
-        diagram_service.unlock_all_user_elements(diagram_id, session.user_id)
-        await _broadcast_user_left(diagram_id, session.user_name, websocket)
-        diagram_service.remove_user_session_by_websocket(websocket)
-        # Broadcast updated user list to all remaining users
-        await _broadcast_user_list_to_all(diagram_id)
+        pass
+    finally:
+        spectators.leave(diagram_id, websocket)
+
+
+def _encode(message: Dict[str, Any]) -> str:
+    # Same encoding as WebSocket.send_json, done once per broadcast
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+async def _send(websocket: WebSocket, diagram_id: str, message: Dict[str, Any]) -> None:
+    """Send a message to one editor, counting its bytes for the room."""
+    text = _encode(message)
+    room_bytes_out.inc(diagram_id, amount=len(text.encode("utf-8")))
+    await websocket.send_text(text)
+
+
+async def _send_chunks(
+    websocket: WebSocket, diagram_id: str, transfer: int, body: bytes
+) -> None:
+    """Stream a body to one editor as binary frames, one chunk at a time."""
+    for frame in iter_chunks(transfer, body, XML_CHUNK_SIZE):
+        room_bytes_out.inc(diagram_id, amount=len(frame))
+        await websocket.send_bytes(frame)
 
 
 async def _broadcast_to_others(
     diagram_id: str, message: Dict[str, Any], sender: WebSocket
 ) -> None:
     """Broadcast message to all connections except sender."""
+    await _broadcast_text(diagram_id, _encode(message), exclude=sender)
+
+
+async def _broadcast_to_all(diagram_id: str, message: Dict[str, Any]) -> None:
+    """Broadcast message to every connection in a diagram."""
+    await _broadcast_text(diagram_id, _encode(message))
+
+
+async def _broadcast_text(
+    diagram_id: str, text: str, exclude: Optional[WebSocket] = None
+) -> None:
+    """Send an already encoded frame to every connection in a diagram."""
     connections = diagram_service.get_connections(diagram_id)
     disconnected = set()
+    sent = 0
+    started = time.perf_counter()
 
-    for connection in connections:
-        if connection != sender:
+    with tracer.span("broadcast", diagram_id=diagram_id):
+        for connection in list(connections):
+            if connection is exclude:
+                continue
             try:
-                await connection.send_json(message)
+                await connection.send_text(text)
+                sent += 1
             except Exception:
                 disconnected.add(connection)
 
+    broadcast_seconds.observe(time.perf_counter() - started)
+    broadcast_recipients.observe(sent)
+    if sent:
+        room_bytes_out.inc(diagram_id, amount=len(text.encode("utf-8")) * sent)
+
     # Clean up disconnected connections
     for conn in disconnected:
         diagram_service.remove_connection(diagram_id, conn)
         diagram_service.remove_user_session_by_websocket(conn)
 
 
-async def _broadcast_user_joined(
-    diagram_id: str, user_name: str, sender: WebSocket
-) -> None:
-    """Notify others that a user joined."""
-    await _broadcast_to_others(
-        diagram_id, {"type": "user_joined", "data": {"user_name": user_name}}, sender
-    )
-
-
-async def _broadcast_user_left(
-    diagram_id: str, user_name: str, sender: WebSocket
-) -> None:
-    """Notify others that a user left."""
-    await _broadcast_to_others(
-        diagram_id, {"type": "user_left", "data": {"user_name": user_name}}, sender
-    )
+presence = PresenceCoalescer(PRESENCE_DEBOUNCE_MS / 1000, _broadcast_to_all)
+spectators = SpectatorHub(SPECTATOR_INTERVAL_MS / 1000)
+cursors = CursorRelay(CURSOR_TICK_MS / 1000, CURSOR_STALE_MS / 1000, _broadcast_text)
+validator = DiagramValidator(_broadcast_to_all, LINT_CACHE_SIZE)
+drainer = DrainCoordinator(
+    DRAIN_HANDOFF_DIR,
+    DRAIN_RETRY_JITTER_MS,
+    DRAIN_HANDOFF_TTL_S,
+    spectators,
+    _broadcast_to_all,
+)
 
 
-async def _send_user_list(diagram_id: str, websocket: WebSocket) -> None:
-    """Send list of current users to a websocket."""
-    sessions = diagram_service.get_user_sessions_for_diagram(diagram_id)
-    users = list(set(session.user_name for session in sessions))
+def _collaboration_gauge(key: str):
+    return lambda: {(): diagram_service.stats()[key]}
 
-    await websocket.send_json({"type": "user_list", "data": {"users": users}})
 
+def _pool_stat(key: str):
+    return lambda: {
+        (pool,): stats[key] for pool, stats in pool_metrics().items() if key in stats
+    }
 
-async def _broadcast_user_list_to_all(diagram_id: str) -> None:
-    """Broadcast updated user list to all connected users."""
-    connections = diagram_service.get_connections(diagram_id)
-    sessions = diagram_service.get_user_sessions_for_diagram(diagram_id)
-    users = list(set(session.user_name for session in sessions))
 
-    message = {"type": "user_list", "data": {"users": users}}
+def _event_log_stat(key: str):
+    return lambda: {(): event_log.stats()[key]}
 
-    disconnected = set()
-    for connection in connections:
-        try:
-            await connection.send_json(message)
-        except Exception:
-            disconnected.add(connection)
 
-    # Clean up disconnected connections
-    for conn in disconnected:
-        diagram_service.remove_connection(diagram_id, conn)
-        diagram_service.remove_user_session_by_websocket(conn)
+# Read from the live state on scrape, so they cost nothing in between
+registry.gauge(
+    "bpmn_connections",
+    "Open editor WebSocket connections.",
+    collect=_collaboration_gauge("connections"),
+)
+registry.gauge(
+    "bpmn_rooms",
+    "Diagrams with at least one editor.",
+    collect=_collaboration_gauge("rooms"),
+)
+registry.gauge(
+    "bpmn_user_sessions", "Editor sessions.", collect=_collaboration_gauge("sessions")
+)
+registry.gauge(
+    "bpmn_lock_tables",
+    "Diagrams with an element lock table.",
+    collect=_collaboration_gauge("lock_tables"),
+)
+registry.gauge(
+    "bpmn_element_locks", "Element locks held.", collect=_collaboration_gauge("locks")
+)
+registry.gauge(
+    "bpmn_db_pool_checked_out",
+    "Database connections in use.",
+    ("pool",),
+    collect=_pool_stat("checked_out"),
+)
+registry.counter(
+    "bpmn_db_pool_checkouts_total",
+    "Database connection checkouts.",
+    ("pool",),
+    collect=_pool_stat("checkouts"),
+)
+registry.counter(
+    "bpmn_db_pool_wait_seconds_total",
+    "Time spent waiting for a pooled database connection.",
+    ("pool",),
+    collect=_pool_stat("wait_seconds_total"),
+)
+registry.counter(
+    "bpmn_db_pool_timeouts_total",
+    "Checkouts that timed out waiting for a connection.",
+    ("pool",),
+    collect=_pool_stat("timeouts"),
+)
+registry.gauge(
+    "bpmn_event_log_queued",
+    "Collaboration events waiting to be written.",
+    collect=_event_log_stat("queued"),
+)
+registry.counter(
+    "bpmn_event_log_written_total",
+    "Collaboration events written.",
+    collect=_event_log_stat("written"),
+)
+registry.counter(
+    "bpmn_event_log_dropped_total",
+    "Collaboration events dropped because the spill file was full.",
+    collect=_event_log_stat("dropped"),
+)
 
 
 async def _broadcast_unlock_user_elements(
@@ -309,31 +983,28 @@ async def _broadcast_lock_update(diagram_id: str, websocket: WebSocket) -> None:
 async def catch_all(request: Request, path: str):
     """Handle all other routes - serves SPA for GET or 404 for others."""
     # Special handling for GET requests (potential SPA routes)
-    if request.method == "GET":
-        if STATIC_DIR.exists() and (STATIC_DIR / "index.html").exists():
-            # Check if it's an existing file in the static directory
-            file_path = STATIC_DIR / path
-            if file_path.exists() and file_path.is_file():
-                return FileResponse(str(file_path))
-
-            # Only serve index.html for known frontend routes (or root)
-            # This ensures that completely random paths get a real 404 status
-            is_valid_route = not path or path == "/" or path.startswith("diagram/")
-
-            # Also ensure we don't serve index.html for missed API/WS/Static calls
-            is_reserved = (
-                path.startswith("api")
-                or path.startswith("ws")
-                or path.startswith("static")
-            )
-
-            if is_valid_route and not is_reserved:
-                return FileResponse(str(STATIC_DIR / "index.html"))
-
-            # For unknown paths that are requested by a browser (HTML),
-            # serve index.html with a 404 status code to show the "wow" page.
-            if "text/html" in request.headers.get("accept", "") and not is_reserved:
-                return FileResponse(str(STATIC_DIR / "index.html"), status_code=404)
+    if request.method in ("GET", "HEAD") and static_manifest.index:
+        # Check if it's an existing file in the build
+        asset = static_manifest.get(path)
+        if asset:
+            return asset.response(request)
+
+        # Only serve index.html for known frontend routes (or root)
+        # This ensures that completely random paths get a real 404 status
+        is_valid_route = not path or path == "/" or path.startswith("diagram/")
+
+        # Also ensure we don't serve index.html for missed API/WS/Static calls
+        is_reserved = (
+            path.startswith("api") or path.startswith("ws") or path.startswith("static")
+        )
+
+        if is_valid_route and not is_reserved:
+            return static_manifest.index.response(request)
+
+        # For unknown paths that are requested by a browser (HTML),
+        # serve index.html with a 404 status code to show the "wow" page.
+        if "text/html" in request.headers.get("accept", "") and not is_reserved:
+            return static_manifest.index.response(request, status_code=404)
 
     # For all other cases, return a 404
     raise HTTPException(status_code=404, detail="Not Found")
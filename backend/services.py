@@ -1,112 +1,275 @@
 """Business logic and services for diagram management and WebSocket handling."""
 
-from typing import Dict, Set, Optional
+from typing import Dict, Set, Optional, Iterator, Tuple
 from datetime import datetime
+from xml.parsers.expat import ExpatError
+import logging
+import time
 import uuid
 from fastapi import WebSocket
 
-from sqlalchemy.orm import Session
-from models import ElementLock, UserSession, BPMNDiagram
-from config import EXAMPLE_DIAGRAMS, DEFAULT_DIAGRAM_XML
-from database import SessionLocal
-import uuid as uuid_pkg
+from models import ElementLock, UserSession
+from config import (
+    get_example_diagrams,
+    get_default_diagram_xml,
+    DIAGRAM_CACHE_SIZE,
+    MERGE_HISTORY_SIZE,
+    SQLITE_PATH,
+    STORAGE_BACKEND,
+)
+from cache import CachedXml, DiagramCache
+from merge import RevisionHistory, merge_diagrams
+from metrics import storage_seconds, tracer
+from storage import StorageBackend, StoredDiagram, create_storage
+
+
+def _canonical_id(diagram_id: str) -> Optional[str]:
+    """The canonical form of a diagram UUID, or None if it is not one."""
+    try:
+        return str(uuid.UUID(diagram_id))
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+class _Behind(Exception):
+    """Leaves a storage update untouched so an edit can be merged outside it."""
+
+    def __init__(self, current: StoredDiagram):
+        super().__init__(current.version)
+        self.current = current
 
 
 class DiagramService:
     """Service for managing diagrams with database persistence and memory for transient state."""
 
-    def __init__(self):
+    def __init__(self, storage: Optional[StorageBackend] = None):
+        self.storage = storage or create_storage(STORAGE_BACKEND, SQLITE_PATH)
         self._active_connections: Dict[str, Set[WebSocket]] = {}
         self._user_sessions: Dict[str, UserSession] = {}
         self._websocket_to_session: Dict[WebSocket, str] = {}  # websocket -> session_id
         self._element_locks: Dict[str, Dict[str, ElementLock]] = {}
+        self._xml_cache = DiagramCache(max_entries=DIAGRAM_CACHE_SIZE)
+        self._history = RevisionHistory(max_revisions=MERGE_HISTORY_SIZE)
+
+    def seed_database(self) -> bool:
+        """Seed the database with example diagrams if it's empty.
 
-    def get_db(self) -> Session:
-        return SessionLocal()
-
-    def seed_database(self) -> None:
-        """Seed the database with example diagrams if it's empty."""
-        with self.get_db() as db:
-            count = db.query(BPMNDiagram).count()
-            if count == 0:
-                for example in EXAMPLE_DIAGRAMS:
-                    new_diagram = BPMNDiagram(
-                        name=example["name"], bpmn_xml=example["xml"]
-                    )
-                    db.add(new_diagram)
-                db.commit()
+        Not run on startup; use ``python manage.py seed`` or the seed migration.
+        Returns True if the examples were inserted.
+        """
+        if not self.storage.is_empty():
+            return False
+        for example in get_example_diagrams():
+            self.storage.create(example["name"], example["xml"])
+        return True
+
+    def _storage_call(self, operation: str, *args):
+        """Call a storage method, timed for /metrics and traced when sampled."""
+        with tracer.span(f"storage.{operation}"):
+            started = time.perf_counter()
+            try:
+                return getattr(self.storage, operation)(*args)
+            finally:
+                storage_seconds.observe(time.perf_counter() - started, operation)
 
     def get_all_diagrams(self) -> list[dict]:
         """Get list of all diagrams from database."""
-        with self.get_db() as db:
-            diagrams = db.query(BPMNDiagram).all()
-            return [
-                {
-                    "id": str(d.id),
-                    "name": d.name,
-                    "created_at": d.updated_at.isoformat(),  # Simplified for now
-                    "updated_at": d.updated_at.isoformat(),
-                }
-                for d in diagrams
-            ]
+        return [
+            {
+                "id": d.id,
+                "name": d.name,
+                "created_at": d.updated_at.isoformat(),  # Simplified for now
+                "updated_at": d.updated_at.isoformat(),
+            }
+            for d in self._storage_call("list_diagrams")
+        ]
 
     def get_diagram(self, diagram_id: str) -> Optional[dict]:
         """Get a specific diagram by ID from database."""
-        try:
-            # Check if it's a valid UUID
-            uuid_obj = uuid_pkg.UUID(diagram_id)
-        except (ValueError, AttributeError):
+        diagram_id = _canonical_id(diagram_id)
+        diagram = self._storage_call("get", diagram_id) if diagram_id else None
+        if not diagram:
+            return None
+        # Clients editing from this revision may need it as a merge base
+        self._history.put(diagram_id, diagram.version, diagram.xml)
+        return {
+            "id": diagram.id,
+            "name": diagram.name,
+            "xml": diagram.xml,
+            "version": diagram.version,
+            "created_at": diagram.updated_at.isoformat(),
+            "updated_at": diagram.updated_at.isoformat(),
+        }
+
+    def resolve_id(self, diagram_id: str) -> Optional[str]:
+        """The canonical id of an existing diagram; only its version is read."""
+        diagram_id = _canonical_id(diagram_id)
+        if not diagram_id or self._storage_call("get_version", diagram_id) is None:
             return None
+        return diagram_id
 
-        with self.get_db() as db:
-            diagram = db.query(BPMNDiagram).filter(BPMNDiagram.id == uuid_obj).first()
-            if diagram:
-                return {
-                    "id": str(diagram.id),
-                    "name": diagram.name,
-                    "xml": diagram.bpmn_xml,
-                    "created_at": diagram.updated_at.isoformat(),
-                    "updated_at": diagram.updated_at.isoformat(),
-                }
-        return None
+    def get_diagram_xml(self, diagram_id: str) -> Optional[CachedXml]:
+        """Get the current XML body of a diagram, served from cache when fresh.
 
-    def create_diagram(self, name: str, initial_xml: Optional[str] = None) -> dict:
-        """Create a new diagram in database."""
-        with self.get_db() as db:
-            new_diagram = BPMNDiagram(
-                name=name, bpmn_xml=initial_xml or DEFAULT_DIAGRAM_XML
-            )
-            db.add(new_diagram)
-            db.commit()
-            db.refresh(new_diagram)
+        Only the version column is read on a cache hit, so polling clients do
+        not pull the full XML out of the database.
+        """
+        diagram_id = _canonical_id(diagram_id)
+        if not diagram_id:
+            return None
+        version = self._storage_call("get_version", diagram_id)
+        if version is None:
+            return None
+        cached = self._xml_cache.get(diagram_id, version)
+        if cached:
+            return cached
+        diagram = self._storage_call("get", diagram_id)
+        if not diagram:
+            return None
+        return self._xml_cache.put(diagram_id, diagram.version, diagram.xml)
 
-            diagram_id = str(new_diagram.id)
-            self._active_connections[diagram_id] = set()
-            self._element_locks[diagram_id] = {}
+    def open_diagram(self, diagram_id: str) -> Optional[Tuple[str, CachedXml]]:
+        """The canonical id and current XML body of a diagram an editor joins.
 
-            return {
-                "id": diagram_id,
-                "name": new_diagram.name,
-                "xml": new_diagram.bpmn_xml,
-                "created_at": new_diagram.updated_at.isoformat(),
-                "updated_at": new_diagram.updated_at.isoformat(),
-            }
+        Served from the XML cache like ``get_diagram_xml``; the revision is
+        also kept as a merge base for edits the editor makes from it.
+        """
+        diagram_id = _canonical_id(diagram_id)
+        cached = self.get_diagram_xml(diagram_id) if diagram_id else None
+        if cached is None:
+            return None
+        if self._history.get(diagram_id, cached.version) is None:
+            self._history.put(diagram_id, cached.version, cached.raw.decode("utf-8"))
+        return diagram_id, cached
 
-    def update_diagram(self, diagram_id: str, xml: str) -> bool:
-        """Update diagram XML content in database."""
+    def create_diagram(self, name: str, initial_xml: Optional[str] = None) -> dict:
+        """Create a new diagram in database."""
+        new_diagram = self._storage_call(
+            "create", name, initial_xml or get_default_diagram_xml()
+        )
+        diagram_id = new_diagram.id
+        self._history.put(diagram_id, new_diagram.version, new_diagram.xml)
+        self._active_connections[diagram_id] = set()
+        self._element_locks[diagram_id] = {}
+
+        return {
+            "id": diagram_id,
+            "name": new_diagram.name,
+            "xml": new_diagram.xml,
+            "version": new_diagram.version,
+            "created_at": new_diagram.updated_at.isoformat(),
+            "updated_at": new_diagram.updated_at.isoformat(),
+        }
+
+    def update_diagram(
+        self, diagram_id: str, xml: str, base_version: Optional[int] = None
+    ) -> Optional[dict]:
+        """Update diagram XML content in database.
+
+        When ``base_version`` is older than the stored version, the edit was
+        made concurrently with others and is merged element by element into
+        the current diagram instead of overwriting it. The merge runs after
+        the row lock is released, and is stored only if no other edit landed
+        in the meantime; otherwise it is merged again. This blocks, so call it
+        from a worker thread. Returns the new version, the XML that was
+        stored and whether a merge happened, or None if the diagram does not
+        exist.
+        """
+        diagram_id = _canonical_id(diagram_id)
+        if not diagram_id:
+            return None
+        # The XML to store if the row is still at the version it was merged into
+        merge: Optional[Tuple[int, str]] = None
+        merged = False
+
+        def change(current: StoredDiagram) -> str:
+            # Runs inside the storage transaction, against the locked row
+            if merge is not None and merge[0] == current.version:
+                return merge[1]
+            if base_version is None or base_version >= current.version:
+                return xml
+            raise _Behind(current)
+
+        while True:
+            try:
+                diagram = self._storage_call("update", diagram_id, change)
+                break
+            except _Behind as behind:
+                result = self._merge(diagram_id, base_version, behind.current, xml)
+                merged = result is not None
+                merge = (behind.current.version, result if merged else xml)
+        if not diagram:
+            return None
+        self._xml_cache.put(diagram_id, diagram.version, diagram.xml)
+        self._history.put(diagram_id, diagram.version, diagram.xml)
+        return {"version": diagram.version, "xml": diagram.xml, "merged": merged}
+
+    def _merge(
+        self, diagram_id: str, base_version: int, current: StoredDiagram, xml: str
+    ) -> Optional[str]:
+        """``xml`` merged into ``current``, or None to store it as it is."""
+        base_xml = self._history.get(diagram_id, base_version)
+        if base_xml is None:
+            logging.warning(
+                f"No revision {base_version} of {diagram_id} to merge against, "
+                "overwriting"
+            )
+            return None
         try:
-            uuid_obj = uuid_pkg.UUID(diagram_id)
-        except (ValueError, AttributeError):
-            return False
+            return merge_diagrams(base_xml, current.xml, xml)
+        except ExpatError as exc:
+            logging.warning(f"Could not merge edit to {diagram_id}: {exc}")
+            return None
 
-        with self.get_db() as db:
-            diagram = db.query(BPMNDiagram).filter(BPMNDiagram.id == uuid_obj).first()
-            if not diagram:
-                return False
-            diagram.bpmn_xml = xml
-            diagram.version += 1
-            db.commit()
-            return True
+    def import_diagrams(self, records: list[dict]) -> dict:
+        """Insert a batch of imported diagrams in a single transaction.
+
+        Records carrying an ID that already exists are skipped, so a failed
+        import can be safely replayed from its last committed cursor.
+        """
+        rows = [
+            {
+                "id": _canonical_id(record.get("id") or "") or str(uuid.uuid4()),
+                "name": record["name"],
+                "xml": record["xml"],
+                "version": record.get("version") or 1,
+            }
+            for record in records
+        ]
+        imported = self._storage_call("insert_many", rows)
+        return {"imported": imported, "skipped": len(rows) - imported}
+
+    def iter_diagrams(
+        self, after: Optional[str] = None, page_size: int = 100
+    ) -> Iterator[dict]:
+        """Yield every diagram with its XML, ordered by ID.
+
+        Pages are fetched with keyset pagination, each in its own short-lived
+        session, so memory stays constant regardless of library size.
+        """
+        cursor = None
+        if after:
+            cursor = _canonical_id(after)
+            if cursor is None:
+                return
+
+        while True:
+            page = [
+                {
+                    "id": d.id,
+                    "name": d.name,
+                    "version": d.version,
+                    "updated_at": d.updated_at.isoformat(),
+                    "xml": d.xml,
+                }
+                for d in self._storage_call("page", cursor, page_size)
+            ]
+            if not page:
+                return
+            yield from page
+            if len(page) < page_size:
+                return
+            cursor = page[-1]["id"]
 
     def add_connection(self, diagram_id: str, websocket: WebSocket) -> None:
         """Add a WebSocket connection for a diagram."""
@@ -127,11 +290,19 @@ class DiagramService:
         """Get all active connections for a diagram."""
         return self._active_connections.get(diagram_id, set())
 
+    def rooms(self) -> list[str]:
+        """Diagrams with at least one editor connected."""
+        return [diagram_id for diagram_id, c in self._active_connections.items() if c]
+
     def create_user_session(
-        self, diagram_id: str, websocket: WebSocket, custom_user_name: str | None = None
+        self,
+        diagram_id: str,
+        websocket: WebSocket,
+        custom_user_name: str | None = None,
+        user_id: str | None = None,
     ) -> UserSession:
-        """Create a new user session."""
-        user_id = str(uuid.uuid4())
+        """Create a new user session; ``user_id`` resumes a handed-off identity."""
+        user_id = user_id or str(uuid.uuid4())
         # Use custom name if provided, otherwise generate one
         if custom_user_name and custom_user_name.strip():
             user_name = custom_user_name.strip()[:30]  # Limit to 30 characters
@@ -149,6 +320,11 @@ class DiagramService:
         self._websocket_to_session[websocket] = session_id
         return session
 
+    def get_session(self, websocket: WebSocket) -> Optional[UserSession]:
+        """The user session of an editor connection."""
+        session_id = self._websocket_to_session.get(websocket)
+        return self._user_sessions.get(session_id) if session_id else None
+
     def remove_user_session(self, session_id: str) -> None:
         """Remove a user session."""
         if session_id in self._user_sessions:
@@ -229,6 +405,16 @@ class DiagramService:
         """Get all element locks for a diagram."""
         return self._element_locks.get(diagram_id, {})
 
+    def stats(self) -> dict:
+        """Sizes of the in-memory collaboration state, for /metrics."""
+        return {
+            "connections": sum(len(c) for c in self._active_connections.values()),
+            "rooms": sum(1 for c in self._active_connections.values() if c),
+            "sessions": len(self._user_sessions),
+            "lock_tables": len(self._element_locks),
+            "locks": sum(len(locks) for locks in self._element_locks.values()),
+        }
+
 
 # Global service instance
 diagram_service = DiagramService()
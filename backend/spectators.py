@@ -0,0 +1,140 @@
+"""Read-only spectator connections served from shared, pre-encoded frames."""
+
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+
+def _encode(message: dict) -> str:
+    return json.dumps(message, separators=(",", ":"))
+
+
+class SpectatorRoom:
+    """Spectators of one diagram and the latest snapshot they should see."""
+
+    def __init__(self, version: int, xml: str):
+        self.sockets: Set[WebSocket] = set()
+        self.version = version
+        self.xml = xml
+        self.user: Optional[str] = None
+        self.sent_version = version
+        self.last_flush = 0.0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self._state_frame: Optional[str] = None
+
+    def state_frame(self) -> str:
+        """The ``diagram_state`` frame for new spectators, encoded once per version."""
+        if self._state_frame is None:
+            self._state_frame = _encode(
+                {
+                    "type": "diagram_state",
+                    "data": {
+                        "xml": self.xml,
+                        "version": self.version,
+                        "locks": {},
+                        "mode": "view",
+                    },
+                }
+            )
+        return self._state_frame
+
+    def update(self, version: int, xml: str, user: Optional[str]) -> bool:
+        """Record a newer snapshot. Returns False for stale versions."""
+        if version <= self.version:
+            return False
+        self.version = version
+        self.xml = xml
+        self.user = user
+        self._state_frame = None
+        return True
+
+
+class SpectatorHub:
+    """Fans diagram snapshots out to ``mode=view`` connections.
+
+    Spectators have no user session, take no part in presence or locking and
+    never send edits. Updates are downsampled: however many edits land in an
+    interval, each spectator gets the latest snapshot once, as a frame that is
+    encoded a single time and shared by every spectator of the room.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._rooms: Dict[str, SpectatorRoom] = {}
+
+    def load(self, diagram_id: str, version: int, xml: str) -> None:
+        """Open a room with the diagram as read from the database."""
+        room = self._rooms.get(diagram_id)
+        if room is None:
+            self._rooms[diagram_id] = SpectatorRoom(version, xml)
+        else:
+            room.update(version, xml, None)
+
+    def join(self, diagram_id: str, websocket: WebSocket) -> Optional[str]:
+        """Add a spectator to an open room and return the state frame to send it.
+
+        Returns None when the room is not open yet; ``load`` it first.
+        """
+        room = self._rooms.get(diagram_id)
+        if room is None:
+            return None
+        room.sockets.add(websocket)
+        return room.state_frame()
+
+    def leave(self, diagram_id: str, websocket: WebSocket) -> None:
+        room = self._rooms.get(diagram_id)
+        if room is None:
+            return
+        room.sockets.discard(websocket)
+        if not room.sockets:
+            if room.flush_handle is not None:
+                room.flush_handle.cancel()
+            del self._rooms[diagram_id]
+
+    def connections(self, diagram_id: str) -> Set[WebSocket]:
+        room = self._rooms.get(diagram_id)
+        return room.sockets if room is not None else set()
+
+    def rooms(self) -> List[str]:
+        """Diagrams with at least one spectator."""
+        return list(self._rooms)
+
+    def publish(self, diagram_id: str, version: int, xml: str, user: str) -> None:
+        """Queue a new snapshot; spectators see it within one interval."""
+        room = self._rooms.get(diagram_id)
+        if room is None or not room.update(version, xml, user):
+            return
+        if room.flush_handle is not None:
+            return
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, room.last_flush + self.interval - loop.time())
+        room.flush_handle = loop.call_later(
+            delay, lambda: asyncio.create_task(self._flush(diagram_id, room))
+        )
+
+    async def _flush(self, diagram_id: str, room: SpectatorRoom) -> None:
+        room.flush_handle = None
+        room.last_flush = asyncio.get_running_loop().time()
+        if room.version == room.sent_version or not room.sockets:
+            return
+        room.sent_version = room.version
+        frame = _encode(
+            {
+                "type": "diagram_update",
+                "data": {"xml": room.xml, "version": room.version, "locks": {}},
+                "user": room.user,
+            }
+        )
+        sockets = list(room.sockets)
+        # Send concurrently so one slow spectator does not hold up the rest
+        results = await asyncio.gather(
+            *(ws.send_text(frame) for ws in sockets), return_exceptions=True
+        )
+        failed = [ws for ws, result in zip(sockets, results) if isinstance(result, Exception)]
+        for ws in failed:
+            self.leave(diagram_id, ws)
+        if failed:
+            logging.info(f"Dropped {len(failed)} spectators of {diagram_id}")
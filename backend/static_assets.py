@@ -0,0 +1,157 @@
+"""In-memory manifest of the built frontend, precompressed at startup."""
+
+import hashlib
+import logging
+import mimetypes
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+from cache import choose_encoding, compress, etag_matches, supported_encodings
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Bundler output such as assets/index-3f9a1c2b.js or static/js/main.3f9a1c2b.js
+_HASHED_NAME = re.compile(r"[.-](?=[A-Za-z0-9_-]*\d)[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+_HASHED_DIRS = {"assets", "static"}
+_COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "image/svg+xml",
+    "text/javascript",
+}
+_PRECOMPRESSED_SUFFIXES = {".br": "br", ".gz": "gzip"}
+
+
+class StaticAsset:
+    """A single build artifact with its precomputed encodings and headers."""
+
+    __slots__ = ("path", "media_type", "etag", "cache_control", "body", "encoded")
+
+    def __init__(
+        self,
+        path: Path,
+        media_type: str,
+        etag: str,
+        cache_control: str,
+        body: Optional[bytes],
+    ):
+        self.path = path
+        self.media_type = media_type
+        self.etag = etag
+        self.cache_control = cache_control
+        # None means the file is too large to keep in memory
+        self.body = body
+        self.encoded: Dict[str, bytes] = {}
+
+    def response(self, request: Request, status_code: int = 200) -> Response:
+        """Build a response honouring If-None-Match and Accept-Encoding."""
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control}
+        if self.encoded:
+            headers["Vary"] = "Accept-Encoding"
+
+        if status_code == 200 and etag_matches(
+            request.headers.get("if-none-match"), self.etag
+        ):
+            return Response(status_code=304, headers=headers)
+
+        if self.body is None:
+            return FileResponse(
+                str(self.path),
+                status_code=status_code,
+                media_type=self.media_type,
+                headers=headers,
+            )
+
+        encoding = choose_encoding(
+            request.headers.get("accept-encoding", ""), self.encoded.keys()
+        )
+        body = self.body
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            body = self.encoded[encoding]
+        return Response(
+            body, status_code=status_code, media_type=self.media_type, headers=headers
+        )
+
+
+class StaticManifest:
+    """Lookup table of every file in the frontend build, keyed by URL path."""
+
+    def __init__(self):
+        self._assets: Dict[str, StaticAsset] = {}
+        self._has_assets_dir = False
+        self.index: Optional[StaticAsset] = None
+
+    def load(self, root: Path, max_file_size: int) -> None:
+        """Read and precompress every file under ``root``.
+
+        Existing ``.br``/``.gz`` siblings emitted by the build are reused
+        instead of compressing again.
+        """
+        assets: Dict[str, StaticAsset] = {}
+        if root.is_dir():
+            for file_path in sorted(root.rglob("*")):
+                if not file_path.is_file():
+                    continue
+                if file_path.suffix in _PRECOMPRESSED_SUFFIXES and file_path.with_suffix(
+                    ""
+                ).is_file():
+                    continue
+                key = file_path.relative_to(root).as_posix()
+                assets[key] = self._build_asset(file_path, key, max_file_size)
+
+        self._assets = assets
+        self._has_assets_dir = any(key.startswith("static/") for key in assets)
+        self.index = assets.get("index.html")
+        if assets:
+            logging.info(f"Loaded {len(assets)} static assets from {root}")
+
+    def get(self, path: str) -> Optional[StaticAsset]:
+        """Find the asset for a request path, if any."""
+        path = path.lstrip("/")
+        asset = self._assets.get(path)
+        if asset is None and not self._has_assets_dir and path.startswith("static/"):
+            # The build may be copied without the nested static folder
+            asset = self._assets.get(path[len("static/") :])
+        return asset
+
+    def _build_asset(self, file_path: Path, key: str, max_file_size: int) -> StaticAsset:
+        media_type = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+        parts = key.split("/")
+        is_hashed = bool(_HASHED_DIRS.intersection(parts[:-1])) and bool(
+            _HASHED_NAME.search(parts[-1])
+        )
+        cache_control = IMMUTABLE_CACHE_CONTROL if is_hashed else REVALIDATE_CACHE_CONTROL
+
+        size = file_path.stat().st_size
+        if size > max_file_size:
+            stat = file_path.stat()
+            etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+            return StaticAsset(file_path, media_type, etag, cache_control, None)
+
+        body = file_path.read_bytes()
+        etag = f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+        asset = StaticAsset(file_path, media_type, etag, cache_control, body)
+
+        if media_type.startswith("text/") or media_type in _COMPRESSIBLE_TYPES:
+            for suffix, encoding in _PRECOMPRESSED_SUFFIXES.items():
+                prebuilt = file_path.with_name(file_path.name + suffix)
+                if prebuilt.is_file():
+                    asset.encoded[encoding] = prebuilt.read_bytes()
+            for encoding in supported_encodings():
+                if encoding not in asset.encoded:
+                    encoded = compress(body, encoding, level=9)
+                    if len(encoded) < len(body):
+                        asset.encoded[encoding] = encoded
+        return asset
+
+
+# Global manifest instance, populated on startup
+static_manifest = StaticManifest()
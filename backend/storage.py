@@ -0,0 +1,752 @@
+"""Storage backends for diagrams: SQLAlchemy (Postgres), embedded SQLite and memory."""
+
+import functools
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from database import (
+    DatabaseNotConfigured,
+    new_replica_session,
+    new_session,
+    open_pool_connections,
+    pool_metrics,
+)
+from models import BPMNDiagram, CollaborationEvent
+
+T = TypeVar("T")
+
+
+@dataclass
+class DiagramSummary:
+    """A diagram as listed, without its XML."""
+
+    id: str
+    name: str
+    updated_at: datetime
+    version: int
+
+
+@dataclass
+class StoredDiagram(DiagramSummary):
+    """A diagram with its current XML."""
+
+    xml: str
+
+
+# A collaboration event: {"diagram_id", "occurred_at" (aware UTC datetime),
+# "type", "user_id", "user_name", "data" (a JSON-able dict)}
+Event = Dict[str, Any]
+
+# Computes the XML to store from the current row; called inside the write
+# transaction so no other update can land in between
+Change = Callable[[StoredDiagram], str]
+
+
+class StorageError(Exception):
+    """A backend failed to read or write; the driver's error is the cause."""
+
+
+def _raises_storage_error(*errors: type) -> Callable:
+    """Re-raise the driver ``errors`` a backend method raises as StorageError."""
+
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            except errors as exc:
+                raise StorageError(str(exc)) from exc
+
+        return wrapper
+
+    return decorate
+
+
+_sqlalchemy_errors = _raises_storage_error(SQLAlchemyError, DatabaseNotConfigured)
+_sqlite_errors = _raises_storage_error(sqlite3.Error)
+
+
+class StorageBackend(ABC):
+    """Persistence for diagrams; ``DiagramService`` only talks to this interface.
+
+    Diagram ids are canonical UUID strings, validated by the caller. Driver
+    errors surface as ``StorageError``; errors raised by an ``update``
+    change pass through unchanged. Every backend must pass the shared
+    conformance suite in ``tests/test_storage.py``.
+    """
+
+    def warm_up(self, connections: int) -> None:
+        """Open connections ahead of the first request; raise if unreachable."""
+
+    @abstractmethod
+    def is_empty(self) -> bool:
+        ...
+
+    @abstractmethod
+    def list_diagrams(self) -> List[DiagramSummary]:
+        ...
+
+    @abstractmethod
+    def get(self, diagram_id: str) -> Optional[StoredDiagram]:
+        ...
+
+    @abstractmethod
+    def get_version(self, diagram_id: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def create(self, name: str, xml: str) -> StoredDiagram:
+        ...
+
+    @abstractmethod
+    def update(self, diagram_id: str, change: Change) -> Optional[StoredDiagram]:
+        """Store ``change(current)`` as the next version, atomically.
+
+        Returns the stored diagram, or None if it does not exist. If
+        ``change`` raises, nothing is written.
+        """
+
+    @abstractmethod
+    def insert_many(self, rows: List[dict]) -> int:
+        """Insert ``{"id", "name", "xml", "version"}`` rows in one transaction.
+
+        Rows whose id already exists are skipped. Returns how many were inserted.
+        """
+
+    @abstractmethod
+    def page(self, after: Optional[str], limit: int) -> List[StoredDiagram]:
+        """Up to ``limit`` diagrams ordered by id, starting after ``after``."""
+
+    @abstractmethod
+    def append_events(self, events: List[Event]) -> None:
+        """Append a batch of events to the event log in one transaction."""
+
+    @abstractmethod
+    def query_events(
+        self,
+        diagram_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        event_type: Optional[str] = None,
+        limit: int = 1000,
+    ) -> List[Event]:
+        """A diagram's events with ``start <= occurred_at < end``, oldest first."""
+
+    def metrics(self) -> dict:
+        """Backend statistics for the health endpoints."""
+        return {}
+
+    def close(self) -> None:
+        pass
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes; everything is stored in UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class SQLAlchemyStorage(StorageBackend):
+    """Diagrams in the ``bpmn_diagrams`` table of a SQLAlchemy database.
+
+    This is the Postgres backend, configured by ``DATABASE_URL``; it works
+    with any SQLAlchemy URL and is what the Alembic migrations manage.
+
+    With a replica (``DATABASE_REPLICA_URL``) diagram loads and export pages,
+    which carry the XML, are read there. Each replica result is checked
+    against the row versions on the primary, a small query without the XML,
+    and is re-read from the primary if it is missing a row or shows an
+    older version. The version lives in the row, so a client sees its own
+    saves whichever worker or process made them. Listings and version
+    checks are that small query already and always go to the primary.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = new_session,
+        replica_factory: Callable[[], Optional[Session]] = new_replica_session,
+    ):
+        self._session_factory = session_factory
+        self._replica_factory = replica_factory
+        self.replica_reads = 0
+        self.replica_fallbacks = 0
+
+    def _read(self, query: Callable[[Session], T], fresh: Callable[[T], bool]) -> T:
+        """Run a read-only query on the replica if ``fresh`` accepts the result."""
+        replica = self._replica_factory()
+        if replica is not None:
+            try:
+                with replica as db:
+                    result = query(db)
+                self.replica_reads += 1
+                if fresh(result):
+                    return result
+            except SQLAlchemyError as exc:
+                logging.warning(f"Replica read failed, using the primary: {exc}")
+            self.replica_fallbacks += 1
+        with self._session_factory() as db:
+            return query(db)
+
+    def metrics(self) -> dict:
+        return {
+            "pools": pool_metrics(),
+            "replica_reads": self.replica_reads,
+            "replica_fallbacks": self.replica_fallbacks,
+        }
+
+    def warm_up(self, connections: int) -> None:
+        open_pool_connections(connections)
+
+    @staticmethod
+    def _row(diagram: BPMNDiagram) -> StoredDiagram:
+        return StoredDiagram(
+            id=str(diagram.id),
+            name=diagram.name,
+            updated_at=diagram.updated_at,
+            xml=diagram.bpmn_xml,
+            version=diagram.version,
+        )
+
+    @_sqlalchemy_errors
+    def is_empty(self) -> bool:
+        with self._session_factory() as db:
+            return db.query(BPMNDiagram.id).first() is None
+
+    @_sqlalchemy_errors
+    def list_diagrams(self) -> List[DiagramSummary]:
+        with self._session_factory() as db:
+            rows = db.query(
+                BPMNDiagram.id,
+                BPMNDiagram.name,
+                BPMNDiagram.updated_at,
+                BPMNDiagram.version,
+            )
+            return [DiagramSummary(str(id_), *rest) for id_, *rest in rows]
+
+    @_sqlalchemy_errors
+    def get(self, diagram_id: str) -> Optional[StoredDiagram]:
+        def query(db: Session) -> Optional[StoredDiagram]:
+            diagram = db.get(BPMNDiagram, uuid.UUID(diagram_id))
+            return self._row(diagram) if diagram else None
+
+        def fresh(diagram: Optional[StoredDiagram]) -> bool:
+            return diagram is not None and diagram.version >= (
+                self.get_version(diagram_id) or 0
+            )
+
+        return self._read(query, fresh)
+
+    @_sqlalchemy_errors
+    def get_version(self, diagram_id: str) -> Optional[int]:
+        with self._session_factory() as db:
+            return (
+                db.query(BPMNDiagram.version)
+                .filter(BPMNDiagram.id == uuid.UUID(diagram_id))
+                .scalar()
+            )
+
+    @_sqlalchemy_errors
+    def create(self, name: str, xml: str) -> StoredDiagram:
+        with self._session_factory() as db:
+            diagram = BPMNDiagram(name=name, bpmn_xml=xml)
+            db.add(diagram)
+            db.commit()
+            db.refresh(diagram)
+            return self._row(diagram)
+
+    @_sqlalchemy_errors
+    def update(self, diagram_id: str, change: Change) -> Optional[StoredDiagram]:
+        with self._session_factory() as db:
+            diagram = (
+                db.query(BPMNDiagram)
+                .filter(BPMNDiagram.id == uuid.UUID(diagram_id))
+                .with_for_update()
+                .first()
+            )
+            if not diagram:
+                return None
+            diagram.bpmn_xml = change(self._row(diagram))
+            diagram.version += 1
+            db.commit()
+            db.refresh(diagram)
+            return self._row(diagram)
+
+    @_sqlalchemy_errors
+    def insert_many(self, rows: List[dict]) -> int:
+        if not rows:
+            return 0
+        with self._session_factory() as db:
+            ids = [uuid.UUID(row["id"]) for row in rows]
+            existing = {
+                str(diagram_id)
+                for (diagram_id,) in db.query(BPMNDiagram.id).filter(
+                    BPMNDiagram.id.in_(ids)
+                )
+            }
+            new_rows = [
+                {
+                    "id": uuid.UUID(row["id"]),
+                    "name": row["name"],
+                    "bpmn_xml": row["xml"],
+                    "version": row["version"],
+                }
+                for row in rows
+                if row["id"] not in existing
+            ]
+            if new_rows:
+                db.execute(insert(BPMNDiagram), new_rows)
+                db.commit()
+            return len(new_rows)
+
+    @_sqlalchemy_errors
+    def page(self, after: Optional[str], limit: int) -> List[StoredDiagram]:
+        def query(db: Session) -> List[StoredDiagram]:
+            rows = db.query(BPMNDiagram).order_by(BPMNDiagram.id)
+            if after is not None:
+                rows = rows.filter(BPMNDiagram.id > uuid.UUID(after))
+            return [self._row(diagram) for diagram in rows.limit(limit)]
+
+        def fresh(diagrams: List[StoredDiagram]) -> bool:
+            # Every row the primary has in this page's range must be on it
+            versions = {d.id: d.version for d in diagrams}
+            with self._session_factory() as db:
+                rows = db.query(BPMNDiagram.id, BPMNDiagram.version).order_by(
+                    BPMNDiagram.id
+                )
+                if after is not None:
+                    rows = rows.filter(BPMNDiagram.id > uuid.UUID(after))
+                if len(diagrams) == limit:
+                    rows = rows.filter(BPMNDiagram.id <= uuid.UUID(diagrams[-1].id))
+                return all(
+                    versions.get(str(id_), 0) >= version
+                    for id_, version in rows.limit(limit)
+                )
+
+        return self._read(query, fresh)
+
+    @_sqlalchemy_errors
+    def append_events(self, events: List[Event]) -> None:
+        if not events:
+            return
+        rows = [
+            {**event, "diagram_id": uuid.UUID(event["diagram_id"])}
+            for event in events
+        ]
+        with self._session_factory() as db:
+            # One multi-row INSERT for the whole batch
+            db.execute(insert(CollaborationEvent), rows)
+            db.commit()
+
+    @_sqlalchemy_errors
+    def query_events(
+        self,
+        diagram_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        event_type: Optional[str] = None,
+        limit: int = 1000,
+    ) -> List[Event]:
+        # Audit reads tolerate replica lag, so they never fall back
+        with self._replica_factory() or self._session_factory() as db:
+            query = db.query(CollaborationEvent).filter(
+                CollaborationEvent.diagram_id == uuid.UUID(diagram_id)
+            )
+            if start is not None:
+                query = query.filter(CollaborationEvent.occurred_at >= start)
+            if end is not None:
+                query = query.filter(CollaborationEvent.occurred_at < end)
+            if event_type is not None:
+                query = query.filter(CollaborationEvent.type == event_type)
+            query = query.order_by(
+                CollaborationEvent.occurred_at, CollaborationEvent.id
+            )
+            return [
+                {
+                    "diagram_id": str(event.diagram_id),
+                    "occurred_at": as_utc(event.occurred_at),
+                    "type": event.type,
+                    "user_id": event.user_id,
+                    "user_name": event.user_name,
+                    "data": event.data or {},
+                }
+                for event in query.limit(limit)
+            ]
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bpmn_diagrams (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    bpmn_xml TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS collaboration_events (
+    id INTEGER PRIMARY KEY,
+    diagram_id TEXT NOT NULL,
+    occurred_at TEXT NOT NULL,
+    type TEXT NOT NULL,
+    user_id TEXT,
+    user_name TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_collaboration_events_diagram_time
+    ON collaboration_events (diagram_id, occurred_at);
+"""
+# Statements are fixed strings with bound parameters, so each connection
+# prepares them once and reuses them from its statement cache
+_SQL_ANY = "SELECT 1 FROM bpmn_diagrams LIMIT 1"
+_SQL_LIST = "SELECT id, name, updated_at, version FROM bpmn_diagrams"
+_SQL_GET = "SELECT id, name, updated_at, bpmn_xml, version FROM bpmn_diagrams WHERE id = ?"
+_SQL_VERSION = "SELECT version FROM bpmn_diagrams WHERE id = ?"
+_SQL_INSERT = (
+    "INSERT OR IGNORE INTO bpmn_diagrams (id, name, bpmn_xml, version, updated_at) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+_SQL_UPDATE = (
+    "UPDATE bpmn_diagrams SET bpmn_xml = ?, version = ?, updated_at = ? WHERE id = ?"
+)
+_SQL_PAGE = (
+    "SELECT id, name, updated_at, bpmn_xml, version FROM bpmn_diagrams "
+    "WHERE id > ? ORDER BY id LIMIT ?"
+)
+_SQL_APPEND_EVENT = (
+    "INSERT INTO collaboration_events "
+    "(diagram_id, occurred_at, type, user_id, user_name, data) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+# Timestamps are fixed-width UTC ISO strings, so they compare in time order
+_SQL_EVENTS = (
+    "SELECT diagram_id, occurred_at, type, user_id, user_name, data "
+    "FROM collaboration_events WHERE diagram_id = ? AND occurred_at >= ? "
+    "AND occurred_at < ? AND (? IS NULL OR type = ?) "
+    "ORDER BY occurred_at, id LIMIT ?"
+)
+_MIN_TIME = "0000"
+_MAX_TIME = "9999"
+
+
+def _sqlite_time(value: datetime) -> str:
+    return as_utc(value).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+class SQLiteStorage(StorageBackend):
+    """Diagrams in an embedded SQLite file, for single-node installs and tests.
+
+    The database runs in WAL mode so readers never wait for the writer, and
+    each thread keeps its own connection. Writes take the write lock up
+    front with ``BEGIN IMMEDIATE`` so concurrent updates serialize instead of
+    failing on lock upgrades.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self._path = path
+        self._busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._connection().executescript(_SQLITE_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly for writes
+            conn = sqlite3.connect(
+                self._path,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=32,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self._busy_timeout_ms)}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _row(row) -> StoredDiagram:
+        id_, name, updated_at, xml, version = row
+        return StoredDiagram(
+            id=id_,
+            name=name,
+            updated_at=datetime.fromisoformat(updated_at),
+            version=version,
+            xml=xml,
+        )
+
+    def warm_up(self, connections: int) -> None:
+        self._connection().execute(_SQL_ANY)
+
+    @_sqlite_errors
+    def is_empty(self) -> bool:
+        return self._connection().execute(_SQL_ANY).fetchone() is None
+
+    @_sqlite_errors
+    def list_diagrams(self) -> List[DiagramSummary]:
+        return [
+            DiagramSummary(id_, name, datetime.fromisoformat(updated_at), version)
+            for id_, name, updated_at, version in self._connection().execute(_SQL_LIST)
+        ]
+
+    @_sqlite_errors
+    def get(self, diagram_id: str) -> Optional[StoredDiagram]:
+        row = self._connection().execute(_SQL_GET, (diagram_id,)).fetchone()
+        return self._row(row) if row else None
+
+    @_sqlite_errors
+    def get_version(self, diagram_id: str) -> Optional[int]:
+        row = self._connection().execute(_SQL_VERSION, (diagram_id,)).fetchone()
+        return row[0] if row else None
+
+    @_sqlite_errors
+    def create(self, name: str, xml: str) -> StoredDiagram:
+        diagram = StoredDiagram(
+            id=str(uuid.uuid4()), name=name, updated_at=_now(), version=1, xml=xml
+        )
+        self._connection().execute(
+            _SQL_INSERT,
+            (diagram.id, name, xml, 1, diagram.updated_at.isoformat()),
+        )
+        return diagram
+
+    @_sqlite_errors
+    def update(self, diagram_id: str, change: Change) -> Optional[StoredDiagram]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(_SQL_GET, (diagram_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            current = self._row(row)
+            stored = replace(
+                current, xml=change(current), version=current.version + 1, updated_at=_now()
+            )
+            conn.execute(
+                _SQL_UPDATE,
+                (stored.xml, stored.version, stored.updated_at.isoformat(), diagram_id),
+            )
+            conn.execute("COMMIT")
+            return stored
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @_sqlite_errors
+    def insert_many(self, rows: List[dict]) -> int:
+        if not rows:
+            return 0
+        conn = self._connection()
+        updated_at = _now().isoformat()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                _SQL_INSERT,
+                [
+                    (row["id"], row["name"], row["xml"], row["version"], updated_at)
+                    for row in rows
+                ],
+            )
+            inserted = conn.total_changes - before
+            conn.execute("COMMIT")
+            return inserted
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @_sqlite_errors
+    def page(self, after: Optional[str], limit: int) -> List[StoredDiagram]:
+        rows = self._connection().execute(_SQL_PAGE, (after or "", limit))
+        return [self._row(row) for row in rows]
+
+    @_sqlite_errors
+    def append_events(self, events: List[Event]) -> None:
+        if not events:
+            return
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                _SQL_APPEND_EVENT,
+                [
+                    (
+                        event["diagram_id"],
+                        _sqlite_time(event["occurred_at"]),
+                        event["type"],
+                        event.get("user_id"),
+                        event.get("user_name"),
+                        json.dumps(event.get("data") or {}),
+                    )
+                    for event in events
+                ],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @_sqlite_errors
+    def query_events(
+        self,
+        diagram_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        event_type: Optional[str] = None,
+        limit: int = 1000,
+    ) -> List[Event]:
+        rows = self._connection().execute(
+            _SQL_EVENTS,
+            (
+                diagram_id,
+                _sqlite_time(start) if start else _MIN_TIME,
+                _sqlite_time(end) if end else _MAX_TIME,
+                event_type,
+                event_type,
+                limit,
+            ),
+        )
+        return [
+            {
+                "diagram_id": diagram_id_,
+                "occurred_at": datetime.fromisoformat(occurred_at),
+                "type": type_,
+                "user_id": user_id,
+                "user_name": user_name,
+                "data": json.loads(data) if data else {},
+            }
+            for diagram_id_, occurred_at, type_, user_id, user_name, data in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class MemoryStorage(StorageBackend):
+    """Diagrams in a dict; nothing survives a restart. Meant for tests."""
+
+    def __init__(self):
+        self._diagrams: Dict[str, StoredDiagram] = {}
+        self._events: Dict[str, List[Event]] = {}
+        self._lock = threading.Lock()
+
+    def is_empty(self) -> bool:
+        return not self._diagrams
+
+    def list_diagrams(self) -> List[DiagramSummary]:
+        with self._lock:
+            return [
+                DiagramSummary(d.id, d.name, d.updated_at, d.version)
+                for d in self._diagrams.values()
+            ]
+
+    def get(self, diagram_id: str) -> Optional[StoredDiagram]:
+        diagram = self._diagrams.get(diagram_id)
+        return replace(diagram) if diagram else None
+
+    def get_version(self, diagram_id: str) -> Optional[int]:
+        diagram = self._diagrams.get(diagram_id)
+        return diagram.version if diagram else None
+
+    def create(self, name: str, xml: str) -> StoredDiagram:
+        diagram = StoredDiagram(
+            id=str(uuid.uuid4()), name=name, updated_at=_now(), version=1, xml=xml
+        )
+        with self._lock:
+            self._diagrams[diagram.id] = diagram
+        return replace(diagram)
+
+    def update(self, diagram_id: str, change: Change) -> Optional[StoredDiagram]:
+        with self._lock:
+            current = self._diagrams.get(diagram_id)
+            if current is None:
+                return None
+            stored = replace(
+                current,
+                xml=change(replace(current)),
+                version=current.version + 1,
+                updated_at=_now(),
+            )
+            self._diagrams[diagram_id] = stored
+            return replace(stored)
+
+    def insert_many(self, rows: List[dict]) -> int:
+        inserted = 0
+        updated_at = _now()
+        with self._lock:
+            for row in rows:
+                if row["id"] not in self._diagrams:
+                    self._diagrams[row["id"]] = StoredDiagram(
+                        id=row["id"],
+                        name=row["name"],
+                        updated_at=updated_at,
+                        version=row["version"],
+                        xml=row["xml"],
+                    )
+                    inserted += 1
+        return inserted
+
+    def page(self, after: Optional[str], limit: int) -> List[StoredDiagram]:
+        with self._lock:
+            ids = sorted(i for i in self._diagrams if after is None or i > after)
+            return [replace(self._diagrams[i]) for i in ids[:limit]]
+
+    def append_events(self, events: List[Event]) -> None:
+        with self._lock:
+            for event in events:
+                self._events.setdefault(event["diagram_id"], []).append(
+                    {**event, "occurred_at": as_utc(event["occurred_at"])}
+                )
+
+    def query_events(
+        self,
+        diagram_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        event_type: Optional[str] = None,
+        limit: int = 1000,
+    ) -> List[Event]:
+        with self._lock:
+            events = [
+                dict(event)
+                for event in self._events.get(diagram_id, [])
+                if (start is None or event["occurred_at"] >= start)
+                and (end is None or event["occurred_at"] < end)
+                and (event_type is None or event["type"] == event_type)
+            ]
+        # Stable, so events with equal timestamps stay in append order
+        events.sort(key=lambda event: event["occurred_at"])
+        return events[:limit]
+
+
+def create_storage(kind: str, sqlite_path: str = "") -> StorageBackend:
+    """Build the backend named by ``STORAGE_BACKEND``."""
+    if kind in ("postgres", "sqlalchemy"):
+        return SQLAlchemyStorage()
+    if kind == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    if kind == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,35 @@
+"""Shared test fixtures."""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from database import Base, SessionLocal
+from main import app
+
+
+@pytest.fixture
+def db_engine():
+    """Bind the session factory to a fresh in-memory SQLite database."""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    original_bind = SessionLocal.kw.get("bind")
+    SessionLocal.configure(bind=engine)
+    yield engine
+    SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+@pytest.fixture
+def client(db_engine):
+    """A test client running the app's startup and shutdown on that database.
+
+    Modules that need other settings override this with a ``client`` fixture
+    that patches them and returns this one.
+    """
+    with TestClient(app) as client:
+        yield client
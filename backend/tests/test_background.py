@@ -0,0 +1,36 @@
+"""Tests for per-diagram background work that only keeps the newest request."""
+import asyncio
+
+from background import LatestOnlyWorker
+
+
+def test_only_the_newest_request_runs_after_the_current_one():
+    runs = []
+    release = asyncio.Event()
+
+    async def job(key, version):
+        runs.append((key, version))
+        if version == 1:
+            await release.wait()
+        if version == 3:
+            raise RuntimeError("broken diagram")
+
+    async def scenario():
+        worker = LatestOnlyWorker(job, "Test job")
+        worker.schedule("a", 1)
+        await asyncio.sleep(0)
+        for version in (2, 3, 4):
+            worker.schedule("a", version)
+        worker.schedule("b", 1)
+        release.set()
+        await asyncio.sleep(0.01)
+        assert not worker._tasks
+        # A failure is logged and the key can be scheduled again
+        worker.schedule("b", 3)
+        await asyncio.sleep(0.01)
+        worker.schedule("b", 5)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert [run for run in runs if run[0] == "a"] == [("a", 1), ("a", 4)]
+    assert [run for run in runs if run[0] == "b"] == [("b", 1), ("b", 3), ("b", 5)]
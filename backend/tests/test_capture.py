@@ -0,0 +1,112 @@
+"""Tests for WebSocket session capture and replay."""
+import asyncio
+import gzip
+import json
+
+import pytest
+
+import routes
+from benchmarks.ws_load import local_server
+from benchmarks.ws_replay import load_capture, replay
+from cache import CachedXml
+from capture import SessionRecorder, read_capture, session_recorder
+from config import load_example_xml
+
+XML = load_example_xml("simple_approval_process.bpmn")
+EDITED = XML.replace('name="', 'name="Edited ', 1)
+CACHED = CachedXml(3, XML)
+
+
+def _raw_records(path):
+    with gzip.open(path, "rt") as capture:
+        return [json.loads(line) for line in capture]
+
+
+def test_capture_deduplicates_xml_and_times_messages(tmp_path):
+    async def scenario():
+        recorder = SessionRecorder(str(tmp_path), "*", 1024 * 1024, 0.01)
+        first, second = object(), object()
+        recorder.opened("d1", CACHED, first, "Ada")
+        recorder.opened("d1", CACHED, second, "Bob")
+        for socket in (first, second, first):
+            update = {"type": "diagram_update", "data": {"xml": EDITED}}
+            recorder.message("d1", socket, "x", update)
+        recorder.message("d1", second, "x", {"type": "cursor", "data": {"x": 1}})
+        await asyncio.sleep(0.05)  # let the background writer flush once
+        recorder.closed("d1", first)
+        return await recorder.stop("d1")
+
+    result = asyncio.run(scenario())
+    assert result["messages"] == 4
+    raw = _raw_records(result["path"])
+    # The initial and the edited XML are each stored once
+    blobs = [r["xml"] for r in raw if r["kind"] == "blob"]
+    assert blobs == [XML, EDITED]
+    assert sum(len(json.dumps(r)) for r in raw) < 2 * (len(XML) + len(EDITED))
+
+    records = list(read_capture(result["path"]))
+    assert records[0]["kind"] == "header"
+    assert (records[0]["version"], records[0]["xml"]) == (3, XML)
+    kinds = [(r["kind"], r.get("conn")) for r in records[1:]]
+    assert kinds == [
+        ("open", 0), ("open", 1), ("msg", 0), ("msg", 1), ("msg", 0), ("msg", 1),
+        ("close", 0),
+    ]
+    assert records[3]["message"]["data"]["xml"] == EDITED
+    times = [r["t"] for r in records[1:]]
+    assert times == sorted(times)
+
+
+def test_capture_stops_growing_at_its_size_limit(tmp_path):
+    async def scenario():
+        recorder = SessionRecorder(str(tmp_path), "d1", 2000, 60)
+        socket = object()
+        recorder.opened("d1", CACHED, socket, "Ada")  # the header alone is over 2000
+        recorder.message("d1", socket, "Ada", {"type": "ping"})
+        recorder.message("d1", socket, "Ada", {"type": "ping"})
+        return await recorder.stop("d1")
+
+    result = asyncio.run(scenario())
+    assert result["messages"] == 1
+    assert _raw_records(result["path"])[-1]["kind"] == "truncated"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, client):
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(session_recorder, "directory", str(tmp_path))
+    return client
+
+
+def test_captured_room_replays_against_a_server(client):
+    diagram = client.post("/api/diagrams", json={"name": "x", "initial_xml": XML}).json()
+    url = f"/admin/rooms/{diagram['id']}/capture"
+    assert client.post(url).status_code == 404
+    headers = {"x-admin-token": "secret"}
+    assert client.post(url, headers=headers).status_code == 200
+
+    with client.websocket_connect(f"/ws/{diagram['id']}?user_name=Ada") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "element_lock", "data": {"element_id": "Task_1"}})
+        ws.send_json(
+            {
+                "type": "diagram_update",
+                "data": {"xml": EDITED, "base_version": diagram["version"]},
+            }
+        )
+        while ws.receive_json()["type"] != "diagram_ack":
+            pass
+    path = client.delete(url, headers=headers).json()["path"]
+    assert client.delete(url, headers=headers).status_code == 404
+
+    header, timelines = load_capture(path)
+    assert header["diagram_id"] == diagram["id"]
+    assert [r["kind"] for r in timelines[0]] == ["open", "msg", "msg", "close"]
+    assert timelines[0][0]["user_name"] == "Ada"
+
+    with local_server() as (server_url, _):
+        results = asyncio.run(replay(server_url, path, speed=0))
+    assert results["connections"] == 1
+    assert results["sent"] == 2
+    assert results["errors"] == 0
+    assert results["save_p50_ms"] is not None
@@ -0,0 +1,137 @@
+"""Tests for chunked XML transfer over WebSockets."""
+import pytest
+
+import routes
+from benchmarks.ws_load import synthetic_bpmn
+from chunked import ChunkError, ChunkReceiver, decode_chunk, encode_chunk, iter_chunks
+
+CHUNK = 16 * 1024
+
+
+def test_receiver_reassembles_in_order_and_enforces_limits():
+    body = ("<x>" + "é" * 5000 + "</x>").encode("utf-8")
+    receiver = ChunkReceiver(max_size=len(body), max_chunk=4096)
+    receiver.start({"transfer": 7, "size": len(body), "base_version": 3})
+    frames = list(iter_chunks(7, body, 4096))
+    assert len(frames) == 3
+    for frame in frames[:-1]:
+        assert receiver.receive(frame) == (receiver.upload, False)
+    upload, complete = receiver.receive(frames[-1])
+    assert complete and upload.base_version == 3
+    assert upload.text().encode("utf-8") == body
+    assert receiver.upload is None
+
+    with pytest.raises(ChunkError, match="exceeds"):
+        receiver.start({"transfer": 8, "size": len(body) + 1})
+    # Chunks of a refused transfer are dropped without another error
+    assert receiver.receive(encode_chunk(8, 0, b"x")) == (None, False)
+
+    receiver.start({"transfer": 9, "size": len(body)})
+    with pytest.raises(ChunkError, match="Expected chunk 0, got 1"):
+        receiver.receive(encode_chunk(9, 1, b"x"))
+    receiver.start({"transfer": 10, "size": len(body)})
+    with pytest.raises(ChunkError, match="exceeds 4096"):
+        receiver.receive(encode_chunk(10, 0, b"x" * 4097))
+    with pytest.raises(ChunkError, match="not started"):
+        receiver.receive(encode_chunk(11, 0, b"x"))
+    with pytest.raises(ChunkError, match="shorter"):
+        decode_chunk(b"abc")
+
+
+def test_failed_transfer_can_be_restarted_under_the_same_id():
+    receiver = ChunkReceiver(max_size=100, max_chunk=10)
+    receiver.start({"transfer": 5, "size": 4})
+    with pytest.raises(ChunkError):
+        receiver.receive(encode_chunk(5, 1, b"late"))
+    # Stale chunks of the failed attempt do not disturb another upload
+    receiver.start({"transfer": 6, "size": 4})
+    assert receiver.receive(encode_chunk(5, 2, b"late")) == (None, False)
+    upload, complete = receiver.receive(encode_chunk(6, 0, b"abcd"))
+    assert complete and upload.text() == "abcd"
+
+    receiver.start({"transfer": 5, "size": 4})
+    upload, complete = receiver.receive(encode_chunk(5, 0, b"wxyz"))
+    assert complete and upload.text() == "wxyz"
+
+
+@pytest.fixture
+def client(monkeypatch, client):
+    monkeypatch.setattr(routes, "XML_CHUNK_SIZE", CHUNK)
+    return client
+
+
+def test_initial_state_streams_the_xml_in_chunks(client):
+    xml = synthetic_bpmn(200)
+    diagram = client.post("/api/diagrams", json={"name": "big", "initial_xml": xml})
+    diagram_id = diagram.json()["id"]
+
+    with client.websocket_connect(f"/ws/{diagram_id}?chunked=1") as ws:
+        state = ws.receive_json()
+        assert state["type"] == "diagram_state"
+        assert "xml" not in state["data"]
+        transfer = state["data"]["xml_transfer"]
+        assert transfer["size"] == len(xml.encode("utf-8"))
+        assert transfer["chunks"] > 1
+
+        body = bytearray()
+        for expected in range(transfer["chunks"]):
+            # Other messages for the room may arrive between chunks
+            frame = ws.receive()
+            while frame.get("bytes") is None:
+                frame = ws.receive()
+            number, sequence, payload = decode_chunk(frame["bytes"])
+            assert (number, sequence) == (transfer["transfer"], expected)
+            assert len(payload) <= CHUNK
+            body += payload
+        assert body.decode("utf-8") == xml
+
+    # Without the flag the XML is still sent inline
+    with client.websocket_connect(f"/ws/{diagram_id}") as ws:
+        assert ws.receive_json()["data"]["xml"] == xml
+
+
+def test_chunked_upload_reports_progress_and_saves(client):
+    diagram = client.post("/api/diagrams", json={"name": "big"}).json()
+    xml = synthetic_bpmn(200, "Uploaded in chunks")
+    body = xml.encode("utf-8")
+
+    with client.websocket_connect(f"/ws/{diagram['id']}") as editor:
+        with client.websocket_connect(f"/ws/{diagram['id']}") as other:
+            editor.receive_json()
+            other.receive_json()
+            editor.send_json(
+                {
+                    "type": "xml_upload_start",
+                    "data": {
+                        "transfer": 1,
+                        "size": len(body),
+                        "base_version": diagram["version"],
+                    },
+                }
+            )
+            progress = []
+            for frame in iter_chunks(1, body, CHUNK):
+                editor.send_bytes(frame)
+                message = editor.receive_json()
+                while message["type"] != "xml_upload_progress":
+                    message = editor.receive_json()
+                progress.append(message["data"]["received"])
+            assert progress == sorted(progress) and progress[-1] == len(body)
+            assert editor.receive_json()["type"] == "diagram_ack"
+
+            message = other.receive_json()
+            while message["type"] != "diagram_update":
+                message = other.receive_json()
+            assert message["data"]["xml"] == xml
+
+            # A chunk that does not follow on is refused
+            editor.send_json(
+                {"type": "xml_upload_start", "data": {"transfer": 2, "size": 10}}
+            )
+            editor.send_bytes(encode_chunk(2, 5, b"x"))
+            message = editor.receive_json()
+            while message["type"] != "xml_upload_error":
+                message = editor.receive_json()
+            assert message["data"]["transfer"] == 2
+
+    assert client.get(f"/api/diagrams/{diagram['id']}/xml").text == xml
@@ -0,0 +1,108 @@
+"""Tests for the batched cursor relay."""
+import asyncio
+import json
+import random
+
+import pytest
+from cursors import CursorRelay, parse_cursor
+import routes
+
+
+def test_positions_are_quantized_and_validated():
+    assert parse_cursor({"x": 10.4, "y": -3.6}) == [10, -4]
+    assert parse_cursor(
+        {"x": 1, "y": 2, "viewport": {"x": 0.2, "y": 0, "width": 800.7, "height": 600}}
+    ) == [1, 2, 0, 0, 801, 600]
+    assert parse_cursor({"x": 1, "y": 2, "viewport": {"x": 0}}) == [1, 2]
+    assert parse_cursor({"x": "1", "y": 2}) is None
+    assert parse_cursor({"x": float("nan"), "y": 2}) is None
+    assert parse_cursor({"x": 1e12, "y": 0}) == [1_000_000, 0]
+
+
+def test_load_100_users_moving_continuously():
+    """Every user moves on every event loop turn; each tick yields one frame."""
+    tick = 0.02
+    frames = []
+
+    async def broadcast(diagram_id, text):
+        frames.append(json.loads(text))
+
+    async def scenario():
+        relay = CursorRelay(tick, stale_after=1.0, broadcast=broadcast)
+        users = [f"user{i}" for i in range(100)]
+        for user in users:
+            relay.attach("room", user, user)
+        loop = asyncio.get_running_loop()
+        rng = random.Random(0)
+        moves = 0
+        deadline = loop.time() + tick * 10
+        while loop.time() < deadline:
+            for user in users:
+                position = {"x": rng.uniform(0, 2000), "y": rng.uniform(0, 2000)}
+                relay.move("room", user, position)
+                moves += 1
+            await asyncio.sleep(0)
+        await asyncio.sleep(tick * 2)
+        return moves
+
+    moves = asyncio.run(scenario())
+    assert moves > len(frames) * 100
+    # One frame per tick, give or take scheduling jitter
+    assert 5 <= len(frames) <= 14
+    assert [frame["data"]["seq"] for frame in frames] == list(range(1, len(frames) + 1))
+    # Each user appears at most once per frame, with only its latest position
+    for frame in frames:
+        slots = [entry[0] for entry in frame["data"]["cursors"]]
+        assert len(slots) == len(set(slots)) <= 100
+
+
+def test_stale_and_detached_cursors_are_reported_gone():
+    frames = []
+
+    async def broadcast(diagram_id, text):
+        frames.append(json.loads(text)["data"])
+
+    async def scenario():
+        relay = CursorRelay(0.01, stale_after=0.05, broadcast=broadcast)
+        alice = relay.attach("room", "a", "alice")
+        bob = relay.attach("room", "b", "bob")
+        relay.move("room", "a", {"x": 1, "y": 2})
+        relay.move("room", "b", {"x": 3, "y": 4})
+        await asyncio.sleep(0.02)
+        relay.detach("room", "b")
+        await asyncio.sleep(0.02)
+        # alice stops moving and goes stale
+        await asyncio.sleep(0.1)
+        return alice, bob, relay
+
+    alice, bob, relay = asyncio.run(scenario())
+    assert frames[0]["cursors"] == [[alice, "alice", 1, 2], [bob, "bob", 3, 4]]
+    assert frames[1] == {"seq": 2, "cursors": [], "gone": [bob]}
+    assert frames[-1]["gone"] == [alice]
+    # The ticker stops once no cursors are left
+    assert relay._rooms["room"].ticker is None
+
+
+@pytest.fixture
+def client(monkeypatch, client):
+    """The test client with a short cursor tick."""
+    monkeypatch.setattr(routes.cursors, "tick", 0.01)
+    return client
+
+
+def test_cursor_moves_are_relayed_in_batched_frames(client):
+    diagram = client.post("/api/diagrams", json={"name": "x"}).json()
+    url = f"/ws/{diagram['id']}"
+    with client.websocket_connect(f"{url}?user_name=alice") as alice:
+        alice_slot = alice.receive_json()["data"]["cursor_id"]
+        with client.websocket_connect(f"{url}?user_name=bob") as bob:
+            assert bob.receive_json()["data"]["cursor_id"] != alice_slot
+            for x in range(5):
+                alice.send_json({"type": "cursor", "data": {"x": x, "y": 7.2}})
+
+            entries = []
+            while [alice_slot, "alice", 4, 7] not in entries:
+                message = bob.receive_json()
+                if message["type"] == "cursors":
+                    entries.extend(message["data"]["cursors"])
+            assert all(entry[:2] == [alice_slot, "alice"] for entry in entries)
@@ -0,0 +1,30 @@
+"""Tests for the lazily created database engine and its warmup."""
+import threading
+
+import database
+
+
+def test_warmup_retries_until_the_database_answers(monkeypatch):
+    monkeypatch.setattr(database, "_pool_ready", threading.Event())
+    attempts = []
+
+    def warm_up(connections):
+        attempts.append(connections)
+        if len(attempts) < 3:
+            raise OSError("connection refused")
+
+    database.warm_up_pool(2, warm_up, retry_delay=0)
+    assert attempts == [2, 2, 2]
+    assert database.is_pool_ready()
+
+
+def test_warmup_gives_up_without_a_database_url(monkeypatch):
+    monkeypatch.setattr(database, "_pool_ready", threading.Event())
+    monkeypatch.setattr(database, "SQLALCHEMY_DATABASE_URL", None)
+    monkeypatch.setattr(database.SessionLocal, "kw", {**database.SessionLocal.kw})
+    database.SessionLocal.kw.pop("bind", None)
+
+    thread = database.start_pool_warmup(1)
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert not database.is_pool_ready()
@@ -0,0 +1,47 @@
+"""Tests for the raw diagram XML endpoint."""
+import gzip
+
+from services import diagram_service
+
+XML = '<?xml version="1.0" encoding="UTF-8"?><bpmn2:definitions id="d"/>'
+
+
+def test_xml_endpoint_serves_etag_and_304(client):
+    diagram = client.post("/api/diagrams", json={"name": "x", "initial_xml": XML}).json()
+
+    response = client.get(
+        f"/api/diagrams/{diagram['id']}/xml", headers={"accept-encoding": "identity"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/xml")
+    assert response.text == XML
+    etag = response.headers["etag"]
+
+    response = client.get(
+        f"/api/diagrams/{diagram['id']}/xml", headers={"if-none-match": etag}
+    )
+    assert response.status_code == 304
+
+    diagram_service.update_diagram(diagram["id"], XML.replace('"d"', '"e"'))
+    response = client.get(
+        f"/api/diagrams/{diagram['id']}/xml", headers={"if-none-match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_xml_endpoint_reuses_compressed_body(client):
+    diagram = client.post("/api/diagrams", json={"name": "x", "initial_xml": XML}).json()
+    url = f"/api/diagrams/{diagram['id']}/xml"
+
+    response = client.get(url, headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == XML
+
+    cached = diagram_service.get_diagram_xml(diagram["id"])
+    assert gzip.decompress(cached.body("gzip")) == XML.encode()
+    assert cached.body("gzip") is diagram_service.get_diagram_xml(diagram["id"]).body("gzip")
+
+
+def test_xml_endpoint_unknown_diagram(client):
+    assert client.get("/api/diagrams/not-a-uuid/xml").status_code == 404
@@ -0,0 +1,205 @@
+"""Tests for draining a process and handing its rooms to the next one."""
+import asyncio
+import json
+import os
+import signal
+import time
+import urllib.request
+
+import pytest
+import websockets
+
+import routes
+from benchmarks.ws_load import local_server
+from drain import RESTART_CLOSE_CODE, DrainCoordinator
+from services import diagram_service
+
+HEADERS = {"x-admin-token": "secret"}
+
+
+def _coordinator(handoff_dir, instance="old"):
+    return DrainCoordinator(
+        str(handoff_dir),
+        1000,
+        60,
+        routes.spectators,
+        routes._broadcast_to_all,
+        instance=instance,
+    )
+
+
+def _receive_close(ws) -> dict:
+    message = ws.receive()
+    while message["type"] != "websocket.close":
+        message = ws.receive()
+    return message
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path, client):
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(routes, "drainer", _coordinator(tmp_path))
+    return client
+
+
+def test_drain_hands_locks_to_the_next_process(client, monkeypatch, tmp_path):
+    diagram = client.post("/api/diagrams", json={"name": "drained"}).json()
+    url = f"/ws/{diagram['id']}"
+
+    with client.websocket_connect(f"{url}?user_name=Ann") as ws:
+        state = ws.receive_json()["data"]
+        ws.send_json({"type": "element_lock", "data": {"element_id": "Task_1"}})
+        ws.send_json({"type": "ping"})
+        while ws.receive_json()["type"] != "pong":
+            pass
+        user_id = diagram_service.get_element_locks(diagram["id"])["Task_1"].user_id
+
+        result = client.post("/admin/drain", headers=HEADERS).json()
+        assert (result["rooms"], result["connections"], result["locks"]) == (1, 1, 1)
+        close = _receive_close(ws)
+        assert close["code"] == RESTART_CLOSE_CODE
+        hint = json.loads(close["reason"])
+        assert hint["version"] == state["version"]
+        assert 0 <= hint["retry_ms"] <= 1000
+
+    # Draining turns away new sockets and fails readiness
+    assert client.get("/healthz/ready").status_code == 503
+    with client.websocket_connect(url) as ws:
+        assert _receive_close(ws)["code"] == RESTART_CLOSE_CODE
+    # Repeated drains share the first one
+    assert client.post("/admin/drain", headers=HEADERS).json() == result
+
+    # The next process, perhaps with the same PID, takes over
+    monkeypatch.setattr(routes, "drainer", _coordinator(tmp_path, instance="new"))
+    assert client.get("/healthz/ready").status_code == 200
+
+    query = f"resume={hint['resume']}&version={hint['version']}"
+    with client.websocket_connect(f"{url}?{query}") as ws:
+        state = ws.receive_json()["data"]
+        assert state["xml_unchanged"] and "xml" not in state
+        assert state["my_user_name"] == "Ann"
+        assert state["locks"]["Task_1"]["user_id"] == user_id
+
+    # A token only resumes once
+    with client.websocket_connect(f"{url}?resume={hint['resume']}") as ws:
+        state = ws.receive_json()["data"]
+        assert state["my_user_name"] != "Ann" and "xml" in state
+
+
+def test_unclaimed_locks_are_released_after_the_handoff_ttl(tmp_path):
+    handoff = {
+        "instance": "old",
+        "written_at": time.time(),
+        "rooms": {
+            "room": {
+                "version": 1,
+                "sessions": [{"resume": "t", "user_id": "u1", "user_name": "Ann"}],
+                "locks": {
+                    "Task_1": {"user_id": "u1", "user_name": "Ann"},
+                    "Task_2": {"user_id": "u2", "user_name": "Bob"},
+                },
+            }
+        },
+    }
+    with open(os.path.join(tmp_path, "handoff-old.json"), "w") as out:
+        json.dump(handoff, out)
+    sent = []
+
+    async def broadcast(diagram_id, message):
+        sent.append((diagram_id, message["type"], message["data"]["element_id"]))
+
+    async def scenario():
+        drainer = DrainCoordinator(
+            str(tmp_path), 0, 0.2, routes.spectators, broadcast
+        )
+        assert await drainer.restore() == 1
+        assert set(diagram_service.get_element_locks("room")) == {"Task_1", "Task_2"}
+        assert await drainer.resume("room", "t") == {"user_id": "u1", "user_name": "Ann"}
+        await asyncio.sleep(0.3)
+        # Nothing is held for the returned user any more, so it is forgotten
+        assert not drainer._returned
+        await drainer.close()
+
+    try:
+        asyncio.run(scenario())
+        # The returning user keeps the lock; the other one is released
+        assert set(diagram_service.get_element_locks("room")) == {"Task_1"}
+        assert sent[-1] == ("room", "element_unlocked", "Task_2")
+    finally:
+        diagram_service.unlock_all_user_elements("room", "u1")
+
+
+def test_unknown_tokens_rescan_the_handoff_directory_once_per_interval(
+    tmp_path, monkeypatch
+):
+    drainer = DrainCoordinator(
+        str(tmp_path), 0, 60, routes.spectators, routes._broadcast_to_all
+    )
+    scans = []
+    monkeypatch.setattr(drainer, "_read_new", lambda: scans.append(1) or [])
+
+    async def scenario():
+        for token in ("a", "b", "c"):
+            assert await drainer.resume("room", token) is None
+        drainer._next_rescan = 0.0
+        assert await drainer.resume("room", "d") is None
+
+    asyncio.run(scenario())
+    assert len(scans) == 2
+
+
+def test_sigterm_drains_then_stops_the_server(tmp_path):
+    with local_server(env={"DRAIN_HANDOFF_DIR": str(tmp_path)}) as (url, pid):
+        request = urllib.request.Request(
+            f"{url}/api/diagrams",
+            data=json.dumps({"name": "signalled"}).encode(),
+            headers={"content-type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            diagram_id = json.load(response)["id"]
+
+        async def scenario():
+            ws_url = url.replace("http", "ws", 1)
+            async with websockets.connect(f"{ws_url}/ws/{diagram_id}") as ws:
+                await ws.recv()
+                os.kill(pid, signal.SIGTERM)
+                with pytest.raises(websockets.ConnectionClosed) as closed:
+                    while True:
+                        await asyncio.wait_for(ws.recv(), 10)
+                return closed.value.rcvd
+
+        close = asyncio.run(scenario())
+        assert close.code == RESTART_CLOSE_CODE
+        assert "resume" in json.loads(close.reason)
+        # The signal then shuts the server down as it would have
+        status = None
+        deadline = time.monotonic() + 15
+        while status is None and time.monotonic() < deadline:
+            reaped, status = os.waitpid(pid, os.WNOHANG)
+            status = status if reaped else None
+            time.sleep(0.05)
+        assert status is not None, "drained server did not exit"
+    assert len(list(tmp_path.glob("handoff-*.json"))) == 1
+
+
+def test_signal_handled_on_the_loop_still_stops_the_server(tmp_path):
+    # Before 0.29, uvicorn registers its shutdown handler on the event loop
+    stopped = []
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stopped.append, sig)
+        drainer = _coordinator(tmp_path)
+        drainer.install_signal_handler("SIGTERM")
+        os.kill(os.getpid(), signal.SIGTERM)
+        for _ in range(200):
+            if stopped:
+                break
+            await asyncio.sleep(0.01)
+        return drainer
+
+    drainer = asyncio.run(scenario())
+    assert drainer.draining
+    assert stopped == [signal.SIGINT]
+    assert (tmp_path / "handoff-old.json").exists()
@@ -0,0 +1,254 @@
+"""Tests for the group-committed collaboration event log."""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from events import EventLog, event_log
+from storage import MemoryStorage
+
+DIAGRAM = str(uuid.uuid4())
+
+
+class CountingStorage(MemoryStorage):
+    """Counts batch writes and can be made to fail like a database outage."""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.failing = False
+
+    def append_events(self, events):
+        if self.failing:
+            raise RuntimeError("database unavailable")
+        self.batches.append(len(events))
+        super().append_events(events)
+
+
+def _log(storage, tmp_path, **overrides):
+    settings = {
+        "batch_size": 10,
+        "flush_interval": 60,
+        "max_queue": 20,
+        "spill_dir": str(tmp_path / "spill"),
+        "spill_max_bytes": 1024 * 1024,
+        **overrides,
+    }
+    return EventLog(storage, **settings)
+
+
+def _event(version):
+    return {
+        "diagram_id": DIAGRAM,
+        "occurred_at": datetime.now(timezone.utc),
+        "type": "edit",
+        "user_id": None,
+        "user_name": None,
+        "data": {"version": version},
+    }
+
+
+@pytest.fixture
+def run(tmp_path):
+    def run(scenario):
+        asyncio.run(scenario(tmp_path))
+
+    return run
+
+
+def test_full_batches_are_written_together(run):
+    async def scenario(tmp_path):
+        storage = CountingStorage()
+        log = _log(storage, tmp_path, max_queue=100)
+        for i in range(5):
+            log.record(DIAGRAM, "edit", "u1", "Ada", version=i)
+        await asyncio.sleep(0.05)
+        # A partial batch waits for the flush interval
+        assert storage.batches == []
+        for i in range(5, 25):
+            log.record(DIAGRAM, "edit", "u1", "Ada", version=i)
+        await asyncio.sleep(0.05)
+        # A full batch wakes the writer, which drains the queue in batches
+        assert storage.batches == [10, 10, 5]
+        assert log.pending() == 0
+        await log.close()
+        versions = [e["data"]["version"] for e in log.query(DIAGRAM)]
+        assert versions == list(range(25))
+        assert log.stats()["batches"] == 3
+
+    run(scenario)
+
+
+def test_partial_batches_are_written_after_the_flush_interval(run):
+    async def scenario(tmp_path):
+        storage = CountingStorage()
+        log = _log(storage, tmp_path, flush_interval=0.05)
+        log.record(DIAGRAM, "join", "u1", "Ada")
+        log.record(DIAGRAM, "lock", "u1", "Ada", element_id="Task_1")
+        assert storage.batches == []
+        await asyncio.sleep(0.2)
+        assert storage.batches == [2]
+        # The idle writer exits and the next event starts a new one
+        assert log._writer.done()
+        log.record(DIAGRAM, "leave", "u1", "Ada")
+        await asyncio.sleep(0.2)
+        assert storage.batches == [2, 1]
+        await log.close()
+
+    run(scenario)
+
+
+def test_overflow_spills_to_disk_and_is_replayed(run):
+    async def scenario(tmp_path):
+        storage = CountingStorage()
+        storage.failing = True
+        log = _log(storage, tmp_path)
+        for i in range(50):
+            log.record(DIAGRAM, "edit", version=i)
+        # The queue stays bounded; the oldest events go to the spill file
+        assert log.pending() <= 20
+        await log.close()
+        assert log.stats()["spilled"] == 50
+        assert os.listdir(tmp_path / "spill")
+
+        storage.failing = False
+        await log.flush()
+        assert log.pending() == 0
+        assert os.listdir(tmp_path / "spill") == []
+        events = log.query(DIAGRAM)
+        assert sorted(e["data"]["version"] for e in events) == list(range(50))
+        await log.close()
+
+    run(scenario)
+
+
+def test_failed_replay_keeps_the_unwritten_rest(run):
+    async def scenario(tmp_path):
+        storage = CountingStorage()
+        log = _log(storage, tmp_path, batch_size=2, max_queue=2)
+        log._spill([_event(i) for i in range(5)])
+        calls = []
+
+        def flaky(events):
+            calls.append(len(events))
+            if len(calls) == 2:
+                raise RuntimeError("connection reset")
+            MemoryStorage.append_events(storage, events)
+
+        storage.append_events = flaky
+        await log.flush()
+        assert len(log.query(DIAGRAM)) == 2
+        await log.flush()
+        # Nothing was written twice
+        versions = [e["data"]["version"] for e in log.query(DIAGRAM)]
+        assert versions == [0, 1, 2, 3, 4]
+        assert os.listdir(tmp_path / "spill") == []
+
+    run(scenario)
+
+
+def test_spill_size_is_bounded(tmp_path):
+    log = _log(MemoryStorage(), tmp_path, spill_max_bytes=600)
+    log._spill([_event(i) for i in range(20)])
+    stats = log.stats()
+    assert 0 < stats["spilled"] < 20
+    assert stats["spilled"] + stats["dropped"] == 20
+    assert os.path.getsize(log._spill_path()) <= 600
+
+
+def _write_spill(path, versions):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as spill:
+        for version in versions:
+            event = _event(version)
+            event["occurred_at"] = event["occurred_at"].isoformat()
+            spill.write(json.dumps(event) + "\n")
+
+
+def test_only_closed_or_orphaned_spill_files_are_replayed(run):
+    dead = subprocess.Popen([sys.executable, "-c", ""])
+    dead.wait()
+
+    async def scenario(tmp_path):
+        storage = CountingStorage()
+        log = _log(storage, tmp_path)
+        spill = tmp_path / "spill"
+        # Another live worker is still appending to its file
+        _write_spill(spill / f"spilling-{os.getppid()}.jsonl", [0])
+        _write_spill(spill / f"spilling-{dead.pid}.jsonl", [1])
+        _write_spill(spill / "events-1.jsonl", [2])
+        await log.flush()
+        assert sorted(e["data"]["version"] for e in log.query(DIAGRAM)) == [1, 2]
+        assert os.listdir(spill) == [f"spilling-{os.getppid()}.jsonl"]
+
+        # Other processes' files are only looked for once per rescan interval
+        _write_spill(spill / "events-2.jsonl", [3])
+        await log.flush()
+        assert len(log.query(DIAGRAM)) == 2
+        log._next_scan = 0
+        await log.flush()
+        assert len(log.query(DIAGRAM)) == 3
+        await log.close()
+
+    run(scenario)
+
+
+def test_events_spilled_during_a_replay_are_kept(run):
+    async def scenario(tmp_path):
+        storage = CountingStorage()
+        log = _log(storage, tmp_path, batch_size=2)
+        log._spill([_event(i) for i in range(4)])
+
+        def append_then_spill(events):
+            # The spill thread appends while the replay is reading
+            if not storage.batches:
+                log._spill([_event(i) for i in range(4, 6)])
+            CountingStorage.append_events(storage, events)
+
+        storage.append_events = append_then_spill
+        await log.flush()
+        assert log._backlog
+        await log.flush()
+        versions = sorted(e["data"]["version"] for e in log.query(DIAGRAM))
+        assert versions == list(range(6))
+        assert os.listdir(tmp_path / "spill") == []
+        await log.close()
+
+    run(scenario)
+
+
+def test_collaboration_is_recorded_and_queryable(client):
+    diagram = client.post("/api/diagrams", json={"name": "x"}).json()
+    with client.websocket_connect(f"/ws/{diagram['id']}?user_name=Ada") as ws:
+        ws.receive_json()  # diagram_state
+        ws.send_json({"type": "element_lock", "data": {"element_id": "Task_1"}})
+        ws.send_json({"type": "element_unlock", "data": {"element_id": "Task_1"}})
+        ws.send_json(
+            {"type": "diagram_update", "data": {"xml": diagram["xml"] + " "}}
+        )
+        message = ws.receive_json()
+        while message["type"] != "diagram_ack":
+            message = ws.receive_json()
+    client.portal.call(event_log.close)
+
+    url = f"/api/diagrams/{diagram['id']}/events"
+    events = client.get(url).json()["events"]
+    assert [e["type"] for e in events] == ["join", "lock", "unlock", "edit", "leave"]
+    assert {e["user_name"] for e in events} == {"Ada"}
+    assert events[1]["data"] == {"element_id": "Task_1"}
+    assert events[3]["data"] == {"version": diagram["version"] + 1, "merged": False}
+
+    edits = client.get(url, params={"type": "edit"}).json()["events"]
+    assert len(edits) == 1
+    later = client.get(url, params={"start": events[-1]["occurred_at"]}).json()
+    assert [e["type"] for e in later["events"]] == ["leave"]
+    before = client.get(url, params={"end": events[0]["occurred_at"]}).json()
+    assert before["events"] == []
+
+    missing = "/api/diagrams/00000000-0000-0000-0000-000000000000/events"
+    assert client.get(missing).status_code == 404
@@ -0,0 +1,96 @@
+"""Tests for the incremental BPMN lint engine."""
+from config import load_example_xml
+from lint import lint
+
+XML = load_example_xml("order_processing_with_gateway.bpmn")
+
+
+def _rules_of(data):
+    return {(issue["rule"], issue["element_id"]) for issue in data["issues"]}
+
+
+def _rules(result):
+    return _rules_of(result.message()["data"])
+
+
+def test_clean_diagram_has_no_issues():
+    result = lint(XML, 1)
+    assert result.as_list() == []
+    assert result.message()["data"] == {
+        "version": 1,
+        "issues": [],
+        "errors": 0,
+        "warnings": 0,
+    }
+
+
+def test_rules_flag_broken_diagrams():
+    broken = (
+        XML.replace('sourceRef="Gateway_1" targetRef="Task_3"', 'sourceRef="Gone"')
+        .replace('sourceRef="Gateway_1" targetRef="Task_4"', 'sourceRef="Gone"')
+        .replace('<bpmn2:startEvent id="StartEvent_2"/>', "")
+    )
+    result = lint(broken, 2)
+    assert {
+        ("dangling-flow", "Flow_4"),
+        ("dangling-flow", "Flow_5"),
+        ("dangling-flow", "Flow_6"),
+        ("gateway-no-outgoing", "Gateway_1"),
+        ("start-event-required", "Process_2"),
+    } <= _rules(result)
+    data = result.message()["data"]
+    assert data["errors"] == 5
+    assert data["warnings"] == len(data["issues"]) - 5
+
+    syntax = lint("<bpmn2:definitions", 3).as_list()
+    assert [issue["rule"] for issue in syntax] == ["xml-syntax"]
+
+
+def test_only_affected_elements_are_rechecked():
+    first = lint(XML, 1)
+    assert first.checked == len(first.model.elements)
+
+    # Removing one flow re-checks the flow's ends and its process only
+    edited = XML.replace(
+        '<bpmn2:sequenceFlow id="Flow_7" sourceRef="Task_3" targetRef="EndEvent_2"/>', ""
+    )
+    second = lint(edited, 2, previous=first)
+    assert second.checked == 3
+    assert second.as_list() == lint(edited, 2).as_list()
+    assert ("no-outgoing", "Task_3") in _rules(second)
+
+    # Putting it back clears the warning again
+    third = lint(XML, 3, previous=second)
+    assert third.as_list() == []
+    assert third.checked < len(third.model.elements)
+
+
+def test_issues_endpoint_lints_current_version(client):
+    xml = XML.replace('<bpmn2:startEvent id="StartEvent_2"/>', "")
+    diagram = client.post("/api/diagrams", json={"name": "x", "initial_xml": xml}).json()
+    url = f"/api/diagrams/{diagram['id']}/issues"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["version"] == diagram["version"]
+    assert ("start-event-required", "Process_2") in _rules_of(data)
+
+    response = client.get(url, headers={"if-none-match": response.headers["etag"]})
+    assert response.status_code == 304
+
+    missing = "/api/diagrams/00000000-0000-0000-0000-000000000000/issues"
+    assert client.get(missing).status_code == 404
+
+
+def test_saves_push_validation_results_to_the_room(client):
+    diagram = client.post("/api/diagrams", json={"name": "x", "initial_xml": XML}).json()
+    with client.websocket_connect(f"/ws/{diagram['id']}") as ws:
+        ws.receive_json()  # diagram_state
+        broken = XML.replace('targetRef="EndEvent_2"', 'targetRef="Missing"')
+        ws.send_json({"type": "diagram_update", "data": {"xml": broken}})
+        message = ws.receive_json()
+        while message["type"] != "validation_result":
+            message = ws.receive_json()
+        assert message["data"]["version"] == diagram["version"] + 1
+        assert ("dangling-flow", "Flow_7") in _rules_of(message["data"])
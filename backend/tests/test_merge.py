@@ -0,0 +1,172 @@
+"""Tests for merging concurrent diagram edits."""
+from config import load_example_xml
+import services
+from merge import ElementMap, merge_diagrams
+from services import diagram_service
+
+BASE = load_example_xml("simple_approval_process.bpmn")
+NEW_TASK = '<bpmn2:endEvent id="EndEvent_1"/>\n    <bpmn2:task id="Task_3" name="New"/>'
+NEW_SHAPE = (
+    '<bpmndi:BPMNShape id="Task_3_di" bpmnElement="Task_3">'
+    '<dc:Bounds x="600" y="300" width="100" height="80"/></bpmndi:BPMNShape>'
+    "\n    </bpmndi:BPMNPlane>"
+)
+
+
+def _entries(xml):
+    return ElementMap(xml).entries
+
+
+def test_disjoint_edits_are_both_kept():
+    ours = BASE.replace('name="Review Application"', 'name="Review"').replace(
+        '<dc:Bounds x="430" y="77"', '<dc:Bounds x="450" y="77"'
+    )
+    theirs = (
+        BASE.replace('name="Approve Application"', 'name="Approve"')
+        .replace('<bpmn2:endEvent id="EndEvent_1"/>', NEW_TASK)
+        .replace("    </bpmndi:BPMNPlane>", NEW_SHAPE)
+    )
+    merged = _entries(merge_diagrams(BASE, ours, theirs))
+    assert merged["Task_1"].attrs["name"] == "Review"
+    assert merged["Task_2"].attrs["name"] == "Approve"
+    assert 'x="450"' in merged["_BPMNShape_Task_3"].blobs[0].toxml()
+    assert merged["Task_3"].parent == "Process_1"
+    assert merged["Task_3_di"].parent == "BPMNPlane_1"
+    # New elements sit next to where the incoming side put them
+    assert list(merged).index("Task_3") == list(merged).index("EndEvent_1") + 1
+
+
+def test_conflicting_attribute_edits_resolve_to_the_incoming_edit():
+    ours = BASE.replace('name="Review Application"', 'name="Ours"')
+    theirs = BASE.replace('name="Review Application"', 'name="Theirs"')
+    merged = merge_diagrams(BASE, ours, theirs)
+    assert _entries(merged)["Task_1"].attrs["name"] == "Theirs"
+    # Same inputs, same document
+    assert merge_diagrams(BASE, ours, theirs) == merged
+
+
+def test_deletion_prunes_references_and_beats_concurrent_moves():
+    ours = BASE.replace(
+        '<bpmn2:task id="Task_2" name="Approve Application"/>', ""
+    ).replace('<bpmn2:sequenceFlow id="Flow_2" sourceRef="Task_1" targetRef="Task_2"/>', "")
+    theirs = BASE.replace('<dc:Bounds x="430" y="77"', '<dc:Bounds x="500" y="77"')
+    merged = _entries(merge_diagrams(BASE, ours, theirs))
+    assert "Task_2" not in merged
+    assert "Flow_2" not in merged
+    # The moved shape, the flow into Task_2 and all their DI went with it
+    assert "_BPMNShape_Task_3" not in merged
+    assert "Flow_3" not in merged
+    assert "BPMNEdge_Flow_2" not in merged
+    assert "BPMNEdge_Flow_3" not in merged
+    assert "Task_1" in merged and "EndEvent_1" in merged
+
+
+def test_merges_keep_the_source_layout():
+    ours = BASE.replace('name="Review Application"', 'name="Review"')
+    theirs = BASE.replace('name="Approve Application"', 'name="Approve"')
+    expected = ours.replace('name="Approve Application"', 'name="Approve"')
+    assert merge_diagrams(BASE, ours, theirs) == expected
+    # A merge that adds nothing returns the incoming document as it was sent
+    assert merge_diagrams(BASE, BASE, theirs) is theirs
+
+
+def test_concurrent_updates_are_merged_and_rebroadcast(client):
+    diagram = client.post(
+        "/api/diagrams", json={"name": "x", "initial_xml": BASE}
+    ).json()
+    url = f"/ws/{diagram['id']}"
+    alice_ws = client.websocket_connect(f"{url}?user_name=alice")
+    bob_ws = client.websocket_connect(f"{url}?user_name=bob")
+    with alice_ws as alice, bob_ws as bob:
+        base_version = alice.receive_json()["data"]["version"]
+        assert bob.receive_json()["data"]["version"] == base_version
+
+        def next_of(ws, message_type):
+            message = ws.receive_json()
+            while message["type"] != message_type:
+                message = ws.receive_json()
+            return message
+
+        alice_xml = BASE.replace('name="Review Application"', 'name="Review"')
+        alice.send_json(
+            {
+                "type": "diagram_update",
+                "data": {"xml": alice_xml, "base_version": base_version},
+            }
+        )
+        assert next_of(alice, "diagram_ack")["data"]["version"] == base_version + 1
+        bob_xml = BASE.replace('name="Approve Application"', 'name="Approve"')
+        bob.send_json(
+            {
+                "type": "diagram_update",
+                "data": {"xml": bob_xml, "base_version": base_version},
+            }
+        )
+
+        # Bob edited a stale copy: both sides get the merge, bob included
+        for ws in (alice, bob):
+            update = next_of(ws, "diagram_update")
+            if update["data"]["version"] == base_version + 1:
+                update = next_of(ws, "diagram_update")
+            assert update["data"]["version"] == base_version + 2
+            entries = _entries(update["data"]["xml"])
+            assert entries["Task_1"].attrs["name"] == "Review"
+            assert entries["Task_2"].attrs["name"] == "Approve"
+
+    stored = client.get(f"/api/diagrams/{diagram['id']}").json()
+    assert stored["version"] == base_version + 2
+    assert 'name="Review"' in stored["xml"] and 'name="Approve"' in stored["xml"]
+
+
+def test_an_edit_landing_during_a_merge_is_merged_too(client, monkeypatch):
+    diagram = client.post(
+        "/api/diagrams", json={"name": "x", "initial_xml": BASE}
+    ).json()
+    diagram_id, version = diagram["id"], diagram["version"]
+    diagram_service.update_diagram(
+        diagram_id, BASE.replace('name="Review Application"', 'name="Review"'), version
+    )
+    calls = []
+
+    def merge_while_someone_saves(base, ours, theirs):
+        calls.append(ours)
+        if len(calls) == 1:
+            # The row is not locked while merging, so another save can land
+            latest = diagram_service.get_diagram(diagram_id)["xml"]
+            named = latest.replace('"StartEvent_1"/>', '"StartEvent_1" name="Applied"/>')
+            diagram_service.update_diagram(diagram_id, named)
+        return merge_diagrams(base, ours, theirs)
+
+    monkeypatch.setattr(services, "merge_diagrams", merge_while_someone_saves)
+    result = diagram_service.update_diagram(
+        diagram_id,
+        BASE.replace('name="Approve Application"', 'name="Approve"'),
+        version,
+    )
+    assert len(calls) == 2 and result["merged"]
+    assert result["version"] == version + 3
+    for name in ("Review", "Approve", "Applied"):
+        assert f'name="{name}"' in result["xml"]
+
+
+def test_a_stale_edit_the_merge_leaves_as_sent_is_acknowledged(client):
+    diagram = client.post(
+        "/api/diagrams", json={"name": "x", "initial_xml": BASE}
+    ).json()
+    url = f"/ws/{diagram['id']}"
+    edited = BASE.replace('name="Review Application"', 'name="Review"')
+    with client.websocket_connect(url) as alice, client.websocket_connect(url) as bob:
+        version = alice.receive_json()["data"]["version"]
+        bob.receive_json()
+        for ws in (alice, bob):
+            # Both make the same edit from the same version
+            ws.send_json(
+                {
+                    "type": "diagram_update",
+                    "data": {"xml": edited, "base_version": version},
+                }
+            )
+            message = ws.receive_json()
+            while message["type"] != "diagram_ack":
+                message = ws.receive_json()
+            assert message["data"]["version"] > version
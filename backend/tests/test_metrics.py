@@ -0,0 +1,218 @@
+"""Tests for the Prometheus metrics endpoint and sampled tracing."""
+import asyncio
+
+import pytest
+
+import routes
+from metrics import Registry, Tracer
+from services import diagram_service
+from storage import StorageError
+
+
+def _samples(text):
+    """Parse exposition text into {series: value}."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            series, value = line.rsplit(" ", 1)
+            samples[series] = float(value)
+    return samples
+
+
+def test_exposition_format():
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests.", ("path",))
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    registry.gauge("rooms", "Rooms.", collect=lambda: {(): 3})
+    counter.inc('/a"b')
+    counter.inc('/a"b', amount=2)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert "# TYPE latency_seconds histogram" in text
+    samples = _samples(text)
+    assert samples['requests_total{path="/a\\"b"}'] == 3
+    assert samples['latency_seconds_bucket{le="0.1"}'] == 1
+    assert samples['latency_seconds_bucket{le="1"}'] == 2
+    assert samples['latency_seconds_bucket{le="+Inf"}'] == 3
+    assert samples["latency_seconds_count"] == 3
+    assert samples["latency_seconds_sum"] == pytest.approx(5.55)
+    assert samples["rooms"] == 3
+
+    counter.remove('/a"b')
+    assert "requests_total{" not in registry.render()
+
+
+def test_sampled_traces_nest_spans_across_awaits():
+    tracer = Tracer(1.0, 2)
+
+    async def handle():
+        with tracer.span("ws.diagram_update", diagram_id="d"):
+            await asyncio.sleep(0)
+            with tracer.span("storage.update"):
+                pass
+            await asyncio.gather(broadcast(), broadcast())
+
+    async def broadcast():
+        with tracer.span("broadcast"):
+            await asyncio.sleep(0)
+
+    for _ in range(3):
+        asyncio.run(handle())
+    traces = tracer.recent()
+    assert len(traces) == 2  # ring buffer
+    names = [span["name"] for span in traces[0]["spans"]]
+    assert names == ["ws.diagram_update", "storage.update", "broadcast", "broadcast"]
+    assert traces[0]["spans"][0]["diagram_id"] == "d"
+
+
+def test_unsampled_work_records_nothing():
+    tracer = Tracer(0.0, 10)
+    with tracer.span("ws.ping"):
+        with tracer.span("storage.get"):
+            pass
+    assert tracer.recent() == []
+
+
+def test_spans_after_their_trace_finished_are_dropped():
+    tracer = Tracer(1.0, 10)
+
+    async def scenario():
+        late = []
+        with tracer.span("ws.element_lock"):
+            # Like a debounced broadcast scheduled from inside the handler
+            asyncio.get_running_loop().call_later(
+                0.01, lambda: late.append(tracer.span("broadcast").__enter__())
+            )
+        await asyncio.sleep(0.05)
+        return late
+
+    late = asyncio.run(scenario())
+    assert late == [None]
+    assert [s["name"] for s in tracer.recent()[0]["spans"]] == ["ws.element_lock"]
+
+
+@pytest.fixture
+def client(monkeypatch, client):
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", "secret")
+    client.headers["x-admin-token"] = "secret"
+    return client
+
+
+def test_metrics_cover_messages_fan_out_storage_and_rooms(client):
+    diagram = client.post("/api/diagrams", json={"name": "x"}).json()
+    room = diagram["id"]
+    before = _samples(client.get("/metrics").text)
+
+    with client.websocket_connect(f"/ws/{room}") as first, client.websocket_connect(
+        f"/ws/{room}"
+    ) as second:
+        first.receive_json()
+        second.receive_json()
+        first.send_json({"type": "element_lock", "data": {"element_id": "Task_1"}})
+        assert second.receive_json()["type"] == "element_locked"
+        first.send_json({"type": "diagram_update", "data": {"xml": diagram["xml"]}})
+        message = first.receive_json()
+        while message["type"] != "diagram_ack":
+            message = first.receive_json()
+        first.send_json({"type": "bogus"})
+        first.send_json({"type": "ping"})
+        while first.receive_json()["type"] != "pong":
+            pass
+
+        response = client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        during = _samples(response.text)
+        # The test engine's StaticPool has no occupancy to report
+        assert "# TYPE bpmn_db_pool_checked_out gauge" in response.text
+
+    def delta(series):
+        return during.get(series, 0) - before.get(series, 0)
+
+    assert delta('bpmn_ws_message_seconds_count{type="element_lock"}') == 1
+    assert delta('bpmn_ws_message_seconds_count{type="diagram_update"}') == 1
+    assert delta('bpmn_ws_message_seconds_count{type="other"}') == 1
+    assert delta('bpmn_storage_seconds_count{operation="update"}') == 1
+    assert delta("bpmn_broadcast_recipients_count") >= 2
+    assert during[f'bpmn_room_received_bytes_total{{diagram_id="{room}"}}'] > 0
+    assert during[f'bpmn_room_sent_bytes_total{{diagram_id="{room}"}}'] > len(
+        diagram["xml"]
+    )
+    assert during["bpmn_connections"] == 2
+    assert during["bpmn_rooms"] == 1
+    assert during["bpmn_element_locks"] == 1
+
+    # Closed rooms drop their per-room series
+    after = client.get("/metrics").text
+    assert room not in after
+    assert _samples(after)["bpmn_connections"] == 0
+
+
+def test_room_bytes_are_utf8_bytes(client):
+    diagram = client.post("/api/diagrams", json={"name": "x"}).json()
+    room = diagram["id"]
+    series = f'bpmn_room_received_bytes_total{{diagram_id="{room}"}}'
+    frame = '{"type":"ping","data":"éé"}'
+    with client.websocket_connect(f"/ws/{room}") as ws:
+        ws.receive_json()
+        ws.send_text(frame)
+        while ws.receive_json()["type"] != "pong":
+            pass
+        received = _samples(client.get("/metrics").text)[series]
+        assert received == len(frame.encode("utf-8")) == len(frame) + 2
+
+
+def test_bad_frames_are_refused_and_errors_still_clean_up(client, monkeypatch):
+    diagram = client.post("/api/diagrams", json={"name": "x"}).json()
+    room = diagram["id"]
+    with client.websocket_connect(f"/ws/{room}") as ws:
+        ws.receive_json()
+        for frame in ("not json", "[1, 2]", '"text"'):
+            ws.send_text(frame)
+            message = ws.receive_json()
+            while message["type"] != "error":
+                message = ws.receive_json()
+        # The connection is still served
+        ws.send_json({"type": "ping"})
+        while ws.receive_json()["type"] != "pong":
+            pass
+
+    def fail(*args):
+        raise StorageError("disk full")
+
+    monkeypatch.setattr(diagram_service.storage, "update", fail)
+    with pytest.raises(StorageError):
+        with client.websocket_connect(f"/ws/{room}") as ws:
+            ws.receive_json()
+            ws.send_json({"type": "element_lock", "data": {"element_id": "Task_1"}})
+            ws.send_json({"type": "diagram_update", "data": {"xml": diagram["xml"]}})
+            ws.receive_json()
+
+    # The failed handler still released everything the connection held
+    assert not diagram_service.get_connections(room)
+    assert not diagram_service.get_element_locks(room)
+    assert not diagram_service.get_user_sessions_for_diagram(room)
+    assert room not in client.get("/metrics").text
+
+
+def test_debug_traces_endpoint(client, monkeypatch):
+    from metrics import tracer
+
+    monkeypatch.setattr(tracer, "sample_rate", 1.0)
+    diagram = client.post("/api/diagrams", json={"name": "x"}).json()
+    with client.websocket_connect(f"/ws/{diagram['id']}") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "diagram_update", "data": {"xml": diagram["xml"]}})
+        while ws.receive_json()["type"] != "diagram_ack":
+            pass
+    # Like the admin endpoints, hidden without the token
+    for path in ("/metrics", "/debug/traces"):
+        assert client.get(path, headers={"x-admin-token": ""}).status_code == 404
+    body = client.get("/debug/traces").json()
+    assert body["sample_rate"] == 1.0
+    names = [span["name"] for span in body["traces"][-1]["spans"]]
+    assert names[0] == "ws.diagram_update"
+    assert "storage.update" in names
@@ -0,0 +1,74 @@
+"""Tests for coalesced presence broadcasts."""
+import asyncio
+
+import pytest
+from presence import PresenceCoalescer
+import routes
+
+
+def _run_storm(events, interval=0.05):
+    sent = []
+
+    async def broadcast(diagram_id, message):
+        sent.append(message)
+
+    async def scenario():
+        coalescer = PresenceCoalescer(interval, broadcast)
+        for action, name in events:
+            getattr(coalescer, action)("room", name)
+        await asyncio.sleep(interval * 3)
+        return coalescer
+
+    coalescer = asyncio.run(scenario())
+    return coalescer, sent
+
+
+def test_join_storm_is_coalesced_into_one_frame():
+    coalescer, sent = _run_storm([("user_joined", f"user{i}") for i in range(200)])
+    assert len(sent) == 1
+    assert len(sent[0]["data"]["joined"]) == 200
+    assert sent[0]["data"]["version"] == 1
+    assert coalescer.snapshot("room")["presence_version"] == 1
+
+
+def test_join_then_leave_within_interval_cancels_out():
+    _, sent = _run_storm(
+        [("user_joined", "alice"), ("user_joined", "bob"), ("user_left", "bob")]
+    )
+    assert [m["data"] for m in sent] == [{"joined": ["alice"], "left": [], "version": 1}]
+
+
+def test_duplicate_names_leave_only_when_last_session_closes():
+    _, sent = _run_storm(
+        [("user_joined", "alice"), ("user_joined", "alice"), ("user_left", "alice")]
+    )
+    assert sent[0]["data"]["joined"] == ["alice"]
+    assert len(sent) == 1
+
+
+@pytest.fixture
+def client(monkeypatch, client):
+    """The test client with a short presence interval."""
+    monkeypatch.setattr(routes.presence, "interval", 0.01)
+    return client
+
+
+def test_roster_is_folded_into_diagram_state(client):
+    diagram = client.post("/api/diagrams", json={"name": "x"}).json()
+    url = f"/ws/{diagram['id']}"
+    with client.websocket_connect(f"{url}?user_name=alice") as alice:
+        state = alice.receive_json()
+        assert state["type"] == "diagram_state"
+        assert state["data"]["users"] == []
+        update = alice.receive_json()
+        assert update["type"] == "presence_update"
+        assert update["data"]["joined"] == ["alice"]
+
+        with client.websocket_connect(f"{url}?user_name=bob") as bob:
+            state = bob.receive_json()
+            assert state["data"]["users"] == ["alice"]
+            assert state["data"]["presence_version"] == update["data"]["version"]
+            for ws in (alice, bob):
+                message = ws.receive_json()
+                assert message["type"] == "presence_update"
+                assert message["data"]["joined"] == ["bob"]
@@ -0,0 +1,89 @@
+"""Tests for read-only spectator connections."""
+import asyncio
+import json
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+from spectators import SpectatorHub
+import routes
+
+
+class FakeSocket:
+    def __init__(self, fail=False):
+        self.frames = []
+        self.fail = fail
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("gone")
+        self.frames.append(text)
+
+
+def test_edit_burst_is_downsampled_into_one_shared_frame():
+    sockets = [FakeSocket() for _ in range(1000)]
+    broken = FakeSocket(fail=True)
+
+    async def scenario():
+        hub = SpectatorHub(0.05)
+        hub.load("room", 1, "<v1/>")
+        for ws in sockets + [broken]:
+            assert json.loads(hub.join("room", ws))["data"]["version"] == 1
+        for version in range(2, 12):
+            hub.publish("room", version, f"<v{version}/>", "alice")
+        hub.publish("room", 5, "<stale/>", "bob")
+        await asyncio.sleep(0.1)
+        return hub
+
+    hub = asyncio.run(scenario())
+    assert all(len(ws.frames) == 1 for ws in sockets)
+    # Every spectator got the very same encoded string
+    assert len({id(ws.frames[0]) for ws in sockets}) == 1
+    frame = json.loads(sockets[0].frames[0])
+    assert frame["type"] == "diagram_update"
+    assert frame["data"]["version"] == 11
+    assert frame["user"] == "alice"
+    assert broken not in hub.connections("room")
+
+
+@pytest.fixture
+def client(monkeypatch, client):
+    """The test client with a short spectator interval."""
+    monkeypatch.setattr(routes.spectators, "interval", 0.01)
+    return client
+
+
+def test_spectators_are_invisible_and_read_only(client):
+    diagram = client.post("/api/diagrams", json={"name": "x"}).json()
+    url = f"/ws/{diagram['id']}"
+    with client.websocket_connect(f"{url}?mode=view") as viewer:
+        state = viewer.receive_json()
+        assert state["type"] == "diagram_state"
+        assert state["data"]["mode"] == "view"
+        assert "my_user_name" not in state["data"]
+
+        # Spectators cannot lock or edit
+        viewer.send_json({"type": "element_lock", "data": {"element_id": "Task_1"}})
+        viewer.send_json({"type": "diagram_update", "data": {"xml": "<hijack/>"}})
+        viewer.send_json({"type": "ping"})
+        assert viewer.receive_json() == {"type": "pong"}
+
+        with client.websocket_connect(f"{url}?user_name=alice") as alice:
+            state = alice.receive_json()
+            assert state["data"]["users"] == []
+            assert state["data"]["locks"] == {}
+            assert state["data"]["xml"] == diagram["xml"]
+
+            alice.send_json({"type": "diagram_update", "data": {"xml": "<edited/>"}})
+            update = viewer.receive_json()
+            assert update["type"] == "diagram_update"
+            assert update["data"]["xml"] == "<edited/>"
+            assert update["user"] == "alice"
+
+
+def test_spectating_a_missing_diagram_is_rejected(client):
+    with client.websocket_connect(
+        "/ws/00000000-0000-0000-0000-000000000000?mode=view"
+    ) as viewer:
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            viewer.receive_json()
+    assert excinfo.value.code == 1008
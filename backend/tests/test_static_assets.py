@@ -0,0 +1,59 @@
+"""Tests for serving the built frontend from the in-memory manifest."""
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from static_assets import IMMUTABLE_CACHE_CONTROL, static_manifest
+
+INDEX_HTML = "<!doctype html><html><body><div id='root'></div></body></html>"
+BUNDLE_JS = "console.log('bpmn');\n" * 200
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Create a test client serving a small fake frontend build."""
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_text(INDEX_HTML)
+    (tmp_path / "assets" / "index-3f9a1c2b.js").write_text(BUNDLE_JS)
+    (tmp_path / "robots.txt").write_text("User-agent: *\n")
+    static_manifest.load(tmp_path, max_file_size=1024 * 1024)
+    # Files are held in memory, so removing them must not affect serving
+    for path in sorted(tmp_path.rglob("*"), reverse=True):
+        path.unlink() if path.is_file() else path.rmdir()
+    yield TestClient(app)
+    static_manifest.load(tmp_path / "missing", max_file_size=0)
+
+
+def test_spa_routes_serve_index_from_memory(client):
+    for url in ("/", "/diagram/123"):
+        response = client.get(url, headers={"accept-encoding": "identity"})
+        assert response.status_code == 200
+        assert response.text == INDEX_HTML
+        assert response.headers["cache-control"] == "no-cache"
+        assert "etag" in response.headers
+
+
+def test_hashed_assets_are_immutable_and_precompressed(client):
+    response = client.get("/assets/index-3f9a1c2b.js", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == BUNDLE_JS
+
+    asset = static_manifest.get("assets/index-3f9a1c2b.js")
+    assert gzip.decompress(asset.encoded["gzip"]).decode() == BUNDLE_JS
+
+
+def test_etag_revalidation_returns_304(client):
+    etag = client.get("/robots.txt").headers["etag"]
+    response = client.get("/robots.txt", headers={"if-none-match": etag})
+    assert response.status_code == 304
+
+
+def test_unknown_paths_still_404(client):
+    assert client.get("/api/nope").status_code == 404
+    assert client.get("/static/missing.js").status_code == 404
+    response = client.get("/random", headers={"accept": "text/html"})
+    assert response.status_code == 404
+    assert response.text == INDEX_HTML
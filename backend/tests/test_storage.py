@@ -0,0 +1,336 @@
+"""Conformance tests every storage backend must pass, plus replica routing
+and pool metrics of the SQLAlchemy backend.
+
+Set ``TEST_DATABASE_URL`` to also run them against a real Postgres server.
+"""
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as SATimeoutError
+from sqlalchemy.orm import sessionmaker
+
+import database
+from benchmarks.storage_latency import measure
+from database import Base
+from models import BPMNDiagram
+from storage import (
+    MemoryStorage,
+    SQLAlchemyStorage,
+    SQLiteStorage,
+    StorageBackend,
+    StorageError,
+)
+
+XML = '<?xml version="1.0" encoding="UTF-8"?><bpmn2:definitions id="d"/>'
+BACKENDS = ["memory", "sqlite", "sqlalchemy"]
+if os.getenv("TEST_DATABASE_URL"):
+    BACKENDS.append("postgres")
+
+
+@pytest.fixture(params=BACKENDS)
+def storage(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryStorage()
+    elif request.param == "sqlite":
+        backend = SQLiteStorage(str(tmp_path / "diagrams.sqlite3"))
+    elif request.param == "sqlalchemy":
+        request.getfixturevalue("db_engine")
+        backend = SQLAlchemyStorage()
+    else:
+        engine = create_engine(os.environ["TEST_DATABASE_URL"])
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        backend = SQLAlchemyStorage(sessionmaker(bind=engine))
+    backend.kind = request.param
+    yield backend
+    backend.close()
+
+
+def _rows(count, **overrides):
+    return [
+        {"id": str(uuid.uuid4()), "name": f"D{i}", "xml": XML, "version": 1, **overrides}
+        for i in range(count)
+    ]
+
+
+def test_create_get_and_list(storage):
+    assert storage.is_empty()
+    created = storage.create("First", XML)
+    assert str(uuid.UUID(created.id)) == created.id
+    assert created.version == 1
+
+    fetched = storage.get(created.id)
+    assert (fetched.id, fetched.name, fetched.xml, fetched.version) == (
+        created.id,
+        "First",
+        XML,
+        1,
+    )
+    assert storage.get_version(created.id) == 1
+    assert [d.name for d in storage.list_diagrams()] == ["First"]
+    assert not storage.is_empty()
+
+    missing = str(uuid.uuid4())
+    assert storage.get(missing) is None
+    assert storage.get_version(missing) is None
+
+
+def test_update_bumps_version_and_sees_current_row(storage):
+    diagram = storage.create("D", XML)
+    seen = []
+
+    def change(current):
+        seen.append((current.version, current.xml))
+        return current.xml.replace('id="d"', 'id="e"')
+
+    updated = storage.update(diagram.id, change)
+    assert updated.version == 2
+    assert seen == [(1, XML)]
+    assert storage.get(diagram.id).xml == updated.xml
+    assert storage.update(str(uuid.uuid4()), change) is None
+
+
+def test_failed_change_writes_nothing(storage):
+    diagram = storage.create("D", XML)
+
+    def change(current):
+        raise RuntimeError("merge failed")
+
+    with pytest.raises(RuntimeError):
+        storage.update(diagram.id, change)
+    assert storage.get_version(diagram.id) == 1
+    # The backend is still usable afterwards
+    assert storage.update(diagram.id, lambda current: current.xml).version == 2
+
+
+def test_concurrent_updates_are_serialized(storage):
+    if storage.kind == "sqlalchemy":
+        pytest.skip("the in-memory test engine shares one connection across threads")
+    diagram = storage.create("D", XML)
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(20):
+                storage.update(diagram.id, lambda current: f"{current.xml}.")
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    stored = storage.get(diagram.id)
+    assert stored.version == 1 + 8 * 20
+    # No update was lost: every one appended to the previous XML
+    assert stored.xml == XML + "." * (8 * 20)
+
+
+def test_insert_many_skips_existing_ids(storage):
+    rows = _rows(5, version=3)
+    assert storage.insert_many(rows) == 5
+    assert storage.insert_many(rows[:2] + _rows(1)) == 1
+    assert storage.insert_many([]) == 0
+    assert storage.get(rows[0]["id"]).version == 3
+    assert len(storage.list_diagrams()) == 6
+
+
+def test_pages_are_ordered_by_id(storage):
+    rows = _rows(7)
+    storage.insert_many(rows)
+    ids = sorted(row["id"] for row in rows)
+
+    first = storage.page(None, 3)
+    assert [d.id for d in first] == ids[:3]
+    rest = storage.page(first[-1].id, 10)
+    assert [d.id for d in rest] == ids[3:]
+    assert rest[0].xml == XML
+    assert storage.page(ids[-1], 10) == []
+
+
+def test_events_are_appended_and_queried_by_time_range(storage):
+    diagram, other = str(uuid.uuid4()), str(uuid.uuid4())
+    base = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+
+    def event(diagram_id, minutes, event_type, **data):
+        return {
+            "diagram_id": diagram_id,
+            "occurred_at": base + timedelta(minutes=minutes),
+            "type": event_type,
+            "user_id": "u1",
+            "user_name": "Ada",
+            "data": data,
+        }
+
+    storage.append_events(
+        [
+            event(diagram, 2, "edit", version=2),
+            event(diagram, 0, "join"),
+            event(other, 1, "join"),
+            event(diagram, 5, "leave"),
+        ]
+    )
+    storage.append_events([])
+
+    events = storage.query_events(diagram)
+    assert [e["type"] for e in events] == ["join", "edit", "leave"]
+    assert events[1]["data"] == {"version": 2}
+    assert events[1]["occurred_at"] == base + timedelta(minutes=2)
+    assert events[1]["diagram_id"] == diagram
+    assert events[1]["user_name"] == "Ada"
+
+    # start is inclusive, end exclusive
+    window = storage.query_events(diagram, base, base + timedelta(minutes=5))
+    assert [e["type"] for e in window] == ["join", "edit"]
+    assert [e["type"] for e in storage.query_events(diagram, event_type="edit")] == [
+        "edit"
+    ]
+    assert len(storage.query_events(diagram, limit=2)) == 2
+
+
+def test_driver_errors_surface_as_storage_errors(storage):
+    if storage.kind == "sqlite":
+        storage._connection().execute("DROP TABLE bpmn_diagrams")
+    elif storage.kind == "sqlalchemy":
+        BPMNDiagram.__table__.drop(database.SessionLocal.kw["bind"])
+    else:
+        pytest.skip("only the embedded databases are broken on purpose")
+    with pytest.raises(StorageError):
+        storage.insert_many(_rows(1))
+    with pytest.raises(StorageError):
+        storage.get(str(uuid.uuid4()))
+
+
+def test_incomplete_backends_cannot_be_constructed():
+    class Partial(StorageBackend):
+        def is_empty(self):
+            return True
+
+    with pytest.raises(TypeError, match="abstract"):
+        Partial()
+
+
+def test_latency_benchmark_runs(storage):
+    results = measure(storage, iterations=5)
+    assert set(results) == {"create", "get", "get_version", "update", "page"}
+    assert all(p50 <= p99 for p50, p99 in results.values())
+
+
+def test_sqlite_uses_wal_and_persists(tmp_path):
+    path = str(tmp_path / "diagrams.sqlite3")
+    storage = SQLiteStorage(path)
+    diagram = storage.create("Persisted", XML)
+    storage.close()
+
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    reopened = SQLiteStorage(path)
+    assert reopened.get(diagram.id).name == "Persisted"
+    reopened.close()
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """A storage whose reads go to a separate database we control."""
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for engine in (primary, replica):
+        Base.metadata.create_all(engine)
+    storage = SQLAlchemyStorage(sessionmaker(bind=primary), sessionmaker(bind=replica))
+    yield storage, primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def _copy(source, target, diagram_id, **changes):
+    """Replicate one row, optionally lagging or altered."""
+    with sessionmaker(bind=source)() as db:
+        row = db.get(BPMNDiagram, uuid.UUID(diagram_id))
+        values = {c.name: getattr(row, c.name) for c in BPMNDiagram.__table__.columns}
+    values.update(changes)
+    with sessionmaker(bind=target)() as db:
+        db.merge(BPMNDiagram(**values))
+        db.commit()
+
+
+def test_replica_reads_fall_back_until_they_include_our_writes(replicated):
+    storage, primary, replica = replicated
+    diagram = storage.create("Primary", XML)
+
+    # Not replicated yet: reads go back to the primary
+    assert storage.get(diagram.id).name == "Primary"
+    assert [d.name for d in storage.page(None, 10)] == ["Primary"]
+    assert storage.replica_fallbacks == 2
+
+    # Caught up: served by the replica (the altered name proves it)
+    _copy(primary, replica, diagram.id, name="Replica")
+    assert storage.get(diagram.id).name == "Replica"
+    assert [d.name for d in storage.page(None, 10)] == ["Replica"]
+
+    # After our next save the lagging replica copy is not good enough
+    storage.update(diagram.id, lambda current: current.xml + " ")
+    assert storage.get(diagram.id).name == "Primary"
+    assert storage.get_version(diagram.id) == 2
+    assert storage.replica_fallbacks == 3
+    assert storage.metrics()["replica_reads"] == 5
+
+
+def test_writes_by_other_workers_are_not_read_stale_from_the_replica(replicated):
+    storage, primary, replica = replicated
+    other = SQLAlchemyStorage(sessionmaker(bind=primary), lambda: None)
+    first = other.create("First", XML)
+    _copy(primary, replica, first.id, name="Replica")
+    assert storage.get(first.id).name == "Replica"
+    assert storage.replica_fallbacks == 0
+
+    # Saved through another worker that shares nothing with this one
+    other.update(first.id, lambda current: current.xml + " ")
+    second = other.create("Second", XML)
+    assert storage.get(first.id).version == 2
+    assert storage.page(None, 1)[0].name != "Replica"
+    assert {d.name for d in storage.page(None, 10)} == {"First", "Second"}
+    assert storage.replica_fallbacks == 3
+
+    _copy(primary, replica, first.id, name="Replica")
+    _copy(primary, replica, second.id, name="Replica")
+    assert {d.name for d in storage.page(None, 10)} == {"Replica"}
+    assert storage.replica_fallbacks == 3
+
+
+def test_pool_settings_and_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 2)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 1)
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 0.05)
+    engine = database.create_pooled_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    monkeypatch.setitem(database.SessionLocal.kw, "bind", engine)
+    assert isinstance(engine.pool, database.MeteredQueuePool)
+    assert engine.pool._pre_ping
+
+    connections = [engine.connect() for _ in range(3)]
+    with pytest.raises(SATimeoutError):
+        engine.connect()
+    stats = database.pool_metrics()["primary"]
+    assert stats["size"] == 2
+    assert stats["checked_out"] == 3
+    assert stats["overflow"] == 1
+    assert stats["checkouts"] == 4
+    assert stats["timeouts"] == 1
+    assert stats["wait_seconds_max"] >= 0.05
+    for conn in connections:
+        conn.close()
+    engine.dispose()
+
+
+def test_pool_metrics_do_not_open_the_replica(monkeypatch):
+    monkeypatch.setattr(database, "SQLALCHEMY_REPLICA_URL", "sqlite://")
+    monkeypatch.delitem(database.ReplicaSessionLocal.kw, "bind", raising=False)
+    assert "replica" not in database.pool_metrics()
+    assert database.ReplicaSessionLocal.kw.get("bind") is None
@@ -0,0 +1,68 @@
+"""Tests for server-rendered diagram thumbnails."""
+import time
+import xml.etree.ElementTree as ET
+
+from config import load_example_xml
+from thumbnails import render_svg, thumbnail_renderer
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def test_render_svg_draws_shapes_edges_and_labels():
+    xml = load_example_xml("order_processing_with_gateway.bpmn").replace(
+        'name="Reject Order"', 'name="Reject &lt;now&gt;"'
+    )
+    svg = ET.fromstring(render_svg(xml))
+    assert svg.get("viewBox") == "169 67 419 223"
+    assert len(svg.findall(f"{SVG}circle")) == 2
+    assert len(svg.findall(f"{SVG}polygon")) == 1
+    assert len(svg.findall(f"{SVG}rect")) == 2
+    assert len(svg.findall(f"{SVG}path")) == 5
+    assert [text.text for text in svg.findall(f"{SVG}text")] == [
+        "Process Order",
+        "Reject <now>",
+    ]
+
+
+def test_render_svg_tolerates_diagrams_without_di():
+    for xml in ("<not-xml", '<bpmn2:definitions xmlns:bpmn2="x" id="d"/>'):
+        svg = ET.fromstring(render_svg(xml, width=100, height=50))
+        assert svg.get("viewBox") == "0 0 100 50"
+        assert list(svg) and list(svg)[0].tag == f"{SVG}style"
+
+
+def test_thumbnail_endpoint_serves_etag_and_304(client):
+    xml = load_example_xml("simple_approval_process.bpmn")
+    diagram = client.post("/api/diagrams", json={"name": "x", "initial_xml": xml}).json()
+    url = f"/api/diagrams/{diagram['id']}/thumbnail.svg"
+
+    response = client.get(url, headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/svg+xml"
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == render_svg(xml)
+    etag = response.headers["etag"]
+
+    response = client.get(url, headers={"if-none-match": etag})
+    assert response.status_code == 304
+
+    missing = "/api/diagrams/00000000-0000-0000-0000-000000000000/thumbnail.svg"
+    assert client.get(missing).status_code == 404
+
+
+def test_saves_render_thumbnails_in_the_background(client):
+    diagram = client.post("/api/diagrams", json={"name": "x"}).json()
+    xml = load_example_xml("multi_step_request_workflow.bpmn")
+    with client.websocket_connect(f"/ws/{diagram['id']}") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "diagram_update", "data": {"xml": xml}})
+        message = ws.receive_json()
+        while message["type"] != "diagram_ack":
+            message = ws.receive_json()
+        version = message["data"]["version"]
+
+    deadline = time.monotonic() + 30
+    while thumbnail_renderer.get(diagram["id"], version) is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert thumbnail_renderer.get(diagram["id"], version).raw.decode() == render_svg(xml)
@@ -0,0 +1,156 @@
+"""Tests for bulk diagram import and export."""
+import io
+import json
+import zipfile
+
+from fastapi.testclient import TestClient
+import routes
+from main import app
+from services import diagram_service
+from storage import SQLiteStorage
+
+XML = '<?xml version="1.0" encoding="UTF-8"?><bpmn2:definitions id="d"/>'
+
+
+def _ndjson(records):
+    return "\n".join(json.dumps(r) for r in records).encode()
+
+
+def test_ndjson_import_and_export_round_trip(client):
+    records = [{"name": f"Diagram {i}", "xml": XML} for i in range(5)]
+    response = client.post(
+        "/api/diagrams/import?batch_size=2",
+        content=_ndjson(records),
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.json()["imported"] == 5
+    assert response.json()["cursor"] == 5
+
+    response = client.get("/api/diagrams/export")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["type"] == "summary"
+    assert lines[-1]["count"] == 5
+    assert sorted(line["name"] for line in lines[:-1]) == [r["name"] for r in records]
+
+    # Re-importing an export keeps IDs and skips diagrams that already exist
+    response = client.post(
+        "/api/diagrams/import",
+        content=response.content,
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.json()["imported"] == 0
+    assert response.json()["skipped"] == 5
+
+
+def test_export_resumes_after_cursor(client):
+    client.post(
+        "/api/diagrams/import",
+        content=_ndjson([{"name": f"D{i}", "xml": XML} for i in range(3)]),
+        headers={"content-type": "application/x-ndjson"},
+    )
+    first = json.loads(client.get("/api/diagrams/export").text.splitlines()[0])
+
+    response = client.get(f"/api/diagrams/export?after={first['id']}")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["count"] == 2
+    assert first["id"] not in [line.get("id") for line in lines]
+
+    # A cursor that names no diagram is refused rather than exporting nothing
+    for after in ("not-a-uuid", "00000000-0000-0000-0000-000000000000"):
+        assert client.get(f"/api/diagrams/export?after={after}").status_code == 400
+
+
+def test_zip_import_and_export(client):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("Order Flow.bpmn", XML)
+        zf.writestr("notes.txt", "ignored")
+    response = client.post(
+        "/api/diagrams/import",
+        content=archive.getvalue(),
+        headers={"content-type": "application/zip"},
+    )
+    assert response.json()["imported"] == 1
+
+    response = client.get("/api/diagrams/export?format=zip")
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        names = zf.namelist()
+        assert names[-1] == "_export_summary.json"
+        assert names[0].startswith("Order Flow__")
+        assert zf.read(names[0]).decode() == XML
+
+
+def test_oversized_imports_are_refused(client, monkeypatch):
+    monkeypatch.setattr(routes, "IMPORT_MAX_RECORD_BYTES", 1024)
+    monkeypatch.setattr(routes, "IMPORT_MAX_BYTES", 4096)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("small.bpmn", XML)
+        zf.writestr("bomb.bpmn", XML + " " * 100_000)
+    response = client.post(
+        "/api/diagrams/import",
+        content=archive.getvalue(),
+        headers={"content-type": "application/zip"},
+    )
+    assert response.status_code == 413
+    assert response.json()["detail"]["cursor"] == 0
+
+    # Small entries that add up past the total are refused too
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i in range(10):
+            zf.writestr(f"d{i}.bpmn", XML + " " * 800)
+    response = client.post(
+        "/api/diagrams/import",
+        content=archive.getvalue(),
+        headers={"content-type": "application/zip"},
+    )
+    assert response.status_code == 413
+
+    response = client.post(
+        "/api/diagrams/import",
+        content=b"x" * 5000,
+        headers={"content-type": "application/zip"},
+    )
+    assert response.status_code == 413
+
+    body = _ndjson([{"name": "ok", "xml": XML}, {"name": "big", "xml": "x" * 2000}])
+    response = client.post(
+        "/api/diagrams/import",
+        content=body,
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 413
+
+
+def test_invalid_record_reports_resume_cursor(client):
+    body = _ndjson([{"name": "ok", "xml": XML}, {"name": "ok", "xml": XML}]) + b"\n{oops"
+    response = client.post(
+        "/api/diagrams/import?batch_size=2",
+        content=body,
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"]["cursor"] == 2
+
+
+class _TableDroppedAfterFirstBatch(SQLiteStorage):
+    def insert_many(self, rows):
+        inserted = super().insert_many(rows)
+        self._connection().execute("DROP TABLE bpmn_diagrams")
+        return inserted
+
+
+def test_storage_failure_reports_resume_cursor(tmp_path, monkeypatch):
+    storage = _TableDroppedAfterFirstBatch(str(tmp_path / "import.sqlite3"))
+    monkeypatch.setattr(diagram_service, "storage", storage)
+    body = _ndjson([{"name": f"D{i}", "xml": XML} for i in range(4)])
+    response = TestClient(app).post(
+        "/api/diagrams/import?batch_size=2",
+        content=body,
+        headers={"content-type": "application/x-ndjson"},
+    )
+    storage.close()
+    assert response.status_code == 500
+    assert response.json()["detail"] == {"error": "Database error", "cursor": 2}
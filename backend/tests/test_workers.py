@@ -0,0 +1,106 @@
+"""Tests for diagram-affinity sharding in the multi-worker launcher."""
+import asyncio
+import uuid
+
+from workers import HashRing, ShardRouter, Worker, diagram_id_for_path
+
+DIAGRAM_IDS = [str(uuid.UUID(int=i * 7919 + 1)) for i in range(2000)]
+
+
+def test_diagram_id_for_path():
+    diagram_id = "901ab38e-3e57-598b-9c92-c879a2bef814"
+    assert diagram_id_for_path(f"/ws/{diagram_id}") == diagram_id
+    assert diagram_id_for_path(f"/api/diagrams/{diagram_id}/xml") == diagram_id
+    # Other spellings of the same ID go to the same worker
+    assert diagram_id_for_path(f"/ws/{diagram_id.replace('-', '')}") == diagram_id
+    assert diagram_id_for_path(f"/ws/{diagram_id.upper()}") == diagram_id
+    assert diagram_id_for_path(f"/ws/{'-' * 36}") is None
+    assert diagram_id_for_path("/api/diagrams") is None
+    assert diagram_id_for_path("/api/diagrams/export") is None
+    assert diagram_id_for_path("/assets/index.js") is None
+
+
+def test_ring_spreads_diagrams_across_workers():
+    ring = HashRing([f"worker-{i}" for i in range(4)])
+    counts = {}
+    for diagram_id in DIAGRAM_IDS:
+        owner = ring.node_for(diagram_id)
+        counts[owner] = counts.get(owner, 0) + 1
+    assert set(counts) == ring.nodes
+    assert min(counts.values()) > len(DIAGRAM_IDS) / 4 * 0.6
+
+
+def test_adding_a_worker_only_moves_its_share():
+    ring = HashRing([f"worker-{i}" for i in range(4)])
+    before = {d: ring.node_for(d) for d in DIAGRAM_IDS}
+    ring.add("worker-4")
+    moved = [d for d in DIAGRAM_IDS if ring.node_for(d) != before[d]]
+    assert all(ring.node_for(d) == "worker-4" for d in moved)
+    assert len(moved) < len(DIAGRAM_IDS) / 5 * 1.5
+
+    ring.remove("worker-4")
+    assert {d: ring.node_for(d) for d in DIAGRAM_IDS} == before
+
+
+async def _fake_worker(name, seen):
+    """An HTTP server that keeps connections alive unless asked to close."""
+
+    async def handle(reader, writer):
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            seen.append((name, head))
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+            await writer.drain()
+            if b"connection: close" in head.lower():
+                break
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def test_each_request_on_a_keep_alive_connection_is_routed(monkeypatch):
+    monkeypatch.setenv("WORKER_CONTROL_TOKEN", "")
+    seen = []
+
+    async def scenario():
+        router = ShardRouter(2, port=0)
+        servers = []
+        for name in ("worker-0", "worker-1"):
+            server = await _fake_worker(name, seen)
+            servers.append(server)
+            port = server.sockets[0].getsockname()[1]
+            router.workers[name] = Worker(name, port, "")
+            router.ring.add(name)
+        router._refresh_round_robin()
+        first = next(d for d in DIAGRAM_IDS if router.ring.node_for(d) == "worker-0")
+        second = next(d for d in DIAGRAM_IDS if router.ring.node_for(d) == "worker-1")
+
+        front = await asyncio.start_server(router.handle_client, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", front.sockets[0].getsockname()[1]
+        )
+        # Two pipelined requests for diagrams owned by different workers
+        writer.write(
+            f"GET /api/diagrams/{first} HTTP/1.1\r\nHost: x\r\n"
+            "X-Forwarded-For: 10.9.9.9\r\nConnection: keep-alive\r\n\r\n"
+            f"GET /api/diagrams/{second} HTTP/1.1\r\nHost: x\r\n\r\n".encode()
+        )
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        front.close()
+        for server in servers:
+            server.close()
+        return response
+
+    response = asyncio.run(scenario())
+    # The worker closes after the first response; the client retries elsewhere
+    assert response.count(b"HTTP/1.1 200 OK") == 1
+    assert len(seen) == 1
+    name, head = seen[0]
+    assert name == "worker-0"
+    assert b"Connection: close" in head and b"keep-alive" not in head
+    assert b"X-Forwarded-For: 127.0.0.1\r\n" in head and b"10.9.9.9" not in head
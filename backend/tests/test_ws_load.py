@@ -0,0 +1,35 @@
+"""Tests for the end-to-end WebSocket load benchmark."""
+from benchmarks.ws_load import Scenario, compare, run_local, synthetic_bpmn
+from lint import lint
+
+
+def test_synthetic_diagrams_are_valid_and_scale_with_tasks():
+    small, large = synthetic_bpmn(5), synthetic_bpmn(50, marker="load-0-0:1")
+    assert lint(small, 1).as_list() == []
+    assert lint(large, 1).as_list() == []
+    assert 'name="load-0-0:1"' in large
+    # About 400 bytes of XML per task
+    assert 400 * 45 < len(large) - len(small) < 500 * 45
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {"delivered_per_s": 100.0, "update_p99_ms": 10.0, "ack_p99_ms": 5.0}
+    results = {"delivered_per_s": 70.0, "update_p99_ms": 11.0, "ack_p99_ms": 2.0}
+    regressions = compare(results, baseline, tolerance=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("delivered_per_s: 70.0")
+    assert compare(results, baseline, tolerance=0.5) == []
+
+
+def test_local_run_reports_fan_out_latency():
+    scenario = Scenario(
+        rooms=2, users=3, duration=1.5, tasks=5, update_rate=4, lock_rate=4
+    )
+    results = run_local(scenario)
+    assert results["connections"] == 6
+    assert results["errors"] == 0
+    assert results["update_samples"] > 0
+    assert results["lock_samples"] > 0
+    assert results["ack_samples"] > 0
+    assert results["join_p50_ms"] > 0
+    assert results["delivered_per_s"] > results["sent_per_s"]
@@ -0,0 +1,224 @@
+"""SVG thumbnails rendered from a diagram's BPMN DI, cached per version."""
+
+import asyncio
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from background import LatestOnlyWorker
+from cache import CachedXml, DiagramCache
+from config import THUMBNAIL_CACHE_SIZE, THUMBNAIL_HEIGHT, THUMBNAIL_WIDTH, THUMBNAIL_WORKERS
+
+_MODEL = "{http://www.omg.org/spec/BPMN/20100524/MODEL}"
+_BPMNDI = "{http://www.omg.org/spec/BPMN/20100524/DI}"
+_DC = "{http://www.omg.org/spec/DD/20100524/DC}"
+_DI = "{http://www.omg.org/spec/DD/20100524/DI}"
+
+_PADDING = 10
+_STYLE = (
+    "rect,circle,path,polygon{fill:#fff;stroke:#333;stroke-width:2}"
+    ".c{fill:none;stroke-width:1.5}.c.m{stroke-dasharray:6 4}.c.a{stroke-dasharray:2 4}"
+    ".p{fill:none;stroke-width:1.5}.g{fill:none;stroke-dasharray:8 4 2 4}"
+    ".e{stroke-width:4}"
+    "text{font:12px sans-serif;fill:#333;text-anchor:middle;dominant-baseline:middle}"
+)
+
+Box = Tuple[float, float, float, float]
+
+
+def _bounds(element) -> Optional[Box]:
+    bounds = element.find(f"{_DC}Bounds")
+    if bounds is None:
+        return None
+    try:
+        return tuple(float(bounds.get(key, 0)) for key in ("x", "y", "width", "height"))
+    except ValueError:
+        return None
+
+
+def _n(value: float) -> str:
+    return f"{value:.0f}"
+
+
+def _label(text: str, x: float, y: float, max_width: float) -> str:
+    # Roughly 7px per character at 12px; long names are cut rather than wrapped
+    max_chars = max(int(max_width // 7), 3)
+    if len(text) > max_chars:
+        text = text[: max_chars - 1] + "…"
+    return f'<text x="{_n(x)}" y="{_n(y)}">{escape(text)}</text>'
+
+
+def _shape(kind: str, box: Box) -> str:
+    x, y, w, h = box
+    if kind.endswith("Event"):
+        css = ' class="e"' if kind == "endEvent" else ""
+        circle = f'<circle{css} cx="{_n(x + w / 2)}" cy="{_n(y + h / 2)}" r="{_n(w / 2)}"/>'
+        if kind in ("intermediateCatchEvent", "intermediateThrowEvent", "boundaryEvent"):
+            circle += (
+                f'<circle cx="{_n(x + w / 2)}" cy="{_n(y + h / 2)}" r="{_n(w / 2 - 3)}"/>'
+            )
+        return circle
+    if kind.endswith("Gateway"):
+        points = " ".join(
+            f"{_n(px)},{_n(py)}"
+            for px, py in ((x + w / 2, y), (x + w, y + h / 2), (x + w / 2, y + h), (x, y + h / 2))
+        )
+        return f'<polygon points="{points}"/>'
+    if kind in ("participant", "lane"):
+        return f'<rect class="p" x="{_n(x)}" y="{_n(y)}" width="{_n(w)}" height="{_n(h)}"/>'
+    if kind == "group":
+        return f'<rect class="g" rx="10" x="{_n(x)}" y="{_n(y)}" width="{_n(w)}" height="{_n(h)}"/>'
+    if kind == "textAnnotation":
+        return f'<path class="p" d="M{_n(x + 10)},{_n(y)}H{_n(x)}V{_n(y + h)}H{_n(x + 10)}"/>'
+    if kind in ("dataObjectReference", "dataStoreReference", "dataObject", "dataStore"):
+        return f'<rect x="{_n(x)}" y="{_n(y)}" width="{_n(w)}" height="{_n(h)}"/>'
+    return f'<rect rx="10" x="{_n(x)}" y="{_n(y)}" width="{_n(w)}" height="{_n(h)}"/>'
+
+
+def render_svg(xml: str, width: int = THUMBNAIL_WIDTH, height: int = THUMBNAIL_HEIGHT) -> str:
+    """Render the shapes, edges and labels of the first BPMN plane as SVG.
+
+    This is deliberately schematic: no markers or icons, just enough to
+    recognise a diagram at thumbnail size.
+    """
+    try:
+        root = ET.fromstring(xml)
+    except ET.ParseError:
+        root = None
+
+    kinds: Dict[str, str] = {}
+    names: Dict[str, str] = {}
+    plane = None
+    if root is not None:
+        for element in root.iter():
+            element_id = element.get("id")
+            if element_id and element.tag.startswith(_MODEL):
+                kinds[element_id] = element.tag[len(_MODEL) :]
+                if element.get("name"):
+                    names[element_id] = element.get("name")
+        plane = root.find(f"{_BPMNDI}BPMNDiagram/{_BPMNDI}BPMNPlane")
+
+    containers: List[str] = []
+    edges: List[str] = []
+    shapes: List[str] = []
+    labels: List[str] = []
+    xs: List[float] = []
+    ys: List[float] = []
+
+    for element in plane if plane is not None else ():
+        ref = element.get("bpmnElement", "")
+        kind = kinds.get(ref, "")
+        name = names.get(ref, "")
+        label_box = None
+        label = element.find(f"{_BPMNDI}BPMNLabel")
+        if label is not None:
+            label_box = _bounds(label)
+
+        if element.tag == f"{_BPMNDI}BPMNShape":
+            box = _bounds(element)
+            if box is None:
+                continue
+            x, y, w, h = box
+            xs += [x, x + w]
+            ys += [y, y + h]
+            target = containers if kind in ("participant", "lane", "group") else shapes
+            target.append(_shape(kind, box))
+            if not name:
+                continue
+            if label_box is not None:
+                lx, ly, lw, lh = label_box
+                labels.append(_label(name, lx + lw / 2, ly + lh / 2, max(lw, 90)))
+            elif kind in ("participant", "lane"):
+                labels.append(_label(name, x + 15, y + h / 2, h))
+            elif kind.endswith("Event") or kind.endswith("Gateway") or kind.startswith("data"):
+                labels.append(_label(name, x + w / 2, y + h + 12, 90))
+            else:
+                labels.append(_label(name, x + w / 2, y + h / 2, w - 8))
+
+        elif element.tag == f"{_BPMNDI}BPMNEdge":
+            points = []
+            for waypoint in element.findall(f"{_DI}waypoint"):
+                try:
+                    px, py = float(waypoint.get("x", 0)), float(waypoint.get("y", 0))
+                except ValueError:
+                    continue
+                points.append(f"{_n(px)},{_n(py)}")
+                xs.append(px)
+                ys.append(py)
+            if len(points) < 2:
+                continue
+            css = "c m" if kind == "messageFlow" else "c a" if kind == "association" else "c"
+            edges.append(f'<path class="{css}" d="M{"L".join(points)}"/>')
+            if name and label_box is not None:
+                lx, ly, lw, lh = label_box
+                labels.append(_label(name, lx + lw / 2, ly + lh / 2, max(lw, 90)))
+
+    if xs:
+        min_x, min_y = min(xs) - _PADDING, min(ys) - _PADDING
+        view_w, view_h = max(xs) - min_x + _PADDING, max(ys) - min_y + _PADDING
+        view_box = f"{_n(min_x)} {_n(min_y)} {_n(view_w)} {_n(view_h)}"
+    else:
+        view_box = f"0 0 {width} {height}"
+
+    return "".join(
+        [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="{view_box}" preserveAspectRatio="xMidYMid meet">',
+            f"<style>{_STYLE}</style>",
+            *containers,
+            *edges,
+            *shapes,
+            *labels,
+            "</svg>",
+        ]
+    )
+
+
+class ThumbnailRenderer:
+    """Renders thumbnails in a process pool and caches them by diagram version.
+
+    Saves schedule a render in the background; if more saves arrive while one
+    is rendering, only the newest version is rendered next.
+    """
+
+    def __init__(self, workers: int, cache_size: int):
+        self._workers = workers
+        self._cache = DiagramCache(max_entries=cache_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._background = LatestOnlyWorker(self.render, "Thumbnail rendering")
+
+    def get(self, diagram_id: str, version: int) -> Optional[CachedXml]:
+        return self._cache.get(diagram_id, version)
+
+    async def render(self, diagram_id: str, version: int, xml: str) -> CachedXml:
+        """Render and cache the thumbnail of a diagram version."""
+        cached = self._cache.get(diagram_id, version)
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        svg = await loop.run_in_executor(self._pool(), render_svg, xml)
+        return self._cache.put(diagram_id, version, svg)
+
+    def schedule(self, diagram_id: str, version: int, xml: str) -> None:
+        """Render a saved version in the background."""
+        self._background.schedule(diagram_id, version, xml)
+
+    def _pool(self) -> Optional[ProcessPoolExecutor]:
+        # None runs renders on the default thread pool instead
+        if self._executor is None and self._workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global renderer instance
+thumbnail_renderer = ThumbnailRenderer(THUMBNAIL_WORKERS, THUMBNAIL_CACHE_SIZE)
@@ -0,0 +1,278 @@
+"""Streaming helpers for bulk diagram import and export."""
+
+import json
+import logging
+import re
+import time
+import zipfile
+from pathlib import PurePosixPath
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator
+
+from pydantic import ValidationError
+
+from models import DiagramImportRecord
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ZIP_MEDIA_TYPE = "application/zip"
+SUMMARY_ENTRY_NAME = "_export_summary.json"
+BPMN_EXTENSIONS = (".bpmn", ".xml")
+
+_ZIP_ENTRY_ID = re.compile(
+    r"__(?P<id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$"
+)
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^\w\-. ]+")
+
+
+class ImportRecordError(ValueError):
+    """Raised when a record in an import stream cannot be parsed."""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(message)
+        self.index = index
+
+
+class ImportTooLargeError(ImportRecordError):
+    """Raised when an import stream exceeds its configured size limits."""
+
+
+def parse_import_record(index: int, raw: dict) -> dict:
+    """Validate a raw import record and return it as a plain dict."""
+    try:
+        return DiagramImportRecord(**raw).model_dump()
+    except (ValidationError, TypeError) as exc:
+        raise ImportRecordError(index, f"Invalid record: {exc}") from exc
+
+
+async def iter_ndjson_records(
+    chunks: AsyncIterator[bytes], max_line_bytes: int
+) -> AsyncIterator[dict]:
+    """Parse diagram records from an NDJSON byte stream.
+
+    Only one line is buffered at a time, and no more than ``max_line_bytes``
+    of it. Export summary lines are skipped so an export file can be
+    imported as-is.
+    """
+    buffer = b""
+    index = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if any(len(line) > max_line_bytes for line in (*lines, buffer)):
+            raise ImportTooLargeError(
+                index, f"A record is larger than {max_line_bytes} bytes"
+            )
+        for line in lines:
+            record = _parse_ndjson_line(index, line)
+            if record is not None:
+                yield record
+                index += 1
+    record = _parse_ndjson_line(index, buffer)
+    if record is not None:
+        yield record
+
+
+def _parse_ndjson_line(index: int, line: bytes):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        raw = json.loads(line)
+    except json.JSONDecodeError as exc:
+        raise ImportRecordError(index, f"Invalid JSON: {exc.msg}") from exc
+    if isinstance(raw, dict) and raw.get("type") == "summary":
+        return None
+    if not isinstance(raw, dict):
+        raise ImportRecordError(index, "Each line must be a JSON object")
+    return parse_import_record(index, raw)
+
+
+def iter_zip_records(
+    fileobj: BinaryIO, max_entry_bytes: int, max_total_bytes: int
+) -> Iterator[dict]:
+    """Read diagram records from a zip archive of BPMN files.
+
+    Entries are decompressed one at a time in archive order. An entry named
+    ``<name>__<uuid>.bpmn`` (as written by the exporter) keeps its ID.
+
+    No entry may expand to more than ``max_entry_bytes``, and all of them
+    together to no more than ``max_total_bytes``. Sizes are checked against
+    the archive's directory and again while decompressing, since the
+    directory can understate them.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as exc:
+        raise ImportRecordError(0, "Invalid zip archive") from exc
+
+    index = 0
+    total = 0
+    with archive:
+        for info in archive.infolist():
+            path = PurePosixPath(info.filename)
+            if info.is_dir() or path.suffix.lower() not in BPMN_EXTENSIONS:
+                continue
+            too_large = ImportTooLargeError(
+                index, f"{info.filename} is larger than {max_entry_bytes} bytes"
+            )
+            if info.file_size > max_entry_bytes:
+                raise too_large
+            try:
+                with archive.open(info) as entry:
+                    data = entry.read(max_entry_bytes + 1)
+            except (zipfile.BadZipFile, OSError) as exc:
+                raise ImportRecordError(index, f"{info.filename} is corrupt") from exc
+            if len(data) > max_entry_bytes:
+                raise too_large
+            total += len(data)
+            if total > max_total_bytes:
+                raise ImportTooLargeError(
+                    index, f"The archive expands to more than {max_total_bytes} bytes"
+                )
+            try:
+                xml = data.decode("utf-8")
+            except UnicodeDecodeError as exc:
+                raise ImportRecordError(index, f"{info.filename} is not UTF-8") from exc
+
+            raw = {"name": path.stem, "xml": xml}
+            match = _ZIP_ENTRY_ID.search(path.stem)
+            if match:
+                raw["id"] = match.group("id")
+                raw["name"] = path.stem[: match.start()] or path.stem
+            yield parse_import_record(index, raw)
+            index += 1
+
+
+class _ZipStreamBuffer:
+    """Write-only file object that lets a ZipFile be drained incrementally."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+class ExportStats:
+    """Throughput counters for a running export."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.bytes = 0
+        self.cursor = None
+
+    def add(self, diagram: dict, size: int) -> None:
+        self.count += 1
+        self.bytes += size
+        self.cursor = diagram["id"]
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "type": "summary",
+            "count": self.count,
+            "cursor": self.cursor,
+            "elapsed_seconds": round(elapsed, 3),
+            "diagrams_per_second": round(self.count / elapsed, 1) if elapsed else 0.0,
+            "bytes": self.bytes,
+        }
+
+
+def export_ndjson(diagrams: Iterable[dict]) -> Iterator[bytes]:
+    """Yield one NDJSON line per diagram followed by a summary line.
+
+    A missing summary line means the export was cut short; the client can
+    resume by passing the last received ``id`` as the ``after`` cursor.
+    """
+    stats = ExportStats()
+    for diagram in diagrams:
+        line = (json.dumps(diagram) + "\n").encode("utf-8")
+        stats.add(diagram, len(line))
+        yield line
+    summary = stats.summary()
+    _log_export("ndjson", summary)
+    yield (json.dumps(summary) + "\n").encode("utf-8")
+
+
+def export_zip(diagrams: Iterable[dict]) -> Iterator[bytes]:
+    """Yield a zip archive with one ``.bpmn`` entry per diagram.
+
+    The archive is flushed after every entry so only a single diagram is
+    held in memory at a time.
+    """
+    stats = ExportStats()
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for diagram in diagrams:
+            safe_name = _UNSAFE_FILENAME_CHARS.sub("_", diagram["name"]).strip() or "diagram"
+            archive.writestr(f"{safe_name}__{diagram['id']}.bpmn", diagram["xml"])
+            chunk = buffer.drain()
+            stats.add(diagram, len(chunk))
+            yield chunk
+        summary = stats.summary()
+        _log_export("zip", summary)
+        archive.writestr(SUMMARY_ENTRY_NAME, json.dumps(summary))
+    yield buffer.drain()
+
+
+def _log_export(fmt: str, summary: dict) -> None:
+    logging.info(
+        f"Exported {summary['count']} diagrams as {fmt} in "
+        f"{summary['elapsed_seconds']}s ({summary['diagrams_per_second']}/s)"
+    )
+
+
+class ImportBatcher:
+    """Groups import records into batches and tracks the resume cursor.
+
+    The cursor counts records from the start of the stream; records before
+    it were committed by an earlier attempt and are skipped.
+    """
+
+    def __init__(self, cursor: int, batch_size: int):
+        self.cursor = max(cursor, 0)
+        self.batch_size = max(batch_size, 1)
+        self.batch: list[dict] = []
+        self.imported = 0
+        self.skipped = 0
+        self._position = 0
+        self._started = time.perf_counter()
+
+    def add(self, record: dict) -> bool:
+        """Queue a record; returns True once the batch is full."""
+        self._position += 1
+        if self._position <= self.cursor:
+            return False
+        self.batch.append(record)
+        return len(self.batch) >= self.batch_size
+
+    def commit(self, result: dict) -> None:
+        """Record a committed batch and advance the cursor past it."""
+        self.imported += result["imported"]
+        self.skipped += result["skipped"]
+        self.cursor = self._position
+        self.batch = []
+
+    def result(self) -> dict:
+        elapsed = time.perf_counter() - self._started
+        total = self.imported + self.skipped
+        logging.info(
+            f"Imported {self.imported} diagrams ({self.skipped} skipped) "
+            f"in {elapsed:.3f}s"
+        )
+        return {
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "cursor": self.cursor,
+            "elapsed_seconds": round(elapsed, 3),
+            "diagrams_per_second": round(total / elapsed, 1) if elapsed else 0.0,
+        }
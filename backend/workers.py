@@ -0,0 +1,417 @@
+"""Multi-worker launcher that shards diagrams across processes.
+
+A front router accepts every connection, reads the request head and forwards
+the raw byte stream to a worker process chosen by consistent hash of the
+diagram ID. Each room's in-memory state (sessions, locks, cache) therefore
+lives in exactly one worker. Requests that do not name a diagram are spread
+round-robin. Plain HTTP requests are forwarded with ``Connection: close``, so
+every request is routed on its own rather than following the first request
+of a keep-alive connection to its worker.
+
+Send SIGTTIN to add a worker and SIGTTOU to remove one. Rooms whose owner
+changes are released by their old worker with close code 1012, staggered
+over ``WORKER_REBALANCE_JITTER`` seconds, and clients reconnect through the
+router to the new owner.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import random
+import re
+import secrets
+import signal
+import socket
+import uuid
+from typing import Dict, List, Optional, Set
+
+from config import (
+    HOST,
+    PORT,
+    WORKER_HASH_REPLICAS,
+    WORKER_REBALANCE_JITTER,
+)
+
+MAX_REQUEST_HEAD_BYTES = 64 * 1024
+PIPE_CHUNK_BYTES = 64 * 1024
+INTERNAL_PATH_PREFIX = "/internal/"
+
+# Set by the router from the peer address, never taken from the client
+_REWRITTEN_HEADERS = {b"x-forwarded-for", b"connection", b"keep-alive"}
+
+_DIAGRAM_PATH = re.compile(r"^/(?:ws|api/diagrams)/(?P<id>[0-9a-fA-F-]{32,36})(?:/|$)")
+
+
+def diagram_id_for_path(path: str) -> Optional[str]:
+    """Extract the diagram ID a request path refers to, if any.
+
+    The ID is returned in canonical form, so every spelling the app accepts
+    for a diagram (hex with or without dashes, any case) hashes to one worker.
+    """
+    match = _DIAGRAM_PATH.match(path)
+    if not match:
+        return None
+    try:
+        return str(uuid.UUID(match.group("id")))
+    except ValueError:
+        return None
+
+
+def rewrite_headers(headers: bytes, client_ip: Optional[str]) -> bytes:
+    """Headers of a request head as forwarded to a worker.
+
+    The client's own X-Forwarded-For is dropped for one naming the peer.
+    Requests other than WebSocket upgrades get ``Connection: close``: the
+    router only sees the first request head on a connection, so a keep-alive
+    follow-up would reach that request's worker whatever its path.
+    """
+    lines = headers.split(b"\r\n")
+    upgrade = False
+    kept = []
+    for line in lines:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"upgrade" and value.strip().lower() == b"websocket":
+            upgrade = True
+        if name not in _REWRITTEN_HEADERS:
+            kept.append(line)
+        elif name == b"connection" and b"upgrade" in value.lower():
+            kept.append(line)
+    added = []
+    if client_ip:
+        added.append(f"X-Forwarded-For: {client_ip}".encode("latin-1"))
+    if not upgrade:
+        added.append(b"Connection: close")
+    # The head ends with an empty line, which stays last
+    return b"\r\n".join(added + kept)
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Adding or removing a node only moves the keys that node gains or loses.
+    """
+
+    def __init__(self, nodes: Optional[List[str]] = None, replicas: int = 100):
+        self._replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes or []:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    @property
+    def nodes(self) -> Set[str]:
+        return set(self._owners.values())
+
+    def add(self, node: str) -> None:
+        for i in range(self._replicas):
+            point = self._hash(f"{node}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node: str) -> None:
+        for i in range(self._replicas):
+            point = self._hash(f"{node}#{i}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.pop(bisect.bisect_left(self._points, point))
+
+    def node_for(self, key: str) -> Optional[str]:
+        """Get the node that owns a key."""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve_worker(port: int) -> None:
+    """Process target: run one uvicorn worker bound to loopback."""
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host="127.0.0.1",
+        port=port,
+        proxy_headers=True,
+        forwarded_allow_ips="127.0.0.1",
+    )
+
+
+class Worker:
+    """A worker process and the loopback port it serves on."""
+
+    def __init__(self, name: str, port: int, control_token: str):
+        self.name = name
+        self.port = port
+        self.control_token = control_token
+        self.process: Optional[multiprocessing.Process] = None
+        self.retiring = False
+
+    def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=_serve_worker, args=(self.port,), name=self.name
+        )
+        self.process.start()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self) -> None:
+        if self.process and self.process.is_alive():
+            self.process.terminate()
+
+    async def request(self, method: str, path: str, timeout: float = 2.0) -> int:
+        """Send a bodyless HTTP request to the worker; returns the status code."""
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection("127.0.0.1", self.port), timeout
+        )
+        try:
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                f"X-Worker-Token: {self.control_token}\r\n"
+                "Content-Length: 0\r\nConnection: close\r\n\r\n".encode("latin-1")
+            )
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), timeout)
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+
+    async def wait_until_serving(self, timeout: float = 30.0) -> bool:
+        """Poll the worker's liveness probe until it answers."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            if not self.is_alive():
+                return False
+            try:
+                if await self.request("GET", "/healthz") == 200:
+                    return True
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                pass
+            await asyncio.sleep(0.1)
+        return False
+
+
+class ShardRouter:
+    """Front router and supervisor for a pool of diagram-sharded workers."""
+
+    def __init__(self, worker_count: int, host: str = HOST, port: int = PORT):
+        self.host = host
+        self.port = port
+        self.ring = HashRing(replicas=WORKER_HASH_REPLICAS)
+        self.workers: Dict[str, Worker] = {}
+        self._initial_workers = max(worker_count, 1)
+        self._control_token = secrets.token_urlsafe(32)
+        # Spawned workers import config before running, so pass it by environment
+        os.environ["WORKER_CONTROL_TOKEN"] = self._control_token
+        self._names = (f"worker-{i}" for i in itertools.count())
+        self._round_robin = itertools.cycle([])
+        # diagram_id -> worker name -> open WebSocket connections routed there
+        self._rooms: Dict[str, Dict[str, int]] = {}
+        self._scaling = asyncio.Lock()
+        self._stopping: Optional[asyncio.Event] = None
+
+    # Request routing
+
+    def worker_for(self, path: str) -> Optional[Worker]:
+        diagram_id = diagram_id_for_path(path)
+        if diagram_id:
+            name = self.ring.node_for(diagram_id)
+            return self.workers.get(name) if name else None
+        for _ in range(len(self.workers)):
+            worker = self.workers.get(next(self._round_robin))
+            if worker and not worker.retiring:
+                return worker
+        return None
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+
+        request_line, _, headers = head.partition(b"\r\n")
+        try:
+            target = request_line.split(b" ")[1].decode("latin-1")
+        except IndexError:
+            writer.close()
+            return
+        path = target.split("?", 1)[0]
+
+        worker = None if path.startswith(INTERNAL_PATH_PREFIX) else self.worker_for(path)
+        if worker is None:
+            status = "404 Not Found" if path.startswith(INTERNAL_PATH_PREFIX) else "503 Service Unavailable"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+            writer.close()
+            return
+
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(
+                "127.0.0.1", worker.port
+            )
+        except OSError:
+            writer.close()
+            return
+
+        peer = writer.get_extra_info("peername")
+        headers = rewrite_headers(headers, peer[0] if peer else None)
+        upstream_writer.write(request_line + b"\r\n" + headers)
+
+        diagram_id = diagram_id_for_path(path) if path.startswith("/ws/") else None
+        if diagram_id:
+            room = self._rooms.setdefault(diagram_id, {})
+            room[worker.name] = room.get(worker.name, 0) + 1
+        try:
+            await asyncio.gather(
+                self._pipe(reader, upstream_writer),
+                self._pipe(upstream_reader, writer),
+            )
+        finally:
+            if diagram_id:
+                room = self._rooms.get(diagram_id, {})
+                room[worker.name] = room.get(worker.name, 1) - 1
+                if room.get(worker.name, 0) <= 0:
+                    room.pop(worker.name, None)
+                if not room:
+                    self._rooms.pop(diagram_id, None)
+
+    @staticmethod
+    async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                data = await reader.read(PIPE_CHUNK_BYTES)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            try:
+                writer.close()
+            except RuntimeError:
+                pass
+
+    # Worker pool management
+
+    def _refresh_round_robin(self) -> None:
+        self._round_robin = itertools.cycle(sorted(self.workers))
+
+    async def add_worker(self) -> Optional[Worker]:
+        """Start a worker and give it a share of the ring once it is serving."""
+        async with self._scaling:
+            worker = Worker(next(self._names), _free_port(), self._control_token)
+            worker.start()
+            if not await worker.wait_until_serving():
+                logging.error(f"{worker.name} failed to start")
+                worker.stop()
+                return None
+            self.workers[worker.name] = worker
+            self.ring.add(worker.name)
+            self._refresh_round_robin()
+            logging.info(f"{worker.name} serving on port {worker.port}")
+            self._rebalance()
+            return worker
+
+    async def remove_worker(self) -> None:
+        """Retire the newest worker after handing its rooms to the others."""
+        async with self._scaling:
+            active = [w for w in self.workers.values() if not w.retiring]
+            if len(active) <= 1:
+                logging.warning("Refusing to remove the last worker")
+                return
+            worker = active[-1]
+            worker.retiring = True
+            self.ring.remove(worker.name)
+            self._refresh_round_robin()
+            self._rebalance()
+            # Let released clients reconnect elsewhere before stopping the process
+            await asyncio.sleep(WORKER_REBALANCE_JITTER + 1)
+            worker.stop()
+            await asyncio.to_thread(worker.process.join, 10)
+            self.workers.pop(worker.name, None)
+            self._refresh_round_robin()
+            logging.info(f"{worker.name} retired")
+
+    def _rebalance(self) -> None:
+        """Ask previous owners to release rooms that now hash elsewhere."""
+        for diagram_id, room in list(self._rooms.items()):
+            owner = self.ring.node_for(diagram_id)
+            for name in list(room):
+                if name != owner and name in self.workers:
+                    delay = random.uniform(0, WORKER_REBALANCE_JITTER)
+                    asyncio.create_task(self._release_room(self.workers[name], diagram_id, delay))
+
+    async def _release_room(self, worker: Worker, diagram_id: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await worker.request("POST", f"{INTERNAL_PATH_PREFIX}rooms/{diagram_id}/release")
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError) as exc:
+            logging.warning(f"Could not release {diagram_id} from {worker.name}: {exc}")
+
+    async def _supervise(self) -> None:
+        """Restart crashed workers in place so ring ownership does not change."""
+        while not self._stopping.is_set():
+            await asyncio.sleep(1)
+            for worker in list(self.workers.values()):
+                if not worker.retiring and not worker.is_alive():
+                    logging.warning(f"{worker.name} exited; restarting")
+                    worker.start()
+
+    async def serve(self) -> None:
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for _ in range(self._initial_workers):
+            await self.add_worker()
+        if not self.workers:
+            raise RuntimeError("No workers could be started")
+
+        server = await asyncio.start_server(
+            self.handle_client, self.host, self.port, limit=MAX_REQUEST_HEAD_BYTES
+        )
+        loop.add_signal_handler(signal.SIGTTIN, lambda: asyncio.create_task(self.add_worker()))
+        loop.add_signal_handler(signal.SIGTTOU, lambda: asyncio.create_task(self.remove_worker()))
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+        logging.info(
+            f"Routing {self.host}:{self.port} across {len(self.workers)} workers"
+        )
+
+        supervisor = asyncio.create_task(self._supervise())
+        async with server:
+            await self._stopping.wait()
+        supervisor.cancel()
+        for worker in self.workers.values():
+            worker.retiring = True
+            worker.stop()
+        for worker in self.workers.values():
+            await asyncio.to_thread(worker.process.join, 10)
+
+
+def run_sharded(worker_count: int) -> None:
+    """Run the router with ``worker_count`` diagram-sharded workers."""
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(ShardRouter(worker_count).serve())
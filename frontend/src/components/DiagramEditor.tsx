@@ -1,15 +1,22 @@
 import React, { useEffect, useRef, useState, useCallback } from 'react';
-import { useParams, useNavigate } from 'react-router-dom';
+import { useParams, useNavigate, useSearchParams } from 'react-router-dom';
 import BpmnModeler from 'bpmn-js/lib/Modeler';
 import 'bpmn-js/dist/assets/diagram-js.css';
 import 'bpmn-js/dist/assets/bpmn-font/css/bpmn.css';
 import { useWebSocket } from '../hooks/useWebSocket';
 import { api } from '../utils/api';
-import { MESSAGE_TYPES, DIAGRAM_UPDATE_DEBOUNCE_MS } from '../constants';
+import { MESSAGE_TYPES, DIAGRAM_UPDATE_DEBOUNCE_MS, CURSOR_SEND_INTERVAL_MS } from '../constants';
 import { 
   AllWebSocketMessages, 
   DiagramStateMessage, 
   DiagramUpdateMessage, 
+  DiagramAckMessage,
+  CursorsMessage,
+  ValidationResult,
+  ValidationResultMessage,
+  XmlUploadErrorMessage,
+  RemoteCursor,
+  Viewbox,
   EventBus,
   ElementRegistry,
   Canvas,
@@ -23,6 +30,8 @@ import { sanitizeFileName, triggerDownload } from '../utils/utils';
 const DiagramEditor: React.FC = () => {
   const { diagramId } = useParams<{ diagramId: string }>();
   const navigate = useNavigate();
+  const [searchParams] = useSearchParams();
+  const isSpectator = searchParams.get('mode') === 'view';
   const containerRef = useRef<HTMLDivElement>(null);
   const modelerRef = useRef<BpmnModeler | null>(null);
   const [diagramName, setDiagramName] = useState('');
@@ -38,6 +47,47 @@ const DiagramEditor: React.FC = () => {
   const elementLocksRef = useRef<Record<string, { user_id: string; user_name: string }>>({}); // All locks from server
   const isApplyingRemoteUpdateRef = useRef<boolean>(false);
   const myUserNameRef = useRef<string>('');
+  const myCursorIdRef = useRef<number | null>(null);
+  // Server version our copy is based on; lets the server merge concurrent edits
+  const versionRef = useRef<number | null>(null);
+  const pendingCursorRef = useRef<{ x: number; y: number } | null>(null);
+  const cursorTimeoutRef = useRef<NodeJS.Timeout | null>(null);
+  const [remoteCursors, setRemoteCursors] = useState<Record<number, RemoteCursor>>({});
+  const [viewbox, setViewbox] = useState<Viewbox | null>(null);
+  const [validation, setValidation] = useState<ValidationResult | null>(null);
+  const validationRef = useRef<ValidationResult | null>(null);
+  const lintMarkedRef = useRef<Record<string, string>>({});
+
+  // Markers are lost on every import, so they are re-applied from the ref
+  const applyLintMarkers = useCallback(() => {
+    if (!modelerRef.current) return;
+    const canvas = modelerRef.current.get('canvas') as Canvas;
+    const elementRegistry = modelerRef.current.get('elementRegistry') as ElementRegistry;
+
+    Object.entries(lintMarkedRef.current).forEach(([elementId, marker]) => {
+      if (elementRegistry.get(elementId)) {
+        canvas.removeMarker(elementId, marker);
+      }
+    });
+    const marked: Record<string, string> = {};
+    validationRef.current?.issues.forEach(({ element_id, severity }) => {
+      if (!element_id || !elementRegistry.get(element_id)) return;
+      if (marked[element_id] === 'lint-error') return;
+      marked[element_id] = severity === 'error' ? 'lint-error' : 'lint-warning';
+    });
+    Object.entries(marked).forEach(([elementId, marker]) => {
+      canvas.addMarker(elementId, marker);
+    });
+    lintMarkedRef.current = marked;
+  }, []);
+
+  const showValidation = useCallback((result: ValidationResult) => {
+    // Results of older versions can arrive late; keep the newest
+    if (validationRef.current && result.version < validationRef.current.version) return;
+    validationRef.current = result;
+    setValidation(result);
+    applyLintMarkers();
+  }, [applyLintMarkers]);
 
   const updateLockMarker = useCallback((elementId: string, userName: string) => {
     if (!modelerRef.current) return;
@@ -121,6 +171,9 @@ const DiagramEditor: React.FC = () => {
         if (stateMessage.data?.my_user_name) {
           myUserNameRef.current = stateMessage.data.my_user_name;
         }
+        myCursorIdRef.current = stateMessage.data?.cursor_id ?? null;
+        versionRef.current = stateMessage.data?.version ?? null;
+        setRemoteCursors({});
         if (stateMessage.data?.xml) {
           isApplyingRemoteUpdateRef.current = true;
           modelerRef.current.importXML(stateMessage.data.xml).then(() => {
@@ -134,6 +187,9 @@ const DiagramEditor: React.FC = () => {
 
       case MESSAGE_TYPES.DIAGRAM_UPDATE: {
         const updateMessage = message as DiagramUpdateMessage;
+        if (updateMessage.data?.version) {
+          versionRef.current = updateMessage.data.version;
+        }
         // Only apply updates from other users
         if (updateMessage.data?.xml && modelerRef.current && updateMessage.user) {
           // Set flag to prevent sending our own update back
@@ -152,6 +208,10 @@ const DiagramEditor: React.FC = () => {
         break;
       }
 
+      case MESSAGE_TYPES.DIAGRAM_ACK:
+        versionRef.current = (message as DiagramAckMessage).data.version;
+        break;
+
       case MESSAGE_TYPES.ELEMENT_LOCKED:
         if (message.data) {
           const { element_id, user_id, user_name } = message.data;
@@ -178,14 +238,47 @@ const DiagramEditor: React.FC = () => {
           removeLockMarker(elementId);
         }
         break;
+
+      case MESSAGE_TYPES.CURSORS: {
+        const { cursors, gone } = (message as CursorsMessage).data;
+        setRemoteCursors((prev) => {
+          const next = { ...prev };
+          gone.forEach((slot) => delete next[slot]);
+          cursors.forEach(([slot, name, x, y]) => {
+            if (slot !== myCursorIdRef.current) {
+              next[slot] = { userName: name, x, y };
+            }
+          });
+          return next;
+        });
+        break;
+      }
+
+      case MESSAGE_TYPES.VALIDATION_RESULT:
+        showValidation((message as ValidationResultMessage).data);
+        break;
+
+      case MESSAGE_TYPES.XML_UPLOAD_ERROR:
+        setError(`Saving failed: ${(message as XmlUploadErrorMessage).data.error}`);
+        setTimeout(() => setError(null), 5000);
+        break;
+
       default:
         break;
     }
-  }, [removeLockMarker, updateLockMarker]);
-
-  const { connected, sendMessage, users, elementLocks } = useWebSocket({
+  }, [removeLockMarker, updateLockMarker, showValidation]);
+
+  const {
+    connected,
+    sendMessage,
+    sendDiagramUpdate,
+    uploadProgress,
+    users,
+    elementLocks,
+  } = useWebSocket({
     diagramId,
     userName: userName || undefined, // Pass custom name if set
+    mode: isSpectator ? 'view' : 'edit',
     onMessage: handleWebSocketMessage,
     onError: () => {
       // Error handler is only called for real errors (not connection failures)
@@ -211,26 +304,32 @@ const DiagramEditor: React.FC = () => {
   selection.select(elements);
 }
 
-  // Update my user name when users list changes
-  useEffect(() => {
-    if (users.length > 0) {
-      // Set our user name to the last one in the list (most likely us)
-      // This will be updated when we receive the user_list message
-      if (!myUserNameRef.current) {
-        myUserNameRef.current = users[users.length - 1];
-      }
-    }
-  }, [users]);
-
   const saveDiagram = useCallback(async () => {
     if (!modelerRef.current) return;
 
     try {
       const { xml } = await modelerRef.current.saveXML({ format: true });
-      sendMessage(MESSAGE_TYPES.DIAGRAM_UPDATE, { xml });
+      if (xml) sendDiagramUpdate(xml, versionRef.current ?? undefined);
     } catch (err) {
       console.error('Error saving diagram:', err);
     }
+  }, [sendDiagramUpdate]);
+
+  // Send at most one cursor position per interval, always ending on the latest one
+  const sendCursor = useCallback((x: number, y: number) => {
+    pendingCursorRef.current = { x, y };
+    if (cursorTimeoutRef.current) return;
+    cursorTimeoutRef.current = setTimeout(() => {
+      cursorTimeoutRef.current = null;
+      const position = pendingCursorRef.current;
+      if (!position || !modelerRef.current) return;
+      pendingCursorRef.current = null;
+      const { x: vx, y: vy, width, height } = (modelerRef.current.get('canvas') as Canvas).viewbox();
+      sendMessage(MESSAGE_TYPES.CURSOR, {
+        ...position,
+        viewport: { x: vx, y: vy, width, height },
+      });
+    }, CURSOR_SEND_INTERVAL_MS);
   }, [sendMessage]);
 
   const isLockedByOther = (elementId: string): boolean => {
@@ -287,6 +386,12 @@ const DiagramEditor: React.FC = () => {
     if (!modelerRef.current) return;
 
     const eventBus = modelerRef.current.get('eventBus') as EventBus;
+    // Everything registered here is removed again by the returned cleanup
+    const listeners: Array<[string, (...args: any[]) => void]> = [];
+    const on = (event: string, callback: (...args: any[]) => void) => {
+      eventBus.on(event, callback);
+      listeners.push([event, callback]);
+    };
 
     // Listen for diagram changes - catch all types of changes
     const eventBusChangeHandler = (e: EventBusChangeEvent) => {
@@ -315,13 +420,13 @@ const DiagramEditor: React.FC = () => {
     };
 
     // Listen to multiple events to catch all changes
-    eventBus.on('commandStack.changed', eventBusChangeHandler);
-    eventBus.on('shape.move', eventBusChangeHandler);
-    eventBus.on('element.changed', eventBusChangeHandler);
-    eventBus.on('connection.changed', eventBusChangeHandler);
+    on('commandStack.changed', eventBusChangeHandler);
+    on('shape.move', eventBusChangeHandler);
+    on('element.changed', eventBusChangeHandler);
+    on('connection.changed', eventBusChangeHandler);
 
     // Prevent dragging locked elements
-    eventBus.on('drag.start', (e: any) => {
+    on('drag.start', (e: any) => {
       if (e.shape && isLockedByOther(e.shape.id)) {
         e.preventDefault();
         e.stopPropagation();
@@ -329,7 +434,7 @@ const DiagramEditor: React.FC = () => {
     });
 
     // Prevent resizing locked elements
-    eventBus.on('resize.start', (e: any) => {
+    on('resize.start', (e: any) => {
       if (e.shape && isLockedByOther(e.shape.id)) {
         e.preventDefault();
         e.stopPropagation();
@@ -337,7 +442,7 @@ const DiagramEditor: React.FC = () => {
     });
 
     // Prevent connecting to/from locked elements
-    eventBus.on('connect.start', (e: any) => {
+    on('connect.start', (e: any) => {
       if (e.shape && isLockedByOther(e.shape.id)) {
         e.preventDefault();
         e.stopPropagation();
@@ -345,7 +450,7 @@ const DiagramEditor: React.FC = () => {
     });
 
     // Prevent direct editing of locked elements
-    eventBus.on('element.updateProperties', (e: any) => {
+    on('element.updateProperties', (e: any) => {
       if (e.element && isLockedByOther(e.element.id)) {
         e.preventDefault();
         e.stopPropagation();
@@ -371,8 +476,33 @@ const DiagramEditor: React.FC = () => {
         });
       }
     };
-    eventBus.on('selection.changed', selectionChangedHandler);
-  }, [saveDiagram, lockElement, unlockElement]);
+    on('selection.changed', selectionChangedHandler);
+
+    // Share our pointer in diagram coordinates so it lines up for everyone
+    const canvas = modelerRef.current.get('canvas') as Canvas;
+    const container = containerRef.current;
+    const mouseMoveHandler = (e: MouseEvent) => {
+      const rect = container!.getBoundingClientRect();
+      const box = canvas.viewbox();
+      sendCursor(
+        box.x + (e.clientX - rect.left) / box.scale,
+        box.y + (e.clientY - rect.top) / box.scale
+      );
+    };
+    container?.addEventListener('mousemove', mouseMoveHandler);
+    on('canvas.viewbox.changed', (e: { viewbox: Viewbox }) => {
+      setViewbox({ ...e.viewbox });
+    });
+    on('import.done', () => {
+      setViewbox({ ...canvas.viewbox() });
+      applyLintMarkers();
+    });
+
+    return () => {
+      listeners.forEach(([event, callback]) => eventBus.off(event, callback));
+      container?.removeEventListener('mousemove', mouseMoveHandler);
+    };
+  }, [saveDiagram, lockElement, unlockElement, sendCursor, applyLintMarkers]);
 
   const loadDiagram = useCallback(async () => {
     if (!diagramId) {
@@ -391,6 +521,10 @@ const DiagramEditor: React.FC = () => {
         console.log('Importing XML into modeler...');
         await modelerRef.current.importXML(diagram.xml);
         console.log('XML imported successfully');
+        // Later saves push results over the socket
+        api.getIssues(diagramId).then(showValidation).catch((err) => {
+          console.warn('Could not fetch lint issues:', err);
+        });
       } else {
         console.warn('Modeler not ready or no XML data');
       }
@@ -403,7 +537,7 @@ const DiagramEditor: React.FC = () => {
       setLoading(false);
       console.log('Loading complete');
     }
-  }, [diagramId]);
+  }, [diagramId, showValidation]);
 
   // Initialize BPMN modeler
   useEffect(() => {
@@ -413,6 +547,7 @@ const DiagramEditor: React.FC = () => {
     }
 
     let mounted = true;
+    let removeListeners: (() => void) | undefined;
 
     const initializeModeler = async () => {
       try {
@@ -420,8 +555,9 @@ const DiagramEditor: React.FC = () => {
           modelerRef.current = new BpmnModeler({
             container: containerRef.current!,
           });
-          setupEventListeners();
         }
+        // Registered on every run: the cleanup below removes them again
+        removeListeners = setupEventListeners();
 
         if (mounted && modelerRef.current) {
           await loadDiagram();
@@ -443,7 +579,9 @@ const DiagramEditor: React.FC = () => {
     return () => {
       mounted = false;
       clearTimeout(timer);
+      removeListeners?.();
       if (updateTimeoutRef.current) clearTimeout(updateTimeoutRef.current);
+      if (cursorTimeoutRef.current) clearTimeout(cursorTimeoutRef.current);
     };
   }, [diagramId, loadDiagram, setupEventListeners]);
 
@@ -526,9 +664,18 @@ const DiagramEditor: React.FC = () => {
             <span className={`connection-status ${connected ? 'connected' : 'disconnected'}`}>
               {connected ? '🟢' : '🔴'}
             </span>
-            <span className="users-count">
-              {users.length} user{users.length !== 1 ? 's' : ''} online
-            </span>
+            {uploadProgress !== null && (
+              <span className="upload-progress">
+                Saving {Math.round(uploadProgress * 100)}%
+              </span>
+            )}
+            {isSpectator ? (
+              <span className="spectator-badge">👁 View only</span>
+            ) : (
+              <span className="users-count">
+                {users.length} user{users.length !== 1 ? 's' : ''} online
+              </span>
+            )}
             {users.length > 0 && (
               <div className="users-list">
                 {users.map((user, idx) => (
@@ -539,6 +686,16 @@ const DiagramEditor: React.FC = () => {
               </div>
             )}
           </div>
+          {validation && (
+            <span
+              className={`lint-badge ${validation.errors ? 'has-errors' : validation.warnings ? 'has-warnings' : ''}`}
+              title={validation.issues.map((issue) => `${issue.element_id}: ${issue.message}`).join('\n') || 'No issues'}
+            >
+              {validation.errors || validation.warnings
+                ? `⚠ ${validation.errors} error${validation.errors !== 1 ? 's' : ''}, ${validation.warnings} warning${validation.warnings !== 1 ? 's' : ''}`
+                : '✓ Valid'}
+            </span>
+          )}
           <div className="settings-buttons">
             <button className="name-button" onClick={handleSetName} title="Set your name">
               👤 {userName || 'Set Name'}
@@ -590,6 +747,18 @@ const DiagramEditor: React.FC = () => {
           </div>
         )}
         <div ref={containerRef} className="bpmn-container"></div>
+        {viewbox && Object.entries(remoteCursors).map(([slot, cursor]) => (
+          <div
+            key={slot}
+            className="remote-cursor"
+            style={{
+              left: (cursor.x - viewbox.x) * viewbox.scale,
+              top: (cursor.y - viewbox.y) * viewbox.scale,
+            }}
+          >
+            <span className="remote-cursor-label">{cursor.userName}</span>
+          </div>
+        ))}
       </div>
     </div>
   );
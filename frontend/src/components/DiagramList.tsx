@@ -188,6 +188,13 @@ const DiagramList: React.FC = () => {
           <div className="diagrams-grid">
             {diagrams.map((diagram) => (
               <div key={diagram.id} className="diagram-card">
+                <img
+                  className="diagram-thumbnail"
+                  src={api.thumbnailUrl(diagram.id)}
+                  alt=""
+                  loading="lazy"
+                  onClick={() => navigate(`/diagram/${diagram.id}`)}
+                />
                 <div className="diagram-card-header">
                   <h3>{diagram.name}</h3>
                   <button
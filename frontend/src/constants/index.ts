@@ -10,18 +10,30 @@ export const WS_URL = API_URL
 
 export const WEBSOCKET_RECONNECT_DELAY = 3000;
 export const DIAGRAM_UPDATE_DEBOUNCE_MS = 200;
+// The server batches cursors at 20 Hz, so sending faster only wastes bandwidth
+export const CURSOR_SEND_INTERVAL_MS = 50;
+// Diagrams larger than this are uploaded as binary chunks of XML_CHUNK_SIZE
+export const CHUNKED_UPLOAD_THRESHOLD = 1024 * 1024;
+export const XML_CHUNK_SIZE = 256 * 1024;
+// Close code of a server restart; the reason says when to reconnect
+export const RESTART_CLOSE_CODE = 1012;
 
 export const MESSAGE_TYPES = {
   DIAGRAM_STATE: 'diagram_state',
   DIAGRAM_UPDATE: 'diagram_update',
+  DIAGRAM_ACK: 'diagram_ack',
   ELEMENT_LOCK: 'element_lock',
   ELEMENT_UNLOCK: 'element_unlock',
   ELEMENT_LOCKED: 'element_locked',
   ELEMENT_UNLOCKED: 'element_unlocked',
-  USER_LIST: 'user_list',
-  USER_JOINED: 'user_joined',
-  USER_LEFT: 'user_left',
+  PRESENCE_UPDATE: 'presence_update',
+  CURSOR: 'cursor',
+  CURSORS: 'cursors',
+  VALIDATION_RESULT: 'validation_result',
   LOCKS_UPDATE: 'locks_update',
   PING: 'ping',
   PONG: 'pong',
+  XML_UPLOAD_START: 'xml_upload_start',
+  XML_UPLOAD_PROGRESS: 'xml_upload_progress',
+  XML_UPLOAD_ERROR: 'xml_upload_error',
 } as const;
@@ -1,11 +1,21 @@
 /** Custom hook for WebSocket connection and message handling. */
 import { useEffect, useRef, useState, useCallback } from 'react';
-import { WS_URL, WEBSOCKET_RECONNECT_DELAY, MESSAGE_TYPES } from '../constants';
-import { AllWebSocketMessages, ElementLock } from '../types';
+import {
+  WS_URL,
+  WEBSOCKET_RECONNECT_DELAY,
+  MESSAGE_TYPES,
+  CHUNKED_UPLOAD_THRESHOLD,
+  XML_CHUNK_SIZE,
+  RESTART_CLOSE_CODE,
+} from '../constants';
+import { AllWebSocketMessages, DiagramStateMessage, ElementLock, RestartHint } from '../types';
+import { ChunkAssembler, encodeChunks } from '../utils/chunks';
 
 interface UseWebSocketOptions {
   diagramId: string | undefined;
   userName: string | undefined;
+  /** 'view' joins as a read-only spectator that receives throttled snapshots */
+  mode?: 'edit' | 'view';
   onMessage?: (message: AllWebSocketMessages) => void;
   onError?: (error: Event) => void;
 }
@@ -13,27 +23,52 @@ interface UseWebSocketOptions {
 interface UseWebSocketReturn {
   connected: boolean;
   sendMessage: (type: string, data?: any) => void;
+  /** Save the diagram, as binary chunks when it is too large for one message */
+  sendDiagramUpdate: (xml: string, baseVersion?: number) => void;
+  /** Share of a chunked save the server has received, while one is in flight */
+  uploadProgress: number | null;
   users: string[];
   elementLocks: Record<string, ElementLock>;
 }
 
+/** Close reason of a restart: JSON with when to retry and how to resume. */
+const parseRestartHint = (reason: string): RestartHint => {
+  try {
+    return JSON.parse(reason) as RestartHint;
+  } catch {
+    return {};
+  }
+};
+
 export const useWebSocket = ({
   diagramId,
   userName,
+  mode = 'edit',
   onMessage,
   onError,
 }: UseWebSocketOptions): UseWebSocketReturn => {
   const [connected, setConnected] = useState(false);
   const [users, setUsers] = useState<string[]>([]);
   const [elementLocks, setElementLocks] = useState<Record<string, ElementLock>>({});
+  const [uploadProgress, setUploadProgress] = useState<number | null>(null);
   const wsRef = useRef<WebSocket | null>(null);
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null);
   const reconnectAttemptsRef = useRef<number>(0);
-  const myUserNameRef = useRef<string>('');
+  const presenceVersionRef = useRef<number>(0);
   const isConnectingRef = useRef<boolean>(false);
   const isUnmountingRef = useRef<boolean>(false);
   const onMessageRef = useRef(onMessage);
   const onErrorRef = useRef(onError);
+  // diagram_state whose XML is still arriving in chunks, and messages that came after it
+  const pendingStateRef = useRef<{
+    message: DiagramStateMessage;
+    chunks: ChunkAssembler;
+    queued: AllWebSocketMessages[];
+  } | null>(null);
+  const uploadIdRef = useRef<number>(0);
+  // Last diagram version this client holds, and a resume token from a server restart
+  const versionRef = useRef<number | null>(null);
+  const resumeRef = useRef<string | null>(null);
 
   // Keep refs up to date
   useEffect(() => {
@@ -43,27 +78,71 @@ export const useWebSocket = ({
 
   const sendMessage = useCallback(
     (type: string, data?: any) => {
+      // Spectators are read-only; the server ignores anything but pings
+      if (mode === 'view' && type !== MESSAGE_TYPES.PING) return;
       if (wsRef.current?.readyState === WebSocket.OPEN) {
         wsRef.current.send(JSON.stringify({ type, data }));
       }
     },
-    []
+    [mode]
   );
 
-  const handleMessage = useCallback((event: MessageEvent) => {
-    try {
-      const message: AllWebSocketMessages = JSON.parse(event.data);
+  const sendDiagramUpdate = useCallback(
+    (xml: string, baseVersion?: number) => {
+      const ws = wsRef.current;
+      if (mode === 'view' || !ws || ws.readyState !== WebSocket.OPEN) return;
+      const body = new TextEncoder().encode(xml);
+      if (body.length <= CHUNKED_UPLOAD_THRESHOLD) {
+        ws.send(JSON.stringify({
+          type: MESSAGE_TYPES.DIAGRAM_UPDATE,
+          data: { xml, base_version: baseVersion },
+        }));
+        return;
+      }
+      const transfer = (uploadIdRef.current = uploadIdRef.current + 1);
+      ws.send(JSON.stringify({
+        type: MESSAGE_TYPES.XML_UPLOAD_START,
+        data: { transfer, size: body.length, base_version: baseVersion },
+      }));
+      encodeChunks(transfer, body, XML_CHUNK_SIZE).forEach((frame) => ws.send(frame));
+      setUploadProgress(0);
+    },
+    [mode]
+  );
 
+  const dispatchMessage = useCallback((message: AllWebSocketMessages) => {
+    try {
       switch (message.type) {
         case MESSAGE_TYPES.DIAGRAM_STATE:
+          if (message.data?.xml_transfer && message.data.xml === undefined) {
+            if (message.data.xml_transfer.size === 0) {
+              message.data.xml = '';
+            } else {
+              // Handled once the last chunk of the XML has arrived
+              pendingStateRef.current = {
+                message,
+                chunks: new ChunkAssembler(message.data.xml_transfer),
+                queued: [],
+              };
+              break;
+            }
+          }
+          versionRef.current = message.data?.version ?? null;
           if (message.data?.locks) {
             setElementLocks(message.data.locks);
           }
+          if (message.data?.users) {
+            setUsers(message.data.users);
+            presenceVersionRef.current = message.data.presence_version ?? 0;
+          }
           // Always pass to handler for XML loading and other processing
           onMessageRef.current?.(message);
           break;
 
         case MESSAGE_TYPES.DIAGRAM_UPDATE:
+          if (message.data?.version) {
+            versionRef.current = message.data.version;
+          }
           // Always pass diagram updates to handler, it will check if it's from another user
           onMessageRef.current?.(message);
           if (message.data?.locks) {
@@ -71,13 +150,24 @@ export const useWebSocket = ({
           }
           break;
 
-        case MESSAGE_TYPES.USER_LIST:
-          if (message.data?.users) {
-            setUsers(message.data.users);
-            if (!myUserNameRef.current && message.data.users.length > 0) {
-              myUserNameRef.current = message.data.users[message.data.users.length - 1];
-            }
+        case MESSAGE_TYPES.DIAGRAM_ACK:
+          versionRef.current = message.data.version;
+          onMessageRef.current?.(message);
+          break;
+
+        case MESSAGE_TYPES.PRESENCE_UPDATE:
+          // Diffs at or below the roster version from diagram_state are already applied
+          if (message.data && message.data.version > presenceVersionRef.current) {
+            const { joined, left, version } = message.data;
+            presenceVersionRef.current = version;
+            setUsers((prev) => {
+              const next = new Set(prev);
+              left.forEach((name) => next.delete(name));
+              joined.forEach((name) => next.add(name));
+              return Array.from(next).sort();
+            });
           }
+          onMessageRef.current?.(message);
           break;
 
         case MESSAGE_TYPES.ELEMENT_LOCKED:
@@ -117,10 +207,17 @@ export const useWebSocket = ({
             setElementLocks(message.data.locks);
           }
           break;
-        case MESSAGE_TYPES.USER_JOINED:
-        case MESSAGE_TYPES.USER_LEFT:
-          // Request updated user list when someone joins or leaves
-          // The backend should send user_list, but we can also request it
+
+        case MESSAGE_TYPES.XML_UPLOAD_PROGRESS:
+          if (message.data.transfer === uploadIdRef.current) {
+            const { received, size } = message.data;
+            setUploadProgress(received < size ? received / size : null);
+          }
+          break;
+
+        case MESSAGE_TYPES.XML_UPLOAD_ERROR:
+          console.error('Chunked save failed:', message.data.error);
+          setUploadProgress(null);
           onMessageRef.current?.(message);
           break;
 
@@ -128,10 +225,35 @@ export const useWebSocket = ({
           onMessageRef.current?.(message);
       }
     } catch (error) {
-      console.error('Error parsing WebSocket message:', error);
+      console.error('Error handling WebSocket message:', error);
     }
   }, []);
 
+  const handleMessage = useCallback((event: MessageEvent) => {
+    try {
+      if (event.data instanceof ArrayBuffer) {
+        const pending = pendingStateRef.current;
+        const xml = pending?.chunks.add(event.data);
+        if (pending && xml != null) {
+          pendingStateRef.current = null;
+          dispatchMessage({ ...pending.message, data: { ...pending.message.data, xml } });
+          pending.queued.forEach(dispatchMessage);
+        }
+        return;
+      }
+      const message: AllWebSocketMessages = JSON.parse(event.data);
+      if (pendingStateRef.current) {
+        // Applied in order once the state they follow is complete
+        pendingStateRef.current.queued.push(message);
+        return;
+      }
+      dispatchMessage(message);
+    } catch (error) {
+      pendingStateRef.current = null;
+      console.error('Error parsing WebSocket message:', error);
+    }
+  }, [dispatchMessage]);
+
   const connect = useCallback(() => {
     if (!diagramId || isConnectingRef.current || isUnmountingRef.current) return;
 
@@ -148,12 +270,28 @@ export const useWebSocket = ({
     isConnectingRef.current = true;
     
     try {
-      // Build WebSocket URL with optional user name
-      let wsUrl = `${WS_URL}/ws/${diagramId}`;
-      if (userName && userName.trim()) {
-        wsUrl += `?user_name=${encodeURIComponent(userName.trim())}`;
+      // Build WebSocket URL with optional user name or spectator mode
+      const params = new URLSearchParams();
+      if (mode === 'view') {
+        params.set('mode', 'view');
+      } else {
+        // Receive the initial XML as binary chunks rather than one huge message
+        params.set('chunked', '1');
+        if (userName && userName.trim()) {
+          params.set('user_name', userName.trim());
+        }
+        // After a server restart: keep our locks, and skip the XML if it is unchanged
+        if (resumeRef.current) {
+          params.set('resume', resumeRef.current);
+          resumeRef.current = null;
+        }
+        if (versionRef.current !== null) {
+          params.set('version', String(versionRef.current));
+        }
       }
-      const ws = new WebSocket(wsUrl);
+      const query = params.toString();
+      const ws = new WebSocket(`${WS_URL}/ws/${diagramId}${query ? `?${query}` : ''}`);
+      ws.binaryType = 'arraybuffer';
       wsRef.current = ws;
 
       ws.onopen = () => {
@@ -187,6 +325,8 @@ export const useWebSocket = ({
 
       ws.onclose = (event) => {
         setConnected(false);
+        setUploadProgress(null);
+        pendingStateRef.current = null;
         isConnectingRef.current = false;
         
         // Don't reconnect if unmounting or normal closure
@@ -199,10 +339,17 @@ export const useWebSocket = ({
           reconnectAttemptsRef.current += 1;
           
           // Exponential backoff with max delay of 30 seconds
-          const delay = Math.min(
+          let delay = Math.min(
             WEBSOCKET_RECONNECT_DELAY * Math.pow(2, reconnectAttemptsRef.current - 1),
             30000
           );
+          if (event.code === RESTART_CLOSE_CODE) {
+            // The server is restarting and says when to come back, spread over the room
+            const hint = parseRestartHint(event.reason);
+            resumeRef.current = hint.resume ?? null;
+            delay = hint.retry_ms ?? delay;
+            reconnectAttemptsRef.current = 0;
+          }
           
           // Only log after multiple failed attempts
           if (reconnectAttemptsRef.current > 3) {
@@ -220,7 +367,7 @@ export const useWebSocket = ({
       isConnectingRef.current = false;
       console.error('Error creating WebSocket:', error);
     }
-  }, [diagramId, userName, handleMessage]);
+  }, [diagramId, userName, mode, handleMessage]);
 
   useEffect(() => {
     if (!diagramId) return;
@@ -259,6 +406,8 @@ export const useWebSocket = ({
   return {
     connected,
     sendMessage,
+    sendDiagramUpdate,
+    uploadProgress,
     users,
     elementLocks,
   };
@@ -22,12 +22,27 @@ export interface WebSocketMessage {
   user?: string;
 }
 
+/** Announces XML that follows as binary chunks (see utils/chunks.ts) */
+export interface XmlTransfer {
+  transfer: number;
+  size: number;
+  chunks: number;
+}
+
 export interface DiagramStateMessage extends WebSocketMessage {
   type: "diagram_state";
   data: {
-    xml: string;
+    /** Absent while it is still arriving in chunks */
+    xml?: string;
+    xml_transfer?: XmlTransfer;
+    version?: number;
     locks: Record<string, ElementLock>;
     my_user_name?: string;
+    users?: string[];
+    presence_version?: number;
+    cursor_id?: number;
+    /** Set instead of the XML when the client reconnected at the current version */
+    xml_unchanged?: boolean;
   };
 }
 
@@ -35,11 +50,64 @@ export interface DiagramUpdateMessage extends WebSocketMessage {
   type: "diagram_update";
   data: {
     xml: string;
+    version?: number;
     locks: Record<string, ElementLock>;
   };
   user: string;
 }
 
+/** Close reason sent when the server drains for a restart */
+export interface RestartHint {
+  version?: number | null;
+  retry_ms?: number;
+  resume?: string;
+}
+
+/** Confirms our own update was stored as-is under the given version */
+export interface DiagramAckMessage extends WebSocketMessage {
+  type: "diagram_ack";
+  data: {
+    version: number;
+  };
+}
+
+export interface LintIssue {
+  rule: string;
+  severity: "error" | "warning";
+  element_id: string;
+  message: string;
+}
+
+export interface ValidationResult {
+  version: number;
+  issues: LintIssue[];
+  errors: number;
+  warnings: number;
+}
+
+/** Lint result for a saved version, pushed to the whole room */
+export interface ValidationResultMessage extends WebSocketMessage {
+  type: "validation_result";
+  data: ValidationResult;
+}
+
+export interface XmlUploadProgressMessage extends WebSocketMessage {
+  type: "xml_upload_progress";
+  data: {
+    transfer: number;
+    received: number;
+    size: number;
+  };
+}
+
+export interface XmlUploadErrorMessage extends WebSocketMessage {
+  type: "xml_upload_error";
+  data: {
+    transfer: number | null;
+    error: string;
+  };
+}
+
 export interface ElementLockedMessage extends WebSocketMessage {
   type: "element_locked";
   data: {
@@ -56,43 +124,52 @@ export interface ElementUnlockedMessage extends WebSocketMessage {
   };
 }
 
-export interface UserListMessage extends WebSocketMessage {
-  type: "user_list";
+export interface PresenceUpdateMessage extends WebSocketMessage {
+  type: "presence_update";
   data: {
-    users: string[];
+    joined: string[];
+    left: string[];
+    version: number;
   };
 }
 
-export interface UserJoinedMessage extends WebSocketMessage {
-  type: "user_joined";
+export interface LocksUpdateMessage extends WebSocketMessage {
+  type: "locks_update";
   data: {
-    user_name: string;
+    locks: Record<string, ElementLock>;
   };
 }
 
-export interface UserLeftMessage extends WebSocketMessage {
-  type: "user_left";
+/** [slot, user_name, x, y] optionally followed by the viewport x, y, width, height */
+export type CursorEntry = [number, string, number, number, ...number[]];
+
+export interface CursorsMessage extends WebSocketMessage {
+  type: "cursors";
   data: {
-    user_name: string;
+    seq: number;
+    cursors: CursorEntry[];
+    gone: number[];
   };
 }
 
-export interface LocksUpdateMessage extends WebSocketMessage {
-  type: "locks_update";
-  data: {
-    locks: Record<string, ElementLock>;
-  };
+export interface RemoteCursor {
+  userName: string;
+  x: number;
+  y: number;
 }
 
 export type AllWebSocketMessages =
   | DiagramStateMessage
   | DiagramUpdateMessage
+  | DiagramAckMessage
   | ElementLockedMessage
   | ElementUnlockedMessage
-  | UserListMessage
-  | UserJoinedMessage
-  | UserLeftMessage
-  | LocksUpdateMessage;
+  | PresenceUpdateMessage
+  | CursorsMessage
+  | ValidationResultMessage
+  | LocksUpdateMessage
+  | XmlUploadProgressMessage
+  | XmlUploadErrorMessage;
 
 /** BPMN-js EventBus types */
 export interface EventBus {
@@ -126,7 +203,16 @@ export interface ElementRegistry {
 }
 
 /** BPMN-js Canvas types */
+export interface Viewbox {
+  x: number;
+  y: number;
+  width: number;
+  height: number;
+  scale: number;
+}
+
 export interface Canvas {
+  viewbox(): Viewbox;
   addMarker(elementId: string, marker: string): void;
   removeMarker(elementId: string, marker: string): void;
   hasMarker(elementId: string, marker: string): boolean;
@@ -1,6 +1,6 @@
 /** API utility functions. */
 import { API_URL } from '../constants';
-import { Diagram, DiagramDetail } from '../types';
+import { Diagram, DiagramDetail, ValidationResult } from '../types';
 
 export const api = {
   /**
@@ -29,6 +29,24 @@ export const api = {
     return response.json();
   },
 
+  /**
+   * URL of a diagram's server-rendered SVG preview.
+   */
+  thumbnailUrl(diagramId: string): string {
+    return `${API_URL}/api/diagrams/${diagramId}/thumbnail.svg`;
+  },
+
+  /**
+   * Lint issues of the diagram's current version.
+   */
+  async getIssues(diagramId: string): Promise<ValidationResult> {
+    const response = await fetch(`${API_URL}/api/diagrams/${diagramId}/issues`);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch issues: ${response.statusText}`);
+    }
+    return response.json();
+  },
+
   /**
    * Create a new diagram.
    */
@@ -0,0 +1,53 @@
+/** Chunked XML transfer: binary frames of [transfer id, sequence, payload]. */
+import { XmlTransfer } from '../types';
+
+const HEADER_SIZE = 8;
+
+/** Split an encoded body into frames, each with an 8-byte big-endian header. */
+export const encodeChunks = (
+  transfer: number,
+  body: Uint8Array,
+  chunkSize: number
+): ArrayBuffer[] => {
+  const frames: ArrayBuffer[] = [];
+  for (let offset = 0, sequence = 0; offset < body.length; offset += chunkSize, sequence++) {
+    const payload = body.subarray(offset, offset + chunkSize);
+    const frame = new Uint8Array(HEADER_SIZE + payload.length);
+    const header = new DataView(frame.buffer);
+    header.setUint32(0, transfer);
+    header.setUint32(4, sequence);
+    frame.set(payload, HEADER_SIZE);
+    frames.push(frame.buffer);
+  }
+  return frames;
+};
+
+/**
+ * Reassembles one announced transfer into a buffer of its announced size.
+ * Chunks arrive in order on a WebSocket, so a gap means the transfer is broken.
+ */
+export class ChunkAssembler {
+  private readonly body: Uint8Array;
+  private received = 0;
+  private nextSequence = 0;
+
+  constructor(readonly transfer: XmlTransfer) {
+    this.body = new Uint8Array(transfer.size);
+  }
+
+  /** Add a frame; returns the decoded text once the last chunk has arrived. */
+  add(frame: ArrayBuffer): string | null {
+    const header = new DataView(frame, 0, HEADER_SIZE);
+    const transfer = header.getUint32(0);
+    const sequence = header.getUint32(4);
+    if (transfer !== this.transfer.transfer) return null;
+    const payload = new Uint8Array(frame, HEADER_SIZE);
+    if (sequence !== this.nextSequence || this.received + payload.length > this.transfer.size) {
+      throw new Error(`Chunk ${sequence} of transfer ${transfer} is out of order`);
+    }
+    this.body.set(payload, this.received);
+    this.received += payload.length;
+    this.nextSequence += 1;
+    return this.received === this.transfer.size ? new TextDecoder().decode(this.body) : null;
+  }
+}